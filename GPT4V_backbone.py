@@ -1,20 +1,20 @@
+import asyncio
 import base64
 import re
 import time
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import AsyncIterator, Dict, Iterable, List, Union
 
-import requests
-import tiktoken
-from omegaconf import OmegaConf
-
-config_path = "configs/config.yaml"
-config = OmegaConf.load(config_path)
-openai_token_file = config.openai_token_file
-
-with open(openai_token_file, "r") as f:
-    openai_token = f.read()
+import httpx
 
+from blob_store import BlobStore, is_blob_ref
+from coalescing import RequestCoalescer
+from image_encoding import ImageEncoder, get_image_encoder
+from preflight import TPMScheduler
+from rate_limit import AdaptiveLimiter
+from response_cache import ResponseCache
+from streaming import StreamAccumulator, StreamValidator, parse_sse_line
+from transport import HTTPTransport, get_transport
 
 class GPT4V:
     def __init__(
@@ -26,6 +26,10 @@ class GPT4V:
             add_args: dict = {},
             wait_time=20,
             attempts=10,
+            cache: ResponseCache | None = None,
+            transport: HTTPTransport | None = None,
+            image_encoder: ImageEncoder | None = None,
+            blob_store: BlobStore | None = None,
     ) -> None:
 
         self.headers = {
@@ -37,6 +41,14 @@ class GPT4V:
         self.system_prompt = system_prompt
         self.wait_time = wait_time
         self.attempts = attempts
+        self.cache = cache
+        self.coalescer = RequestCoalescer()
+        self.transport = transport if transport is not None else get_transport()
+        self.image_encoder = (
+            image_encoder if image_encoder is not None else get_image_encoder()
+        )
+        # resolves "sha256:..." image references of result files
+        self.blob_store = blob_store
         if do_logprobs:
             self.construct_logit_args(tokens_highlighted)
         else:
@@ -51,6 +63,8 @@ class GPT4V:
             self, tokens_highlighted: List[str] = [], logit_bias_value: float = 30.0
     ) -> None:
 
+        import tiktoken
+
         tokenizer = tiktoken.encoding_for_model(self.model_name)
 
         options_tok_ids = dict()
@@ -78,13 +92,27 @@ class GPT4V:
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode("utf-8")
 
-    def encode_images(self, images: List[str | Path]) -> List[str]:
+    def encode_images(
+            self, images: List[str | Path], image_detail: str = "auto"
+    ) -> List[str]:
+        """
+        Returns data URLs of the images, encoded by the memoized image encoder.
+        Blob references ("sha256:...") are read from self.blob_store.
+        """
         # Important!
         # If you pass not Path object, but string, it will be read as encoded image
         encoded_images = []
         for image in images:
             if isinstance(image, Path):
-                image_encoded = self.encode_image(image)
+                image_encoded = self.image_encoder.encode_path(image, image_detail)
+            elif image.startswith("data:"):
+                image_encoded = image
+            elif is_blob_ref(image):
+                if self.blob_store is None:
+                    raise ValueError(f"Image {image} is a blob reference, GPT4V has no blob_store")
+                image_encoded = self.image_encoder.encode_path(
+                    self.blob_store.path(image), image_detail
+                )
             else:
                 if "/" in image[:10]:
                     # TODO: Maybe there it will be simpler to check if
@@ -92,30 +120,29 @@ class GPT4V:
                     print(
                         f"Note, you passed string object for the image. It would be considered as encoded image, not path!\nFirst 10 symbols of the image: {image[:10]}"
                     )
-                image_encoded = image
+                image_encoded = self.image_encoder.encode_bytes(
+                    base64.b64decode(image), image_detail
+                )
 
             encoded_images.append(image_encoded)
 
         return encoded_images
 
-    def ask(
+    def build_payload(
             self,
             request: str,
-            system_prompt: str | None = None,
-            images: List[str | Path] = [],  # TODO in not sure that it should have default value
+            system_prompt: str,
+            images: List[str | Path] = [],
             image_detail: str = "auto",
+            n: int = 1,
     ) -> dict:
 
-        # TODO: by design should it be overwriteble on the fly? Or maybe it is better always use self.system_prompt
-        if system_prompt is not None:
-            self.system_prompt = system_prompt
-
-        encoded_images = self.encode_images(images)
+        encoded_images = self.encode_images(images, image_detail)
 
         messages = [
             {
                 "role": "system",
-                "content": [{"type": "text", "text": self.system_prompt}],
+                "content": [{"type": "text", "text": system_prompt}],
             }
         ]
         content = [{"type": "text", "text": request}]
@@ -124,7 +151,7 @@ class GPT4V:
             content_image = {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{encoded_image}",
+                    "url": encoded_image,
                     "detail": image_detail,
                 },
             }
@@ -134,10 +161,195 @@ class GPT4V:
         payload = {"model": self.model_name, "messages": messages}
 
         payload.update(self.args)
+        if n > 1:
+            # several completions share one upload of the images
+            payload["n"] = n
+
+        return payload
+
+    def ask(
+            self,
+            request: str,
+            system_prompt: str | None = None,
+            images: List[str | Path] = [],  # TODO in not sure that it should have default value
+            image_detail: str = "auto",
+            n: int = 1,
+    ) -> dict:
+        """
+        Identical requests made concurrently from several threads are sent only once
+        """
+
+        # the instance is shared between threads, so a per-call prompt does not replace self.system_prompt
+        payload = self.build_payload(
+            request=request,
+            system_prompt=system_prompt or self.system_prompt,
+            images=images,
+            image_detail=image_detail,
+            n=n,
+        )
+
+        cached = self._get_cached(payload)
+        if cached is not None:
+            return cached
+
+        return self.coalescer.run(
+            ResponseCache.make_key(payload), lambda: self._post(payload)
+        )
+
+    def _post(self, payload: dict) -> dict:
+        # timeouts and connection errors are returned like API errors, so callers retry them
+        try:
+            response = self.transport.client.post(
+                self.model_url, headers=self.headers, json=payload
+            )
+            response = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            return {"error": {"message": f"{type(e).__name__}: {e}"}}
+        self._put_cached(payload, response)
+
+        return response
+
+    def sample(
+            self,
+            request: str,
+            k: int,
+            system_prompt: str | None = None,
+            images: List[str | Path] = [],
+            image_detail: str = "auto",
+    ) -> List[Dict]:
+        """
+        k completions of the same request in a single call (n=k), so the images are sent once.
+        Returns k processed responses with "sample_index", empty list if all attempts failed.
+        """
+
+        for attempt in range(self.attempts):
+            response = self.ask(
+                request=request,
+                system_prompt=system_prompt,
+                images=images,
+                image_detail=image_detail,
+                n=k,
+            )
+            if "error" not in response:
+                return self.fan_out(response)
+
+            print(response["error"]["message"])
+            time.sleep(self.wait_time)
+
+        return []
+
+    def ask_stream(
+            self,
+            request: str,
+            system_prompt: str | None = None,
+            images: List[str | Path] = [],
+            image_detail: str = "auto",
+            validator: StreamValidator | None = None,
+    ) -> dict:
+        """
+        Same as ask, but consumes the response as a stream of server-sent events.
+        If validator reports a format failure, the stream is aborted and an error response is returned.
+        Response has "stream_metrics" with time-to-first-token and tokens/sec.
+        """
+
+        payload = self.build_payload(
+            request=request,
+            system_prompt=system_prompt or self.system_prompt,
+            images=images,
+            image_detail=image_detail,
+        )
+
+        cached = self._get_cached(payload)
+        if cached is not None:
+            return cached
+
+        accumulator = StreamAccumulator(validator)
+        aborted = False
+        with self.transport.client.stream(
+            "POST", self.model_url, headers=self.headers, json=self._stream_payload(payload)
+        ) as http_response:
+            if http_response.status_code != 200:
+                http_response.read()
+                return http_response.json()
+            for line in http_response.iter_lines():
+                event = parse_sse_line(line)
+                if event is not None and accumulator.feed(event) is not None:
+                    # leaving the context closes the connection, so the rest is not generated
+                    aborted = True
+                    break
+        accumulator.finish(aborted)
+        response = accumulator.response()
+        self._put_cached(payload, response)
+
+        return response
+
+    @staticmethod
+    def _stream_payload(payload: dict) -> dict:
+        return {**payload, "stream": True, "stream_options": {"include_usage": True}}
+
+    async def _post_stream_async(
+            self,
+            payload: dict,
+            validator: StreamValidator | None,
+            timeout: float | None = None,
+    ) -> tuple:
+
+        accumulator = StreamAccumulator(validator)
+        aborted = False
+        async with self.transport.async_client.stream(
+            "POST",
+            self.model_url,
+            headers=self.headers,
+            json=self._stream_payload(payload),
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+        ) as http_response:
+            status_code, headers = http_response.status_code, http_response.headers
+            if status_code != 200:
+                await http_response.aread()
+                return http_response.json(), status_code, headers
+            async for line in http_response.aiter_lines():
+                event = parse_sse_line(line)
+                if event is not None and accumulator.feed(event) is not None:
+                    aborted = True
+                    break
+        accumulator.finish(aborted)
+
+        return accumulator.response(), status_code, headers
+
+    def _get_cached(self, payload: dict) -> dict | None:
+        if self.cache is None:
+            return None
 
-        response = requests.post(self.model_url, headers=self.headers, json=payload)
+        return self.cache.get(ResponseCache.make_key(payload))
 
-        return response.json()
+    def _put_cached(self, payload: dict, response: dict) -> None:
+        # errors are not cached, so they are retried on the next run
+        if self.cache is not None and "error" not in response:
+            self.cache.put(ResponseCache.make_key(payload), response)
+
+    @staticmethod
+    def process_response(response: dict) -> dict:
+        response["response"] = response["choices"][0]["message"]["content"]
+        response["choices"][0]["message"]["content"] = "MOVED to response key"
+
+        return response
+
+    @classmethod
+    def fan_out(cls, response: dict, dp_id: int | str | None = None) -> List[Dict]:
+        """
+        Split a response with several choices into processed single-choice responses
+        """
+
+        responses = []
+        for choice in response["choices"]:
+            choice = {**choice, "message": {**choice["message"]}}
+            single = cls.process_response({**response, "choices": [choice]})
+            single["sample_index"] = choice.get("index", len(responses))
+            if dp_id is not None:
+                single["id"] = dp_id
+            responses.append(single)
+
+        return responses
 
     def make_request(
             self,
@@ -147,6 +359,11 @@ class GPT4V:
             image_detail: str = "auto",
     ) -> Union[Dict, None]:
 
+        """
+        Returns the processed response, None if all attempts failed.
+        Rate limit errors with a retry time are waited out and not counted as attempts
+        """
+
         error_counts = 0
         while error_counts < self.attempts:
             response = self.ask(
@@ -157,27 +374,217 @@ class GPT4V:
             )
 
             if "error" not in response.keys():
-                response["response"] = response["choices"][0]["message"]["content"]
-                response["choices"][0]["message"]["content"] = "MOVED to response key"
-                break
+                return self.process_response(response)
+
+            message = response["error"]["message"]
+            seconds_to_wait = re.search(r"Please try again in (\d+)s\.", message)
+            if seconds_to_wait is not None:
+                wait_time = 1.5 * int(seconds_to_wait.group(1))
+                print(f"Waiting {wait_time} s")
             else:
-                message = response["error"]["message"]
-                seconds_to_wait = re.search(r"Please try again in (\d+)s\.", message)
-                if seconds_to_wait is not None:
-                    wait_time = 1.5 * int(seconds_to_wait.group(1))
-                    print(f"Waiting {wait_time} s")
-                    time.sleep(wait_time)
+                wait_time = self.wait_time
+                print(
+                    f"Cannot parse retry time from error message. Will wait for {wait_time} seconds"
+                )
+                print(message)
+                error_counts += 1
+            time.sleep(wait_time)
+
+        return None
+
+    def make_request_stream(
+            self,
+            request: str,
+            system_prompt: str | None = None,
+            images: List[str | Path] = [],
+            image_detail: str = "auto",
+            validator: StreamValidator | None = None,
+    ) -> Union[Dict, None]:
+        """
+        make_request over a stream. Completions failing the validator are aborted and retried at once.
+        Returns None if all attempts failed.
+        """
+
+        for attempt in range(self.attempts):
+            response = self.ask_stream(
+                request=request,
+                system_prompt=system_prompt,
+                images=images,
+                image_detail=image_detail,
+                validator=validator,
+            )
+            if "error" not in response:
+                return self.process_response(response)
+
+            print(response["error"]["message"])
+            if response["error"].get("type") != "stream_format":
+                time.sleep(self.wait_time)
+
+        return None
+
+    async def _make_request_async(
+            self,
+            limiter: AdaptiveLimiter,
+            item: Dict,
+            timeout: float | None = None,
+            scheduler: TPMScheduler | None = None,
+            validator: StreamValidator | None = None,
+    ) -> List[Dict]:
+
+        n = item.get("n", 1)
+        if n > 1 and validator is not None:
+            raise ValueError("Streaming supports only a single completion per request")
+
+        # reading and encoding images would block the event loop
+        payload = await asyncio.to_thread(
+            self.build_payload,
+            request=item["request"],
+            system_prompt=item.get("system_prompt") or self.system_prompt,
+            images=item.get("images", []),
+            image_detail=item.get("image_detail", "auto"),
+            n=n,
+        )
+        response = self._get_cached(payload)
+        if response is None:
+            # identical items in flight (e.g. several sampling passes) wait for one upstream call
+            response = await self.coalescer.run_async(
+                ResponseCache.make_key(payload),
+                lambda: self._send_async(
+                    limiter, payload, item, timeout, scheduler, validator
+                ),
+            )
+
+        if "error" in response:
+            return [{"id": item["id"], "error": response["error"]}]
+        if n > 1:
+            return self.fan_out(response, item["id"])
+        response = self.process_response(response)
+        response["id"] = item["id"]
+        return [response]
+
+    async def _send_async(
+            self,
+            limiter: AdaptiveLimiter,
+            payload: dict,
+            item: Dict,
+            timeout: float | None = None,
+            scheduler: TPMScheduler | None = None,
+            validator: StreamValidator | None = None,
+    ) -> Dict:
+
+        response = {"error": {"message": "No attempts were made"}}
+        for attempt in range(self.attempts):
+            if scheduler is not None:
+                await scheduler.acquire(item.get("tokens", 0))
+            await limiter.acquire()
+            status_code, headers = None, {}
+            try:
+                if validator is None:
+                    http_response = await self.transport.async_client.post(
+                        self.model_url,
+                        headers=self.headers,
+                        json=payload,
+                        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                    )
+                    status_code, headers = http_response.status_code, http_response.headers
+                    response = http_response.json()
                 else:
-                    # TODO: Here will be bug because wait_time will not be defined.
-                    #  Please rewrite so we get waite time first and do wait after.
-                    #  Also error counting happening only in one branch of if-else
-                    print(
-                        f"Cannot parse retry time from error message. Will wait for {wait_time} seconds"
+                    response, status_code, headers = await self._post_stream_async(
+                        payload, validator, timeout
                     )
-                    print(message)
-                    response = None
-                    time.sleep(20)
-                    error_counts += 1
+                self._put_cached(payload, response)
+            except (httpx.HTTPError, ValueError) as e:
+                response = {"error": {"message": f"{type(e).__name__}: {e}"}}
+            finally:
+                await limiter.release(status_code, headers)
+
+            if "error" not in response:
+                return response
+
+            # rate limit errors are handled by the limiter pause, others get a short backoff
+            if status_code != 429:
+                print(f"Request for dp {item['id']} failed: {response['error']['message']}")
+                # aborted streams are retried at once
+                if response["error"].get("type") != "stream_format":
+                    await asyncio.sleep(min(self.wait_time, 2**attempt))
 
-        # TODO: if we have all errors there will be no error and here wil be a bug.
         return response
+
+    async def make_requests_many(
+            self,
+            requests: Iterable[Dict],
+            max_concurrency: int = 8,
+            timeout: float | None = None,
+            scheduler: TPMScheduler | None = None,
+            validator: StreamValidator | None = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Send many requests concurrently, keeping up to max_concurrency of them in flight.
+        Each request is a dict with "id", "request" and optional "system_prompt", "images", "image_detail".
+        Concurrency adapts to the x-ratelimit-* headers and 429 responses.
+        Yields processed responses in completion order with "id" attached.
+        Failed requests are yielded as {"id": ..., "error": ...}.
+        timeout overrides the transport read timeout for each request.
+        With scheduler, requests are paced by their item["tokens"] estimate (see preflight.py).
+        With validator, responses are streamed and aborted early on format failures (see streaming.py).
+        Items with "n" > 1 get n completions in one call, yielded separately with "sample_index".
+        Identical items in flight are sent once and the response is yielded for each of them.
+        """
+
+        limiter = AdaptiveLimiter(
+            max_concurrency=max_concurrency, default_wait=self.wait_time
+        )
+        items = iter(requests)
+        # responses of finished items, an exception of a failed worker, None when a worker is done
+        results = asyncio.Queue()
+
+        async def worker() -> None:
+            # max_concurrency workers take items one by one, so only the payloads
+            # of the items in progress are built and held in memory
+            try:
+                for item in items:
+                    await results.put(
+                        await self._make_request_async(limiter, item, timeout, scheduler, validator)
+                    )
+            except Exception as e:
+                await results.put(e)
+            finally:
+                results.put_nowait(None)
+
+        # the async client is shared with other callers in this loop and closed by the last one
+        async with self.transport.async_session():
+            workers = [asyncio.create_task(worker()) for _ in range(max_concurrency)]
+            try:
+                running = len(workers)
+                while running > 0:
+                    result = await results.get()
+                    if result is None:
+                        running -= 1
+                    elif isinstance(result, Exception):
+                        raise result
+                    else:
+                        for response in result:
+                            yield response
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    async def sample_many(
+            self,
+            requests: Iterable[Dict],
+            k: int,
+            max_concurrency: int = 8,
+            timeout: float | None = None,
+            scheduler: TPMScheduler | None = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        k completions per item with one request each (n=k) instead of k separate requests.
+        Yields k responses per item with the item "id" and "sample_index".
+        """
+
+        items = [{**item, "n": k} for item in requests]
+        async for response in self.make_requests_many(
+            items, max_concurrency=max_concurrency, timeout=timeout, scheduler=scheduler
+        ):
+            yield response
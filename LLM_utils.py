@@ -6,9 +6,12 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict
 
-import tiktoken
 from omegaconf import DictConfig, OmegaConf
 
+from blob_store import BlobStore, is_blob_ref
+from plot_dataset import DataPoint
+from result_store import ResultStore
+
 
 @dataclass
 class PipelineParameters:
@@ -19,13 +22,15 @@ class PipelineParameters:
     # TODO: lets avoid storing the token in data structure directly
     openai_token: str
     instructs: dict
-    existing_ids: list
+    # results written so far, resume checks are O(1) lookups
+    results: ResultStore
 
 
-def prepare_pipeline(config_path, out_filename, prompt_file_path):
+def prepare_pipeline(config: DictConfig | str | Path, out_filename, prompt_file_path):
     random.seed(42)
 
-    config = OmegaConf.load(config_path)
+    if not isinstance(config, DictConfig):
+        config = OmegaConf.load(config)
     openai_token_file = config.openai_token_file
     dataset_folder = Path(config.dataset_final)
     out_folder = Path(config.out_folder)
@@ -40,14 +45,6 @@ def prepare_pipeline(config_path, out_filename, prompt_file_path):
         instructs = f.read()
         instructs = json.loads(instructs)
 
-    existing_ids = []
-    if os.path.exists(output_file):
-        with open(output_file, "r") as file:
-            for line in file:
-                json_line = json.loads(line)
-                if "id" in json_line:  # to ensure that the key exists
-                    existing_ids.append(json_line["id"])
-
     return PipelineParameters(
         config,
         dataset_folder,
@@ -55,27 +52,23 @@ def prepare_pipeline(config_path, out_filename, prompt_file_path):
         out_folder,
         openai_token,
         instructs,
-        existing_ids,
+        ResultStore(output_file),
     )
 
 
 def read_task_responses(response_file):
     response_dict = {}
-    with open(response_file, "r") as file:
-        for line in file:
-            entry = json.loads(line)
-            entry_id = entry.get("id")
-            if entry_id is not None:
-                message = entry["choices"][0]["message"]["content"]
-                if message:
-                    if message.startswith("TASK:"):
-                        message = message[5:].lstrip("\n ").replace("**", "")
-                    response_dict[entry_id] = message
-                if entry["probs"]:
-                    logprobs = entry["choices"][0]["logprobs"]["content"][0][
-                        "top_logprobs"
-                    ]
-                    response_dict[entry_id] = {"message": message, "logprobs": logprobs}
+    with ResultStore(response_file) as results:
+        for entry_id, entry in results.items():
+            # GPT4V.make_request moves the message content to the "response" key
+            message = entry.get("response", entry["choices"][0]["message"]["content"])
+            if message:
+                if message.startswith("TASK:"):
+                    message = message[5:].lstrip("\n ").replace("**", "")
+                response_dict[entry_id] = message
+            if entry.get("probs"):
+                logprobs = entry["choices"][0]["logprobs"]["content"][0]["top_logprobs"]
+                response_dict[entry_id] = {"message": message, "logprobs": logprobs}
 
     return response_dict
 
@@ -94,13 +87,24 @@ def generate_task_request(code: str, df_summary: str, instructs: Dict[str, str])
     return request
 
 
-def generate_benchmark_request(dp_folder: Path, instructs: dict, result: dict):
+def generate_benchmark_request(
+    dp: DataPoint | Path, instructs: dict, result: dict, store: BlobStore | None = None
+):
     "Request to ask model to write a code for plotting. Add dataframe description"
 
     # df_descr_file = dp_folder / "data_descr.txt"
-    plot_files = glob.glob(os.path.join(str(dp_folder), "*.png"))
+    if isinstance(dp, Path):
+        plot_files = sorted(glob.glob(os.path.join(str(dp), "*.png")))
+    else:
+        # file list of the dataset manifest
+        plot_files = dp.image_paths
     plot_file_gt = Path(plot_files[0])
     plot_gen = result["images"][0]
+    if is_blob_ref(plot_gen):
+        # externalized result image, GPT4V encodes the blob file like any image path
+        if store is None:
+            raise ValueError(f"Result image {plot_gen} is a blob reference, pass its store")
+        plot_gen = store.path(plot_gen)
     task = instructs["request judge"]
     plots = [plot_gen, plot_file_gt]
 
@@ -108,6 +112,8 @@ def generate_benchmark_request(dp_folder: Path, instructs: dict, result: dict):
 
 
 def construct_logit_args(options, model_name="gpt-4-turbo"):
+    import tiktoken
+
     tokenizer = tiktoken.encoding_for_model(model_name)
 
     options = [str(i) for i in list(range(0, 11))]
@@ -0,0 +1,131 @@
+"""
+Group commit of pipeline results: producers put entries to a queue and a background thread
+appends them to the result store in batches, so writing never blocks request handling.
+"""
+
+import queue
+import threading
+import time
+from typing import Dict
+
+from result_store import ResultStore
+
+FSYNC_POLICIES = ("always", "batch", "never")
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """
+    Entries are written when flush_size of them are queued or flush_interval seconds passed.
+    fsync policy:
+        "always" - every entry is written and fsynced on its own
+        "batch" - one write and fsync per batch
+        "never" - one write per batch, syncing is left to the OS
+    """
+
+    def __init__(
+        self,
+        store: ResultStore,
+        flush_interval: float = 1.0,
+        flush_size: int = 64,
+        fsync: str = "batch",
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync should be one of {FSYNC_POLICIES}, got {fsync}")
+
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync
+
+        self.written = 0
+        self.batches = 0
+        self._error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, entry: Dict) -> None:
+        if self._error is not None:
+            raise RuntimeError("Background writer failed") from self._error
+        self._queue.put(entry)
+
+    def _collect(self) -> tuple:
+        """
+        Wait for the first entry, then gather more until the batch is full or the interval passed
+        """
+
+        batch = [self._queue.get()]
+        if batch[0] is _STOP:
+            return [], True
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+
+        return batch, False
+
+    def _write(self, batch: list) -> None:
+        if self.fsync == "always":
+            for entry in batch:
+                self.store.append_many([entry], fsync=True)
+        else:
+            self.store.append_many(batch, fsync=self.fsync == "batch")
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            try:
+                if batch and self._error is None:
+                    self._write(batch)
+            except Exception as e:
+                # reported to producers on the next put and on close
+                self._error = e
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """
+        Block until all queued entries are written
+        """
+
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._thread.join()
+        self.store.save_index()
+        if self._error is not None:
+            raise RuntimeError("Background writer failed") from self._error
+
+    def stats(self) -> Dict:
+        return {"written": self.written, "batches": self.batches}
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def writer_from_config(store: ResultStore, config) -> BackgroundWriter:
+    return BackgroundWriter(
+        store,
+        flush_interval=config.get("writer_flush_interval", 1.0),
+        flush_size=config.get("writer_flush_size", 64),
+        fsync=config.get("writer_fsync", "batch"),
+    )
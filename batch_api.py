@@ -0,0 +1,277 @@
+"""
+Submission of GPT4V requests through the OpenAI Batch API.
+Batch requests are half the price and do not count against per-minute rate limits,
+which fits offline steps like task generation and judging.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from GPT4V_backbone import GPT4V
+from result_store import ResultStore
+from transport import HTTPTransport, get_transport
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Batch API limits of one input file
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_BYTES = 200 * 10**6
+
+
+def _batch_lines(gpt4v: GPT4V, items: Iterable[Dict]) -> Iterator[Tuple[str, object, bytes]]:
+    """
+    (custom_id, datapoint id, JSONL line) of the payloads that GPT4V.ask would send
+    """
+
+    for item in items:
+        payload = gpt4v.build_payload(
+            request=item["request"],
+            system_prompt=item.get("system_prompt") or gpt4v.system_prompt,
+            images=item.get("images", []),
+            image_detail=item.get("image_detail", "auto"),
+        )
+        batch_line = {
+            "custom_id": str(item["id"]),
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": payload,
+        }
+        yield str(item["id"]), item["id"], (json.dumps(batch_line) + "\n").encode()
+
+
+def write_batch_file(gpt4v: GPT4V, items: Iterable[Dict], batch_file: str | Path) -> Dict:
+    """
+    Write payloads that GPT4V.ask would send to the batch JSONL.
+    Items have the same layout as for GPT4V.make_requests_many.
+    Returns mapping custom_id -> datapoint id.
+    """
+
+    id_map = {}
+    with open(batch_file, "wb") as f:
+        for custom_id, dp_id, line in _batch_lines(gpt4v, items):
+            f.write(line)
+            id_map[custom_id] = dp_id
+
+    return id_map
+
+
+def write_batch_files(
+    gpt4v: GPT4V,
+    items: Iterable[Dict],
+    folder: str | Path,
+    max_requests: int = MAX_BATCH_REQUESTS,
+    max_bytes: int = MAX_BATCH_BYTES,
+) -> List[Dict]:
+    """
+    Write payloads to batch_input_<i>.jsonl files in folder, each within the request
+    and size limits of one batch. Returns {"file", "id_map"} of every file
+    """
+
+    folder = Path(folder)
+    files = []
+    f, size = None, 0
+    try:
+        for custom_id, dp_id, line in _batch_lines(gpt4v, items):
+            if len(line) > max_bytes:
+                raise ValueError(f"Request of dp {dp_id} is larger than {max_bytes} bytes")
+            if f is None or len(files[-1]["id_map"]) >= max_requests or size + len(line) > max_bytes:
+                if f is not None:
+                    f.close()
+                files.append({"file": f"batch_input_{len(files)}.jsonl", "id_map": {}})
+                f, size = open(folder / files[-1]["file"], "wb"), 0
+            f.write(line)
+            size += len(line)
+            files[-1]["id_map"][custom_id] = dp_id
+    finally:
+        if f is not None:
+            f.close()
+
+    return files
+
+
+class BatchClient:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.openai.com/v1",
+        transport: HTTPTransport | None = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.transport = transport if transport is not None else get_transport()
+
+    def _request(self, method: str, path: str, **kwargs):
+        response = self.transport.client.request(
+            method, self.base_url + path, headers=self.headers, **kwargs
+        )
+        response.raise_for_status()
+        return response
+
+    def upload(self, batch_file: str | Path) -> str:
+        with open(batch_file, "rb") as f:
+            files = {"file": (Path(batch_file).name, f, "application/jsonl")}
+            response = self._request(
+                "POST", "/files", data={"purpose": "batch"}, files=files
+            )
+        return response.json()["id"]
+
+    def create(self, input_file_id: str, metadata: Dict | None = None) -> Dict:
+        body = {
+            "input_file_id": input_file_id,
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": "24h",
+        }
+        if metadata is not None:
+            body["metadata"] = metadata
+        return self._request("POST", "/batches", json=body).json()
+
+    def retrieve(self, batch_id: str) -> Dict:
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def download(self, file_id: str) -> str:
+        return self._request("GET", f"/files/{file_id}/content").text
+
+    def wait(
+        self, batch_id: str, poll_interval: float = 60, timeout: float | None = None
+    ) -> Dict:
+        start = time.monotonic()
+        while True:
+            batch = self.retrieve(batch_id)
+            if batch["status"] in FINAL_STATUSES:
+                return batch
+
+            counts = batch.get("request_counts", {})
+            print(
+                f"Batch {batch_id}: {batch['status']}, "
+                f"{counts.get('completed', 0)}/{counts.get('total', '?')} done"
+            )
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError(f"Batch {batch_id} is not finished after {timeout} s")
+            time.sleep(poll_interval)
+
+
+def ingest_batch_results(
+    content: str, results: ResultStore, id_map: Dict, probs: bool = False
+) -> Tuple[int, List]:
+    """
+    Append successful batch results to results in the same layout as GPT4V.make_request,
+    so read_task_responses can consume them. Returns number of ingested responses and failed ids.
+    """
+
+    ingested = 0
+    failed_ids = []
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        custom_id = result["custom_id"]
+        dp_id = id_map.get(custom_id, custom_id)
+
+        response = result.get("response") or {}
+        body = response.get("body")
+        if result.get("error") or response.get("status_code") != 200 or not body:
+            failed_ids.append(dp_id)
+            continue
+
+        body = GPT4V.process_response(body)
+        body["id"] = dp_id
+        body["probs"] = probs
+        results.upsert(body)
+        ingested += 1
+
+    return ingested, failed_ids
+
+
+def _save_state(state: Dict, state_file: Path) -> None:
+    temp_path = state_file.with_name(state_file.name + ".tmp")
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_file)
+
+
+def _ingest_batch(
+    batch: Dict, id_map: Dict, results: ResultStore, client: BatchClient, probs: bool
+) -> List:
+    # expired and cancelled batches still have output files with the finished requests
+    failed_ids = []
+    if batch.get("output_file_id"):
+        content = client.download(batch["output_file_id"])
+        ingested, failed_ids = ingest_batch_results(content, results, id_map, probs=probs)
+        print(f"Ingested {ingested} responses from batch {batch['id']}")
+    if batch.get("error_file_id"):
+        for line in client.download(batch["error_file_id"]).splitlines():
+            if line.strip():
+                custom_id = json.loads(line)["custom_id"]
+                failed_ids.append(id_map.get(custom_id, custom_id))
+
+    return failed_ids
+
+
+def run_batch(
+    gpt4v: GPT4V,
+    items: List[Dict],
+    results: ResultStore,
+    client: BatchClient,
+    work_folder: str | Path,
+    poll_interval: float = 60,
+    max_requests: int = MAX_BATCH_REQUESTS,
+    max_bytes: int = MAX_BATCH_BYTES,
+) -> List:
+    """
+    Submit items as batches within the Batch API limits (max_requests and max_bytes per input file),
+    wait for them and ingest the results into the result store.
+    Input files and submitted batch ids are stored in work_folder, so an interrupted run
+    resumes submitting and polling them instead of paying for new batches. Returns ids of failed requests.
+    If a batch failed, expired or was cancelled, RuntimeError is raised after the finished
+    requests of all batches are ingested, the state is kept as batch_state_<batch id>_<status>.json
+    """
+
+    work_folder = Path(work_folder)
+    os.makedirs(work_folder, exist_ok=True)
+    state_file = work_folder / "batch_state.json"
+
+    if state_file.exists():
+        with open(state_file, "r") as f:
+            state = json.load(f)
+        print(f"Resuming {len(state['batches'])} batches")
+    else:
+        batches = write_batch_files(gpt4v, items, work_folder, max_requests, max_bytes)
+        state = {"batches": [{**batch, "batch_id": None} for batch in batches]}
+        _save_state(state, state_file)
+
+    for batch_state in state["batches"]:
+        if batch_state["batch_id"] is None:
+            input_file_id = client.upload(work_folder / batch_state["file"])
+            batch_state["batch_id"] = client.create(input_file_id)["id"]
+            _save_state(state, state_file)
+            print(
+                f"Submitted batch {batch_state['batch_id']} "
+                f"with {len(batch_state['id_map'])} requests"
+            )
+
+    failed_ids = []
+    unfinished = []
+    for batch_state in state["batches"]:
+        batch = client.wait(batch_state["batch_id"], poll_interval=poll_interval)
+        failed_ids += _ingest_batch(
+            batch, batch_state["id_map"], results, client, "logprobs" in gpt4v.args
+        )
+        if batch["status"] != "completed":
+            unfinished.append(batch)
+
+    for batch_state in state["batches"]:
+        input_file = work_folder / batch_state["file"]
+        if input_file.exists():
+            os.remove(input_file)
+    if unfinished:
+        # the next run submits new batches instead of resuming these
+        batch = unfinished[0]
+        os.replace(state_file, work_folder / f"batch_state_{batch['id']}_{batch['status']}.json")
+        statuses = ", ".join(f"{batch['id']} {batch['status']}" for batch in unfinished)
+        raise RuntimeError(f"Batches finished with errors: {statuses}")
+    os.remove(state_file)
+
+    return failed_ids
@@ -0,0 +1,192 @@
+"""
+Local stand-in for the OpenAI files and batches endpoints, used to try batch mode without paying.
+Batches complete after --delay seconds with canned chat completions.
+Usage: python batch_stub_server.py --port 8808, then set openai_base_url: http://localhost:8808/v1
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_TASK = (
+    "TASK:\n1. Setup: use python with pandas and matplotlib.\n"
+    "2. The dataframe is given.\n3. Draw the plot.\n4. Use the default style."
+)
+
+
+def stub_completion(body: dict) -> dict:
+    message = {"role": "assistant", "content": STUB_TASK}
+    choice = {"index": 0, "message": message, "finish_reason": "stop", "logprobs": None}
+    if body.get("logprobs"):
+        message["content"] = "5"
+        top_logprobs = [
+            {"token": str(score), "logprob": -abs(score - 5) - 0.1, "bytes": None}
+            for score in range(11)
+        ]
+        choice["logprobs"] = {
+            "content": [{"token": "5", "logprob": -0.1, "top_logprobs": top_logprobs}]
+        }
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [choice],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 1, "total_tokens": 1},
+    }
+
+
+class BatchStubState:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content: bytes, purpose: str) -> dict:
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        with self.lock:
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "purpose": purpose}
+
+    def create_batch(self, body: dict) -> dict:
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": time.time(),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        return batch
+
+    def get_batch(self, batch_id: str) -> dict | None:
+        with self.lock:
+            batch = self.batches.get(batch_id)
+        if batch is not None and batch["status"] == "in_progress":
+            if time.time() - batch["created_at"] >= self.delay:
+                self._complete(batch)
+        return batch
+
+    def _complete(self, batch: dict) -> None:
+        input_lines = self.files[batch["input_file_id"]].decode("utf-8").splitlines()
+        output_lines = []
+        for line in input_lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            result = {
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": stub_completion(request["body"]),
+                },
+                "error": None,
+            }
+            output_lines.append(json.dumps(result))
+
+        output = self.add_file("\n".join(output_lines).encode("utf-8"), "batch_output")
+        batch["output_file_id"] = output["id"]
+        batch["request_counts"] = {
+            "total": len(output_lines),
+            "completed": len(output_lines),
+            "failed": 0,
+        }
+        batch["status"] = "completed"
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict:
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = part.get_payload(decode=True)
+    return fields
+
+
+def make_handler(state: BatchStubState):
+    class BatchStubHandler(BaseHTTPRequestHandler):
+        def _send_json(self, data: dict | None, status: int = 200) -> None:
+            if data is None:
+                status, data = 404, {"error": {"message": "Not found"}}
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self) -> None:
+            if self.path == "/v1/files":
+                fields = parse_multipart(self.headers["Content-Type"], self._read_body())
+                purpose = fields.get("purpose", b"batch").decode("utf-8")
+                self._send_json(state.add_file(fields["file"], purpose))
+            elif self.path == "/v1/batches":
+                self._send_json(state.create_batch(json.loads(self._read_body())))
+            else:
+                self._send_json(None)
+
+        def do_GET(self) -> None:
+            parts = self.path.strip("/").split("/")
+            if len(parts) == 3 and parts[1] == "batches":
+                self._send_json(state.get_batch(parts[2]))
+            elif len(parts) == 4 and parts[1] == "files" and parts[3] == "content":
+                content = state.files.get(parts[2])
+                if content is None:
+                    self._send_json(None)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/jsonl")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            else:
+                self._send_json(None)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return BatchStubHandler
+
+
+def serve(port: int = 8808, delay: float = 1.0) -> ThreadingHTTPServer:
+    """
+    Start the stub server in a background thread. Stop it by server.shutdown()
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(BatchStubState(delay)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--delay", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port), make_handler(BatchStubState(args.delay))
+    )
+    print(f"Batch stub server on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,142 @@
+"""
+Content-addressed storage of images from result files.
+Each blob is written once to <root>/<sha256[:2]>/<sha256[2:]>, identical images share a blob,
+and result files keep only "sha256:<hash>" references instead of inline base64.
+"""
+
+import base64
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Any
+
+BLOB_PREFIX = "sha256:"
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(BLOB_PREFIX)
+
+
+class BlobStore:
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, ref: str) -> Path:
+        digest = ref[len(BLOB_PREFIX) :] if is_blob_ref(ref) else ref
+        return self.root / digest[:2] / digest[2:]
+
+    def put(self, data: bytes) -> str:
+        """
+        Store data and return its reference, existing blobs are not rewritten
+        """
+
+        ref = BLOB_PREFIX + hashlib.sha256(data).hexdigest()
+        path = self.path(ref)
+        if path.exists():
+            return ref
+
+        path.parent.mkdir(exist_ok=True)
+        # write under a unique name and rename, so readers never see a partial blob
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        return ref
+
+    def get(self, ref: str) -> bytes | mmap.mmap:
+        """
+        Memory-mapped read-only view of the blob, pages are loaded on access
+        """
+
+        with open(self.path(ref), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, ref: str) -> bool:
+        return self.path(ref).exists()
+
+
+def load_image(image: str, store: BlobStore) -> bytes | mmap.mmap:
+    """
+    Image bytes of a blob reference or of legacy inline base64
+    """
+
+    if is_blob_ref(image):
+        return store.get(image)
+    return base64.b64decode(image)
+
+
+def externalize_images(entry: Any, store: BlobStore, key: str = "images") -> int:
+    """
+    Replace base64 images in all lists under key (e.g. entry["plot results"]["images"])
+    with blob references in place. Returns number of replaced images.
+    """
+
+    replaced = 0
+    if isinstance(entry, dict):
+        for name, value in entry.items():
+            if name == key and isinstance(value, list):
+                for i, image in enumerate(value):
+                    if isinstance(image, str) and not is_blob_ref(image):
+                        value[i] = store.put(base64.b64decode(image))
+                        replaced += 1
+            else:
+                replaced += externalize_images(value, store, key)
+    elif isinstance(entry, list):
+        for value in entry:
+            replaced += externalize_images(value, store, key)
+
+    return replaced
+
+
+def migrate_results_file(file_path: str | Path, store: BlobStore) -> int:
+    """
+    Rewrite a .jsonl or .json result file with images moved to the blob store.
+    The file is replaced atomically. Returns number of moved images.
+    """
+
+    file_path = Path(file_path)
+    temp_path = file_path.with_name(file_path.name + ".tmp")
+    replaced = 0
+    if file_path.suffix == ".jsonl":
+        with open(file_path, "r") as source, open(temp_path, "w") as target:
+            for line in source:
+                entry = json.loads(line)
+                replaced += externalize_images(entry, store)
+                json.dump(entry, target)
+                target.write("\n")
+    else:
+        with open(file_path, "r") as f:
+            results = json.load(f)
+        replaced = externalize_images(results, store)
+        with open(temp_path, "w") as f:
+            json.dump(results, f)
+    os.replace(temp_path, file_path)
+    # offsets of the result store index are no longer valid
+    index_path = file_path.with_name(file_path.name + ".idx")
+    if index_path.exists():
+        os.remove(index_path)
+
+    return replaced
+
+
+def blob_store_from_config(config) -> BlobStore:
+    return BlobStore(config.get("blob_store_path") or Path(config.out_folder) / "blobs")
+
+
+def externalize_benchmark_images(config) -> None:
+    """
+    Move images of the benchmark result files in out_folder to the blob store
+    """
+
+    store = blob_store_from_config(config)
+    for file_name in ["gpt_plots_dev.jsonl", "gpt_plots_results.json"]:
+        file_path = Path(config.out_folder) / file_name
+        if file_path.exists():
+            replaced = migrate_results_file(file_path, store)
+            print(f"{file_name}: {replaced} images moved to {store.root}")
@@ -0,0 +1,352 @@
+"""
+Make-like incremental build of the per-datapoint pipeline steps.
+Each rule declares the files it reads and writes in a datapoint folder. The hash of a
+datapoint's inputs (file contents, extra inputs like the GPT response, library versions)
+is stored in <folder>/.build_manifest.json after a successful build, and datapoints whose
+inputs did not change are skipped on the next run.
+Input hashes are taken after the rule ran, so rules modifying their inputs in place
+are not rebuilt by their own changes.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from graphlib import TopologicalSorter
+from importlib import metadata
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from omegaconf import DictConfig
+
+MANIFEST_NAME = ".build_manifest.json"
+
+
+@dataclass
+class Rule:
+    name: str
+    # config key of the folder with datapoint subfolders
+    folder_key: str
+    # runs the step for the given datapoint ids. It may return the ids it built, otherwise
+    # a datapoint is built if the step wrote all of its outputs
+    run: Callable[[DictConfig, List[int]], List[int] | None]
+    # glob patterns relative to the datapoint folder
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    # outputs are looked up in this folder instead, e.g. for the final dataset
+    output_folder_key: str | None = None
+    deps: Tuple[str, ...] = ()
+    libraries: Tuple[str, ...] = ()
+    # per datapoint text that is part of the inputs, datapoints without it are not built
+    extra_inputs: Callable[[DictConfig], Dict[int, str]] | None = None
+
+
+def library_versions(libraries: Tuple[str, ...]) -> Dict[str, str]:
+    versions = {}
+    for library in libraries:
+        try:
+            versions[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            versions[library] = "missing"
+
+    return versions
+
+
+class Manifest:
+    """
+    Built input hashes per rule and datapoint, and a stat cache of file hashes,
+    so unchanged files are not read again
+    """
+
+    def __init__(self, folder: Path) -> None:
+        self.path = folder / MANIFEST_NAME
+        self.data = {"rules": {}, "files": {}}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.data = json.load(f)
+
+    def file_hash(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path)
+        cached = self.data["files"].get(key)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        file_hash = digest.hexdigest()
+        self.data["files"][key] = [stat.st_size, stat.st_mtime_ns, file_hash]
+
+        return file_hash
+
+    def built_hash(self, rule: str, dp_id: int) -> str | None:
+        return self.data["rules"].get(rule, {}).get(str(dp_id))
+
+    def record(self, rule: str, dp_id: int, input_hash: str) -> None:
+        self.data["rules"].setdefault(rule, {})[str(dp_id)] = input_hash
+
+    def save(self) -> None:
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(self.data, f)
+        os.replace(temp_path, self.path)
+
+
+def match_files(folder: Path, patterns: Tuple[str, ...]) -> List[Path]:
+    files = set()
+    for pattern in patterns:
+        files.update(path for path in folder.glob(pattern) if path.is_file())
+
+    return sorted(files)
+
+
+def input_hash(
+    manifest: Manifest,
+    rule: Rule,
+    dp_folder: Path,
+    versions: Dict[str, str],
+    extra: str | None,
+) -> str:
+    digest = hashlib.sha256()
+    digest.update(rule.name.encode())
+    for path in match_files(dp_folder, rule.inputs):
+        digest.update(path.name.encode())
+        digest.update(manifest.file_hash(path).encode())
+    digest.update(json.dumps(versions, sort_keys=True).encode())
+    if extra is not None:
+        digest.update(extra.encode())
+
+    return digest.hexdigest()
+
+
+def outputs_exist(folder: Path, patterns: Tuple[str, ...]) -> bool:
+    return all(any(folder.glob(pattern)) for pattern in patterns)
+
+
+def output_stamps(folder: Path, patterns: Tuple[str, ...]) -> List[set]:
+    """
+    (name, inode, ctime) of the files matching each pattern. Writing, replacing
+    or linking a file changes its stamp
+    """
+
+    stamps = []
+    for pattern in patterns:
+        stamps.append(set())
+        for path in folder.glob(pattern):
+            stat = path.stat()
+            stamps[-1].add((path.name, stat.st_ino, stat.st_ctime_ns))
+
+    return stamps
+
+
+def outputs_written(folder: Path, patterns: Tuple[str, ...], before: List[set]) -> bool:
+    """
+    Every pattern matches a file written since the before stamps were taken
+    """
+
+    after = output_stamps(folder, patterns)
+    return all(stamps - old_stamps for stamps, old_stamps in zip(after, before))
+
+
+def dp_ids_of(folder: Path) -> List[int]:
+    if not folder.is_dir():
+        return []
+    return sorted(int(entry.name) for entry in folder.iterdir() if entry.name.isdigit())
+
+
+def build_rule(
+    config: DictConfig,
+    rule: Rule,
+    ids: List[int] | None = None,
+    force: bool = False,
+) -> Tuple[int, int, List[int]]:
+    """
+    Build stale datapoints of a rule. Returns numbers of built and skipped datapoints and failed ids
+    """
+
+    folder = Path(config[rule.folder_key])
+    output_folder = Path(config[rule.output_folder_key or rule.folder_key])
+    manifest = Manifest(folder)
+    versions = library_versions(rule.libraries)
+    extras = rule.extra_inputs(config) if rule.extra_inputs is not None else None
+
+    dp_ids = dp_ids_of(folder)
+    if ids is not None:
+        ids = set(ids)
+        dp_ids = [idx for idx in dp_ids if idx in ids]
+    if extras is not None:
+        dp_ids = [idx for idx in dp_ids if idx in extras]
+
+    def current_hash(idx: int) -> str:
+        extra = extras[idx] if extras is not None else None
+        return input_hash(manifest, rule, folder / str(idx), versions, extra)
+
+    stale = [
+        idx
+        for idx in dp_ids
+        if force
+        or manifest.built_hash(rule.name, idx) != current_hash(idx)
+        or not outputs_exist(output_folder / str(idx), rule.outputs)
+    ]
+    # outputs left from an earlier build do not count as built
+    before = {idx: output_stamps(output_folder / str(idx), rule.outputs) for idx in stale}
+    built_ids = rule.run(config, stale) if stale else None
+    if built_ids is not None:
+        built_ids = set(built_ids)
+
+    def is_built(idx: int) -> bool:
+        dp_output_folder = output_folder / str(idx)
+        if built_ids is not None:
+            # steps reporting their datapoints may keep unchanged outputs as they are
+            return idx in built_ids and outputs_exist(dp_output_folder, rule.outputs)
+        return outputs_written(dp_output_folder, rule.outputs, before[idx])
+
+    failed = []
+    for idx in stale:
+        if is_built(idx):
+            manifest.record(rule.name, idx, current_hash(idx))
+        else:
+            failed.append(idx)
+    manifest.save()
+
+    return len(stale) - len(failed), len(dp_ids) - len(stale), failed
+
+
+def build_order(rules: List[Rule], targets: List[str] | None = None) -> List[Rule]:
+    """
+    Rules in dependency order, only targets and their dependencies if targets are given
+    """
+
+    by_name = {rule.name: rule for rule in rules}
+    if targets is None:
+        targets = list(by_name)
+
+    graph = {}
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in graph:
+            graph[name] = by_name[name].deps
+            pending.extend(by_name[name].deps)
+
+    return [by_name[name] for name in TopologicalSorter(graph).static_order()]
+
+
+def run_build(
+    config: DictConfig,
+    ids: List[int] | None = None,
+    rules: List[Rule] | None = None,
+) -> None:
+    """
+    Build targets from config.build_targets (all rules by default),
+    config.build_force rebuilds everything
+    """
+
+    rules = rules if rules is not None else BUILD_RULES
+    targets = config.get("build_targets")
+    force = config.get("build_force", False)
+
+    for rule in build_order(rules, list(targets) if targets else None):
+        built, skipped, failed = build_rule(config, rule, ids, force)
+        print(f"{rule.name}: built {built}, up to date {skipped}, failed {len(failed)}")
+        if failed:
+            print(f"{rule.name} failed for {failed}")
+
+
+def _split_notebooks(config: DictConfig, ids: List[int]) -> None:
+    from matplotlib_postprocess import build_split_notebooks
+
+    build_split_notebooks(config, ids)
+
+
+def _code_split_responses(config: DictConfig) -> Dict[int, str]:
+    from result_store import ResultStore
+
+    response_file = Path(config.matplotlib_dataset_path) / "gpt_response.jsonl"
+    if not response_file.exists():
+        return {}
+    with ResultStore(response_file) as results:
+        return {idx: entry["prediction"] for idx, entry in results.items()}
+
+
+def _cut_notebooks(config: DictConfig, ids: List[int]) -> None:
+    from process_step_1_validated import (
+        clean_dp_nbs,
+        gather_plots,
+        generate_stand_alone_dps,
+        split_noteboooks,
+    )
+
+    # these steps modify split_data_cut.ipynb in place, so they are built as one rule
+    folder = Path(config.dataset_valid_step_1)
+    generate_stand_alone_dps(folder, ids)
+    clean_dp_nbs(folder, ids)
+    gather_plots(folder, ids)
+    split_noteboooks(folder, ids)
+
+
+def _df_descriptions(config: DictConfig, ids: List[int]) -> None:
+    from process_step_1_validated import generate_df_description_all
+
+    generate_df_description_all(Path(config.dataset_valid_step_1), ids)
+
+
+def _gather_dps(config: DictConfig, ids: List[int]) -> List[int]:
+    from process_step_3_gather_dps import gather_dps
+
+    # task.json and data_load.py are rewritten only if they change
+    return gather_dps(config, ids)
+
+
+def _task_responses(config: DictConfig) -> Dict[int, str]:
+    from LLM_utils import read_task_responses
+
+    response_file = Path(config.out_folder) / "gpt_tasks.jsonl"
+    if not response_file.exists():
+        return {}
+    return {
+        idx: json.dumps(task, sort_keys=True)
+        for idx, task in read_task_responses(response_file).items()
+    }
+
+
+BUILD_RULES = [
+    Rule(
+        "split_notebooks",
+        "matplotlib_dataset_path",
+        _split_notebooks,
+        inputs=("plot.py",),
+        outputs=("split_data.ipynb",),
+        libraries=("pandas", "matplotlib", "numpy"),
+        extra_inputs=_code_split_responses,
+    ),
+    Rule(
+        "cut_notebooks",
+        "dataset_valid_step_1",
+        _cut_notebooks,
+        inputs=("split_data.ipynb", "data.csv"),
+        outputs=("split_data_cut.ipynb", "*.png"),
+        libraries=("pandas", "matplotlib", "numpy", "seaborn"),
+    ),
+    Rule(
+        "df_descriptions",
+        "dataset_valid_step_1",
+        _df_descriptions,
+        inputs=("split_data_cut.ipynb", "data.csv"),
+        outputs=("data_descr.txt",),
+        deps=("cut_notebooks",),
+        libraries=("pandas", "pyarrow"),
+    ),
+    Rule(
+        "gather_dps",
+        "dataset_valid_step_1",
+        _gather_dps,
+        inputs=("plot.py", "plot_original.py", "data_descr.txt", "data.csv", "*.png"),
+        outputs=("task.json", "data_load.py"),
+        output_folder_key="dataset_final",
+        deps=("df_descriptions",),
+        extra_inputs=_task_responses,
+    ),
+]
@@ -0,0 +1,355 @@
+"""
+Single entry point for the dataset pipeline steps:
+    python cli.py run <step> [<step> ...] [--ids 1 2 3] [--config configs/config.yaml]
+    python cli.py list
+Step modules (and heavy libraries like tiktoken, nbformat, pandas, docx, matplotlib)
+are imported only for the steps being run.
+"""
+
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+from result_store import ResultStore
+
+HEAVY_MODULES = [
+    "tiktoken",
+    "nbformat",
+    "pandas",
+    "docx",
+    "matplotlib",
+    "numpy",
+    "PIL",
+    "openai",
+]
+
+
+class Step(NamedTuple):
+    module: str
+    function: str
+    # config keys passed as folder arguments, None means the step takes the config itself
+    folders: Tuple[str, ...] | None = None
+    supports_ids: bool = False
+    help: str = ""
+
+
+STEPS = {
+    # matplotlib gallery
+    "copy_and_clean": Step(
+        "matplotlib_process_gallery",
+        "copy_and_clean",
+        ("matplotlib_source_path", "matplotlib_dataset_path"),
+        help="copy gallery notebooks and keep only the plotting cell",
+    ),
+    "run_notebooks": Step(
+        "matplotlib_process_gallery",
+        "run_notebooks",
+        ("matplotlib_dataset_path",),
+        help="execute gallery notebooks",
+    ),
+    "filter_nb_by_image": Step(
+        "matplotlib_process_gallery",
+        "filter_nb_by_image",
+        ("matplotlib_dataset_path",),
+        help="remove notebooks without image output",
+    ),
+    "seaprate_by_folders": Step(
+        "matplotlib_process_gallery",
+        "seaprate_by_folders",
+        ("matplotlib_dataset_path",),
+        help="move notebooks to datapoint folders",
+    ),
+    "generate_separate_code_and_images": Step(
+        "matplotlib_process_gallery",
+        "generate_separate_code_and_images",
+        ("matplotlib_dataset_path",),
+        supports_ids=True,
+        help="extract plot.py and plot.png from notebooks",
+    ),
+    "render_gallery_plots": Step(
+        "plot_renderer",
+        "render_gallery_plots",
+        ("matplotlib_dataset_path",),
+        supports_ids=True,
+        help="extract plot.py and render plot.png without notebooks",
+    ),
+    "add_info_to_nb_datapoints": Step(
+        "matplotlib_process_gallery",
+        "add_info_to_nb_datapoints",
+        ("matplotlib_dataset_path",),
+        supports_ids=True,
+        help="add info.json as a markdown cell",
+    ),
+    "split_code": Step(
+        "split_dataset_code_by_GPT",
+        "split_code",
+        supports_ids=True,
+        help="ask GPT to split code into data and plotting blocks",
+    ),
+    "build_split_notebooks": Step(
+        "matplotlib_postprocess",
+        "build_split_notebooks",
+        supports_ids=True,
+        help="build and run split_data.ipynb from GPT code split",
+    ),
+    "first_check": Step(
+        "gather_dp_for_first_check",
+        "gather_for_first_check",
+        help="gather split notebooks for manual validation",
+    ),
+    # step 1, manually validated datapoints
+    "copy_valid_dp": Step(
+        "process_step_1_validated",
+        "copy_valid_dp",
+        ("matplotlib_dataset_path", "validated_notebooks", "dataset_valid_step_1"),
+        help="copy validated datapoints",
+    ),
+    "generate_stand_alone_dps": Step(
+        "process_step_1_validated",
+        "generate_stand_alone_dps",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="build and run split_data_cut.ipynb",
+    ),
+    "gather_nbs": Step(
+        "process_step_1_validated",
+        "gather_nbs",
+        ("dataset_valid_step_1", "dataset_valid_step_1_notebooks"),
+        supports_ids=True,
+        help="gather cut notebooks to a single folder",
+    ),
+    "clean_dp_nbs": Step(
+        "process_step_1_validated",
+        "clean_dp_nbs",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="keep only one code cell in cut notebooks",
+    ),
+    "gather_plots": Step(
+        "process_step_1_validated",
+        "gather_plots",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="extract plots from cut notebooks",
+    ),
+    "render_plots": Step(
+        "plot_renderer",
+        "render_plots",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="render plots of cut notebooks without executing them",
+    ),
+    "ingest_images": Step(
+        "image_store",
+        "ingest_dataset_images",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="optimize plots, move them to the image store and flag near duplicates",
+    ),
+    "split_noteboooks": Step(
+        "process_step_1_validated",
+        "split_noteboooks",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="split data loading and plotting cells",
+    ),
+    "write_columnar_copies": Step(
+        "columnar",
+        "write_columnar_copies",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="add memory-mappable data.feather next to data.csv",
+    ),
+    "generate_df_description_all": Step(
+        "process_step_1_validated",
+        "generate_df_description_all",
+        ("dataset_valid_step_1",),
+        supports_ids=True,
+        help="write data_descr.txt",
+    ),
+    # step 2, tasks
+    "generate_tasks": Step(
+        "generate_tasks_by_GPT",
+        "generate_tasks",
+        supports_ids=True,
+        help="generate plotting tasks by GPT",
+    ),
+    "tasks_docx": Step(
+        "process_step_2_gpt_tasks",
+        "tasks_to_docx",
+        help="dump tasks to docx",
+    ),
+    # step 3, final dataset
+    "gather_dps": Step(
+        "process_step_3_gather_dps",
+        "gather_dps",
+        supports_ids=True,
+        help="assemble the final dataset",
+    ),
+    "build_manifest": Step(
+        "plot_dataset",
+        "build_manifest",
+        ("dataset_final",),
+        supports_ids=True,
+        help="write dataset_manifest.jsonl of the final dataset",
+    ),
+    "pack_dataset": Step(
+        "dataset_pack",
+        "pack_dataset",
+        supports_ids=True,
+        help="pack the final dataset into indexed tar shards",
+    ),
+    "bench_docx": Step(
+        "utils/present_bench_results.py",
+        "bench_results_to_docx",
+        help="dump benchmark results to docx",
+    ),
+    "externalize_images": Step(
+        "blob_store",
+        "externalize_benchmark_images",
+        help="move base64 images of benchmark results to the blob store",
+    ),
+    "seaborn_gallery": Step(
+        "seaborn_gallery_parsing",
+        "parse_seaborn_gallery",
+        help="download seaborn gallery",
+    ),
+    "build": Step(
+        "build_graph",
+        "run_build",
+        supports_ids=True,
+        help="rebuild only datapoints with changed inputs (build_targets, build_force)",
+    ),
+    "status": Step("cli", "pipeline_status", help="show resume status of LLM steps"),
+}
+
+
+def load_step_function(step: Step):
+    if step.module == "cli":
+        return globals()[step.function]
+    if step.module.endswith(".py"):
+        module_path = Path(__file__).parent / step.module
+        spec = importlib.util.spec_from_file_location(module_path.stem, module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(step.module)
+
+    return getattr(module, step.function)
+
+
+def count_datapoints(folder: str | Path) -> int:
+    if not os.path.isdir(folder):
+        return 0
+    return sum(
+        1 for entry in os.scandir(folder) if entry.is_dir() and entry.name.isdigit()
+    )
+
+
+def count_response_ids(response_file: str | Path) -> int:
+    if not os.path.exists(response_file):
+        return 0
+
+    return len(ResultStore(response_file))
+
+
+def pipeline_status(config, ids: List[int] | None = None) -> None:
+    llm_steps = [
+        (
+            "split_code",
+            config.matplotlib_dataset_path,
+            Path(config.matplotlib_dataset_path) / "gpt_response.jsonl",
+        ),
+        (
+            "generate_tasks",
+            config.dataset_valid_step_1,
+            Path(config.out_folder) / "gpt_tasks.jsonl",
+        ),
+    ]
+
+    for name, dataset_folder, response_file in llm_steps:
+        total = count_datapoints(dataset_folder)
+        done = count_response_ids(response_file)
+        print(f"{name}: {done}/{total} datapoints done")
+
+
+def report_startup(budget: float, verbose: bool = False) -> None:
+    """
+    Time from the CLI start until the step function is imported, checked against the budget
+    """
+
+    startup = time.perf_counter() - _START
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    message = f"Startup {startup:.2f} s (budget {budget:.2f} s), heavy modules loaded: {loaded}"
+    if startup > budget:
+        print(f"WARNING: import time budget exceeded. {message}", file=sys.stderr)
+    elif verbose:
+        print(message, file=sys.stderr)
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="plotgather")
+    parser.add_argument("--config", default="configs/config.yaml")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="run pipeline steps in the given order"
+    )
+    run_parser.add_argument("steps", nargs="+", choices=list(STEPS))
+    run_parser.add_argument("--ids", nargs="+", type=int, default=None)
+    run_parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=1.0,
+        help="warn if startup before running the step takes longer (seconds)",
+    )
+    run_parser.add_argument("--timing", action="store_true", help="report startup time")
+
+    subparsers.add_parser("list", help="list available steps")
+
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    if args.command == "list":
+        for name, step in STEPS.items():
+            ids_note = " [--ids]" if step.supports_ids else ""
+            print(f"{name}{ids_note}: {step.help}")
+        return
+
+    from omegaconf import OmegaConf
+
+    config = OmegaConf.load(args.config)
+
+    for step_name in args.steps:
+        step = STEPS[step_name]
+        if args.ids is not None and not step.supports_ids:
+            raise SystemExit(f"Step {step_name} does not support --ids")
+
+        step_function = load_step_function(step)
+        if step_name == args.steps[0]:
+            report_startup(args.import_budget, verbose=args.timing)
+
+        if step.folders is None:
+            step_args = [config]
+        else:
+            step_args = [Path(config[key]) for key in step.folders]
+        step_kwargs = {"ids": args.ids} if args.ids is not None else {}
+
+        start = time.perf_counter()
+        step_function(*step_args, **step_kwargs)
+        print(f"Step {step_name} done in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Merging of identical in-flight requests: the first caller for a key sends the request,
+callers arriving while it is in flight wait for the same result instead of sending their own.
+"""
+
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+class RequestCoalescer:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_async: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Call fn once for all threads asking for the same key at the same time.
+        Every caller gets its own copy of the result, as responses are modified by callers.
+        """
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fn()
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+        return copy.deepcopy(result)
+
+    async def run_async(self, key: str, coro_fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Same as run for coroutines of a single event loop
+        """
+
+        while key in self._inflight_async:
+            future = self._inflight_async[key]
+            self.coalesced += 1
+            try:
+                # shield, so a cancelled waiter does not cancel the request of the others
+                return copy.deepcopy(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                # the owner was cancelled, the next waiter sends the request itself
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        # the exception is re-raised to the owner, do not warn when nobody else waited
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight_async[key] = future
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight_async[key]
+
+        return copy.deepcopy(result)
@@ -0,0 +1,133 @@
+"""
+Feather (Arrow IPC) companion of data.csv in datapoint folders.
+The copy holds the dataframe exactly as pd.read_csv("data.csv") returns it, so loading it
+gives the same dtypes without parsing. It is written uncompressed to be memory-mapped.
+data.csv stays the canonical file: the copy is used only if it is not older than the csv.
+"""
+
+import os
+from pathlib import Path
+
+CSV_NAME = "data.csv"
+FEATHER_NAME = "data.feather"
+
+# data_load.py of the final dataset if the data cell only reads data.csv,
+# a damaged copy raises ArrowInvalid (a ValueError) and data.csv is read instead
+DATA_LOAD_CODE = f"""import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+
+    df = feather.read_table({FEATHER_NAME!r}, memory_map=True).to_pandas()
+except (ImportError, OSError, ValueError):
+    df = pd.read_csv({CSV_NAME!r})
+"""
+
+
+def write_feather(df, path: str | Path) -> None:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    feather.write_feather(table, path, compression="uncompressed")
+
+
+def feather_is_fresh(dp_folder: Path) -> bool:
+    feather_path = dp_folder / FEATHER_NAME
+    csv_path = dp_folder / CSV_NAME
+    if not feather_path.exists():
+        return False
+    return not csv_path.exists() or feather_path.stat().st_mtime >= csv_path.stat().st_mtime
+
+
+def read_feather(path: str | Path):
+    """
+    Memory-mapped read without parsing. Columns are copied to writable pandas blocks,
+    zero-copy columns would be read-only views of the file and break in-place edits of df
+    """
+
+    import pyarrow.feather as feather
+
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def load_data(dp_folder: str | Path):
+    """
+    Dataframe of the datapoint, from the feather copy if it is up to date
+    """
+
+    dp_folder = Path(dp_folder)
+    if feather_is_fresh(dp_folder):
+        try:
+            return read_feather(dp_folder / FEATHER_NAME)
+        except (OSError, ValueError):
+            pass
+
+    import pandas as pd
+
+    return pd.read_csv(dp_folder / CSV_NAME)
+
+
+def ensure_feather(dp_folder: Path) -> bool:
+    """
+    Write the feather copy from data.csv if it is missing or stale. Returns whether it was written.
+    Dataframes Arrow can't store (e.g. object columns of mixed types) get no copy,
+    check feather_is_fresh before using it
+    """
+
+    if feather_is_fresh(dp_folder) or not (dp_folder / CSV_NAME).exists():
+        return False
+
+    import pandas as pd
+    import pyarrow as pa
+
+    temp_path = dp_folder / f"{FEATHER_NAME}.{os.getpid()}.tmp"
+    try:
+        df = pd.read_csv(dp_folder / CSV_NAME)
+        write_feather(df, temp_path)
+    except (pa.ArrowException, ValueError) as e:
+        print(f"dp {dp_folder.name}: no feather copy, {type(e).__name__}: {e}")
+        if temp_path.exists():
+            os.remove(temp_path)
+        return False
+    os.replace(temp_path, dp_folder / FEATHER_NAME)
+
+    return True
+
+
+def write_columnar_copies(folder, ids=None, workers=None):
+    """
+    Add data.feather to datapoints that have only data.csv (or an outdated copy)
+    """
+
+    from data import get_dp_folders
+    from dp_executor import dp_map
+    from utils import filter_dp_folders
+
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
+    results = dp_map(ensure_feather, dp_folders, workers, "write_columnar_copies")
+    written = sum(1 for result in results if result.ok and result.value)
+    print(f"{written} feather copies written")
+
+
+def patch_read_csv() -> None:
+    """
+    Make pd.read_csv("data.csv") in the current process load a fresh feather copy
+    from the working directory instead. Used in plot renderer workers
+    """
+
+    import pandas as pd
+
+    read_csv = pd.read_csv
+
+    def read_csv_columnar(filepath_or_buffer, *args, **kwargs):
+        if filepath_or_buffer == CSV_NAME and not args and not kwargs:
+            cwd = Path.cwd()
+            if feather_is_fresh(cwd):
+                try:
+                    return read_feather(cwd / FEATHER_NAME)
+                except (OSError, ValueError):
+                    pass
+        return read_csv(filepath_or_buffer, *args, **kwargs)
+
+    pd.read_csv = read_csv_columnar
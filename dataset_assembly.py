@@ -0,0 +1,152 @@
+"""
+Assembly of dataset folders from files of an earlier stage without copying data.
+Files are placed as reflinks (copy-on-write clones) if the filesystem supports them,
+as hardlinks otherwise, and copied only across filesystems. A hardlinked file is the same
+file in both datasets, so rewriting the source in place also changes the assembled one.
+Sizes and sha256 of placed files are kept in assembly_manifest.json of the target folder,
+files whose source did not change since the last assembly are skipped.
+"""
+
+import errno
+import fcntl
+import json
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from df_summary import file_sha256
+
+MANIFEST_NAME = "assembly_manifest.json"
+# ioctl number of FICLONE on Linux
+FICLONE = 0x40049409
+METHODS = ("reflink", "hardlink", "copy")
+
+_LINK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP)
+
+
+def reflink(source: Path, target: Path) -> None:
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source, target)
+
+
+def place_file(source: Path, target: Path, methods: Tuple[str, ...] = METHODS) -> str:
+    """
+    Place source at target with the first method that works, returns the method.
+    The target is replaced atomically
+    """
+
+    temp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    for method in methods:
+        try:
+            if method == "reflink":
+                reflink(source, temp_path)
+            elif method == "hardlink":
+                os.link(source, temp_path)
+            else:
+                shutil.copy2(source, temp_path)
+        except OSError as e:
+            if temp_path.exists():
+                os.remove(temp_path)
+            if method == "copy" or e.errno not in _LINK_ERRORS + (errno.EINVAL, errno.ENOTTY):
+                raise
+            continue
+        os.replace(temp_path, target)
+        return method
+
+    raise ValueError(f"No method to place {source}, got {methods}")
+
+
+class AssemblyManifest:
+    """
+    Per target file: [size, mtime_ns] of the source when it was placed and its sha256
+    """
+
+    def __init__(self, folder: Path) -> None:
+        self.path = folder / MANIFEST_NAME
+        self.files: Dict[str, list] = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.files = json.load(f)["files"]
+
+    def save(self) -> None:
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def _assemble_one(
+    manifest: AssemblyManifest, root: Path, source: Path, target: Path, methods
+) -> Tuple[str, str, list]:
+    key = str(target.relative_to(root))
+    stat = source.stat()
+    record = manifest.files.get(key)
+
+    unchanged_stat = record is not None and record[:2] == [stat.st_size, stat.st_mtime_ns]
+    if target.exists():
+        # a hardlinked target is the source itself
+        if target.samefile(source):
+            checksum = record[2] if unchanged_stat else file_sha256(source)
+            return "unchanged", key, [stat.st_size, stat.st_mtime_ns, checksum]
+        if unchanged_stat:
+            return "unchanged", key, record
+
+    checksum = file_sha256(source)
+    new_record = [stat.st_size, stat.st_mtime_ns, checksum]
+    if (
+        record is not None
+        and record[2] == checksum
+        and target.exists()
+        and target.stat().st_size == stat.st_size
+    ):
+        return "unchanged", key, new_record
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    return place_file(source, target, methods), key, new_record
+
+
+def assemble_files(
+    root: str | Path,
+    pairs: List[Tuple[Path, Path]],
+    workers: int | None = None,
+    methods: Tuple[str, ...] = METHODS,
+) -> Counter:
+    """
+    Place (source, target) files under the root of the assembled dataset in parallel.
+    Returns numbers of files per method and of unchanged files
+    """
+
+    root = Path(root)
+    manifest = AssemblyManifest(root)
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        results = list(
+            pool.map(
+                lambda pair: _assemble_one(manifest, root, pair[0], pair[1], methods), pairs
+            )
+        )
+
+    counts = Counter()
+    for method, key, record in results:
+        counts[method] += 1
+        manifest.files[key] = record
+    manifest.save()
+
+    return counts
+
+
+def write_if_changed(path: Path, text: str) -> bool:
+    """
+    Write generated text only if it differs, so unchanged files keep their mtime
+    """
+
+    if path.exists():
+        with open(path, "r") as f:
+            if f.read() == text:
+                return False
+    with open(path, "w") as f:
+        f.write(text)
+    return True
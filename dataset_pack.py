@@ -0,0 +1,247 @@
+"""
+Export of a dataset folder to a few uncompressed tar shards with an offset index.
+Files of a datapoint are stored next to each other as <id>/<file name>, so a reader gets
+all of them with one positional read of the byte span recorded in index.json.
+Shards are plain tar files and can be streamed sequentially (or unpacked with tar).
+"""
+
+import json
+import os
+import tarfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+INDEX_NAME = "index.json"
+SHARD_PATTERN = "shard-{:05d}.tar"
+
+
+def _add_file(tar: tarfile.TarFile, path: Path, name: str) -> None:
+    # regular file members only, tar.add would store hardlinked plots as links
+    stat = path.stat()
+    info = tarfile.TarInfo(name)
+    info.size = stat.st_size
+    info.mtime = int(stat.st_mtime)
+    info.mode = 0o644
+    with open(path, "rb") as f:
+        tar.addfile(info, f)
+
+
+def _shard_spans(shard_path: Path) -> Dict[str, list]:
+    """
+    Datapoint spans of a written shard from its member headers: [start, end, [[name, offset, size]]]
+    """
+
+    spans = {}
+    with tarfile.open(shard_path, "r:") as tar:
+        for member in tar:
+            dp_id, name = member.name.split("/", 1)
+            span = spans.setdefault(dp_id, [member.offset_data, 0, []])
+            span[1] = member.offset_data + member.size
+            span[2].append([name, member.offset_data, member.size])
+
+    return spans
+
+
+def pack_dataset_folder(
+    dataset_folder: str | Path,
+    out_folder: str | Path,
+    ids: List[int] | None = None,
+    shard_size: int = 1 << 30,
+) -> Dict:
+    """
+    Pack datapoint folders into shards of about shard_size bytes, returns the index.
+    With ids, these datapoints are added to an existing export in new shards
+    """
+
+    from data import get_dp_folders
+    from utils import filter_dp_folders
+
+    dp_folders = filter_dp_folders(get_dp_folders(dataset_folder), ids)
+
+    return pack_dp_folders(dp_folders, out_folder, shard_size, update=ids is not None)
+
+
+def _read_index(out_folder: Path) -> Dict:
+    if not (out_folder / INDEX_NAME).exists():
+        return {"shards": [], "dps": {}}
+    with open(out_folder / INDEX_NAME, "r") as f:
+        return json.load(f)
+
+
+def pack_dp_folders(
+    dp_folders: List[Path],
+    out_folder: str | Path,
+    shard_size: int = 1 << 30,
+    update: bool = False,
+) -> Dict:
+    """
+    Pack datapoint folders into shards of out_folder, replacing an earlier export.
+    With update, the datapoints are written to new shards and replace only their own
+    entries of the existing index, shards left without indexed datapoints are removed
+    """
+
+    from tqdm import tqdm
+
+    out_folder = Path(out_folder)
+    out_folder.mkdir(parents=True, exist_ok=True)
+
+    index = {"shards": [], "dps": {}}
+    first_shard = 0
+    if update:
+        old_index = _read_index(out_folder)
+        packed_ids = {dp_folder.name for dp_folder in dp_folders}
+        used_shards = {
+            span[0] for dp_id, span in old_index["dps"].items() if dp_id not in packed_ids
+        }
+        shard_nums = {}
+        for shard_num, shard_name in enumerate(old_index["shards"]):
+            if shard_num in used_shards:
+                shard_nums[shard_num] = len(index["shards"])
+                index["shards"].append(shard_name)
+        for dp_id, span in old_index["dps"].items():
+            if dp_id not in packed_ids:
+                index["dps"][dp_id] = [shard_nums[span[0]]] + span[1:]
+        # new shards are numbered after every existing one, so none is overwritten
+        existing = [int(path.stem.split("-")[1]) for path in out_folder.glob("shard-*.tar")]
+        first_shard = max(existing, default=-1) + 1
+
+    shards: List[List[Path]] = [[]]
+    size = 0
+    for dp_folder in dp_folders:
+        dp_size = sum(path.stat().st_size for path in dp_folder.iterdir() if path.is_file())
+        if shards[-1] and size + dp_size > shard_size:
+            shards.append([])
+            size = 0
+        shards[-1].append(dp_folder)
+        size += dp_size
+
+    for shard_folders in tqdm(shards):
+        if not shard_folders:
+            continue
+        shard_num = len(index["shards"])
+        shard_name = SHARD_PATTERN.format(first_shard + shard_num)
+        shard_path = out_folder / shard_name
+        temp_path = shard_path.with_name(shard_path.name + ".tmp")
+        with tarfile.open(temp_path, "w", format=tarfile.GNU_FORMAT) as tar:
+            for dp_folder in shard_folders:
+                for path in sorted(dp_folder.iterdir()):
+                    if path.is_file():
+                        _add_file(tar, path, f"{dp_folder.name}/{path.name}")
+        os.replace(temp_path, shard_path)
+
+        index["shards"].append(shard_name)
+        for dp_id, span in _shard_spans(shard_path).items():
+            index["dps"][dp_id] = [shard_num] + span
+
+    temp_path = out_folder / f"{INDEX_NAME}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(temp_path, out_folder / INDEX_NAME)
+    # shards of an earlier export, or left only with replaced datapoints
+    for path in out_folder.glob("shard-*.tar"):
+        if path.name not in index["shards"]:
+            os.remove(path)
+    print(f"Packed {len(dp_folders)} datapoints into {len(shards)} shards in {out_folder}")
+
+    return index
+
+
+class PackedDataset:
+    """
+    Random access to datapoints of a packed dataset, and sequential streaming of shards
+    """
+
+    def __init__(self, folder: str | Path) -> None:
+        self.folder = Path(folder)
+        with open(self.folder / INDEX_NAME, "r") as f:
+            index = json.load(f)
+        self.shards = index["shards"]
+        self._dps = {int(dp_id): span for dp_id, span in index["dps"].items()}
+        self._fds: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def ids(self) -> List[int]:
+        return sorted(self._dps)
+
+    def __contains__(self, dp_id: int) -> bool:
+        return dp_id in self._dps
+
+    def __len__(self) -> int:
+        return len(self._dps)
+
+    def file_names(self, dp_id: int) -> List[str]:
+        return [name for name, _, _ in self._dps[dp_id][3]]
+
+    def _fd(self, shard_num: int) -> int:
+        with self._lock:
+            if shard_num not in self._fds:
+                path = self.folder / self.shards[shard_num]
+                self._fds[shard_num] = os.open(path, os.O_RDONLY)
+            return self._fds[shard_num]
+
+    def read(self, dp_id: int) -> Dict[str, bytes]:
+        """
+        All files of a datapoint with a single positional read, safe to call from several threads
+        """
+
+        shard_num, start, end, files = self._dps[dp_id]
+        buffer = os.pread(self._fd(shard_num), end - start, start)
+        return {
+            name: buffer[offset - start : offset - start + size]
+            for name, offset, size in files
+        }
+
+    def read_file(self, dp_id: int, name: str) -> bytes:
+        shard_num, _, _, files = self._dps[dp_id]
+        for file_name, offset, size in files:
+            if file_name == name:
+                return os.pread(self._fd(shard_num), size, offset)
+        raise KeyError(f"{name} not in datapoint {dp_id}")
+
+    def stream(self) -> Iterator[Tuple[int, Dict[str, bytes]]]:
+        """
+        Datapoints in shard order, shards are read sequentially without seeks
+        """
+
+        for shard_num, shard_name in enumerate(self.shards):
+            with tarfile.open(self.folder / shard_name, "r|") as tar:
+                current_id, files = None, {}
+                for member in tar:
+                    dp_id, name = member.name.split("/", 1)
+                    if dp_id != current_id and current_id is not None:
+                        yield int(current_id), files
+                        files = {}
+                    # a datapoint packed again later is indexed in its newer shard
+                    if self._dps.get(int(dp_id), [None])[0] != shard_num:
+                        current_id = None
+                        continue
+                    current_id = dp_id
+                    files[name] = tar.extractfile(member).read()
+                if current_id is not None:
+                    yield int(current_id), files
+
+    def close(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
+    def __enter__(self) -> "PackedDataset":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def pack_dataset(config, ids: List[int] | None = None) -> None:
+    """
+    Pack config.dataset_final to config.packed_dataset_path (<dataset_final>_packed by default)
+    """
+
+    dataset_folder = Path(config.dataset_final)
+    out_folder = config.get("packed_dataset_path") or dataset_folder.with_name(
+        dataset_folder.name + "_packed"
+    )
+    pack_dataset_folder(
+        dataset_folder, out_folder, ids, config.get("pack_shard_size", 1 << 30)
+    )
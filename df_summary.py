@@ -0,0 +1,281 @@
+"""
+Text summaries of datapoint dataframes (data_descr.txt) computed directly from data.csv.
+The CSV is parsed with pyarrow and column statistics are computed with vectorized
+pyarrow.compute kernels. Large files are streamed: row, null counts and min/max are exact,
+other statistics come from a uniform sample of rows whose size is bounded by the description length.
+The summary shows a few rows spread evenly over the table, as many as fit in max_chars.
+Dataframes built by data cells are summarized in the same format.
+Summaries are cached by the CSV content hash, so unchanged datapoints are not parsed again.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List
+
+# part of the cache key, change when the summary format changes
+SUMMARY_VERSION = 2
+TOP_VALUES = 3
+# sampled rows of large files per character of the description
+SAMPLE_ROWS_PER_CHAR = 25
+
+
+def file_sha256(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _has_min_max(dtype) -> bool:
+    import pyarrow as pa
+
+    return pa.types.is_integer(dtype) or pa.types.is_floating(dtype) or pa.types.is_temporal(dtype)
+
+
+def _update_exact(exact: List[Dict], batch) -> None:
+    import pyarrow.compute as pc
+
+    for stats, column in zip(exact, batch.columns):
+        stats["nulls"] += column.null_count
+        if not _has_min_max(column.type) or column.null_count == len(column):
+            continue
+        min_max = pc.min_max(column).as_py()
+        if min_max["min"] is not None and (stats["min"] is None or min_max["min"] < stats["min"]):
+            stats["min"] = min_max["min"]
+        if min_max["max"] is not None and (stats["max"] is None or min_max["max"] > stats["max"]):
+            stats["max"] = min_max["max"]
+
+
+def read_csv_table(csv_path: str | Path, max_bytes: int = 64 << 20, sample_rows: int = 100_000):
+    """
+    Returns the table, its number of rows and exact column statistics.
+    Files larger than max_bytes are streamed and about sample_rows uniformly sampled rows are kept,
+    null counts and min/max of every column ({"nulls", "min", "max"}) are computed over all rows then.
+    Exact statistics are None for tables read whole
+    """
+
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    # empty strings are missing values, as in pandas.read_csv
+    convert_options = pa_csv.ConvertOptions(strings_can_be_null=True)
+    size = os.path.getsize(csv_path)
+    if size <= max_bytes:
+        table = pa_csv.read_csv(csv_path, convert_options=convert_options)
+        return table, table.num_rows, None
+
+    rng = np.random.default_rng(0)
+    reader = pa_csv.open_csv(csv_path, convert_options=convert_options)
+    exact = [{"nulls": 0, "min": None, "max": None} for _ in reader.schema]
+    batches, num_rows, rate = [], 0, None
+    for batch in reader:
+        if rate is None:
+            # rows in the file estimated from the bytes of the first batch
+            row_bytes = max(batch.nbytes / max(batch.num_rows, 1), 1)
+            rate = min(1.0, sample_rows / (size / row_bytes))
+        num_rows += batch.num_rows
+        _update_exact(exact, batch)
+        batches.append(batch.filter(pa.array(rng.random(batch.num_rows) < rate)))
+
+    return pa.Table.from_batches(batches, schema=reader.schema), num_rows, exact
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def column_stats(column, exact: Dict | None = None) -> str:
+    """
+    exact min/max of the whole column if the column is a sample
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    dtype = column.type
+    if _has_min_max(dtype):
+        min_max = exact if exact is not None else pc.min_max(column).as_py()
+        if min_max["min"] is None:
+            return "all values missing"
+        if pa.types.is_temporal(dtype):
+            return f"min {min_max['min']}, max {min_max['max']}"
+
+        stats = [f"min {_format_value(min_max['min'])}", f"max {_format_value(min_max['max'])}"]
+        mean = pc.mean(column).as_py()
+        if mean is not None:
+            stats.append(f"mean {_format_value(mean)}")
+        std = pc.stddev(column, ddof=1).as_py()
+        if std is not None:
+            stats.append(f"std {_format_value(std)}")
+        return ", ".join(stats)
+
+    if column.null_count == len(column):
+        return "all values missing"
+
+    if pa.types.is_boolean(dtype):
+        return f"true {pc.sum(column).as_py()}"
+
+    counts = pc.value_counts(column.drop_null())
+    order = pc.sort_indices(counts.field("counts"), sort_keys=[("", "descending")])
+    top = counts.take(order[:TOP_VALUES]).to_pylist()
+    return "top: " + ", ".join(f"{item['values']} ({item['counts']})" for item in top)
+
+
+def sample_indices(num_rows: int, size: int):
+    """
+    size row indices spread evenly from the first to the last row
+    """
+
+    if size >= num_rows:
+        return list(range(num_rows))
+    if size == 1:
+        return [0]
+    step = (num_rows - 1) / (size - 1)
+    return sorted({round(i * step) for i in range(size)})
+
+
+def summarize_table(
+    table,
+    num_rows: int | None = None,
+    max_rows: int = 10,
+    max_chars: int = 4000,
+    exact: List[Dict] | None = None,
+) -> str:
+    """
+    num_rows and exact column statistics (see read_csv_table) of the whole file
+    if the table is a sample of it
+    """
+
+    import pyarrow.compute as pc
+
+    num_rows = num_rows if num_rows is not None else table.num_rows
+    lines = [f"Dataframe shape: {num_rows} rows x {table.num_columns} columns"]
+    if num_rows > table.num_rows:
+        lines.append(f"Unique counts, mean, std and top values of {table.num_rows} sampled rows")
+    lines.append("")
+
+    header = ("column", "dtype", "non-null", "unique", "stats")
+    rows = []
+    for i, (name, column) in enumerate(zip(table.column_names, table.columns)):
+        column_exact = exact[i] if exact is not None else None
+        non_null = len(column) - column.null_count
+        if column_exact is not None:
+            non_null = num_rows - column_exact["nulls"]
+        rows.append(
+            (
+                name,
+                str(column.type),
+                str(non_null),
+                str(pc.count_distinct(column).as_py() if column.null_count < len(column) else 0),
+                column_stats(column, column_exact),
+            )
+        )
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(4)]
+    for row in [header] + rows:
+        cells = [cell.ljust(width) for cell, width in zip(row[:4], widths)]
+        lines.append("  ".join(cells + [row[4]]).rstrip())
+
+    summary = "\n".join(lines)
+
+    # as many rows spread over the table as fit in the description
+    for size in range(min(max_rows, table.num_rows), 0, -1):
+        indices = sample_indices(table.num_rows, size)
+        sample = table.take(indices).to_pandas()
+        if num_rows == table.num_rows:
+            sample.index = indices
+        rows_text = f"\n\nRows ({size} of {num_rows}):\n" + sample.to_string()
+        if len(summary) + len(rows_text) <= max_chars:
+            return summary + rows_text
+
+    return summary
+
+
+class SummaryCache:
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def beside(cls, dataset_folder: str | Path) -> "SummaryCache":
+        return cls(Path(dataset_folder).resolve().parent / "summary_cache")
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key[2:]}.txt"
+
+    def get(self, key: str) -> str | None:
+        path = self.path(key)
+        if not path.exists():
+            return None
+        with open(path, "r") as f:
+            return f.read()
+
+    def put(self, key: str, summary: str) -> None:
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            f.write(summary)
+        os.replace(temp_path, path)
+
+
+def summarize_csv(
+    csv_path: str | Path,
+    cache: SummaryCache | None = None,
+    max_rows: int = 10,
+    max_chars: int = 4000,
+) -> str:
+    key = None
+    if cache is not None:
+        params = f"{SUMMARY_VERSION}:{max_rows}:{max_chars}:{file_sha256(csv_path)}"
+        key = hashlib.sha256(params.encode()).hexdigest()
+        summary = cache.get(key)
+        if summary is not None:
+            return summary
+
+    table, num_rows, exact = read_csv_table(
+        csv_path, sample_rows=SAMPLE_ROWS_PER_CHAR * max_chars
+    )
+    summary = summarize_table(table, num_rows, max_rows, max_chars, exact)
+    if cache is not None:
+        cache.put(key, summary)
+
+    return summary
+
+
+def _arrow_column(series):
+    import pyarrow as pa
+
+    try:
+        array = pa.array(series, from_pandas=True)
+    except (pa.ArrowException, TypeError, ValueError):
+        # mixed types in an object column
+        array = pa.array(series.astype(str).where(series.notna(), None), from_pandas=True)
+    # pandas string columns convert to large_string, the CSV reader gives string
+    if pa.types.is_large_string(array.type):
+        array = array.cast(pa.string())
+
+    return array
+
+
+def summarize_dataframe(df, max_rows: int = 10, max_chars: int = 4000) -> str:
+    """
+    Summary of a pandas dataframe in the format of summarize_csv
+    """
+
+    import pandas as pd
+    import pyarrow as pa
+
+    # a set index (e.g. dates) is shown as the first column
+    if not isinstance(df.index, pd.RangeIndex):
+        df = df.reset_index()
+    table = pa.table(
+        [_arrow_column(df.iloc[:, i]) for i in range(df.shape[1])],
+        names=[str(name) for name in df.columns],
+    )
+
+    return summarize_table(table, max_rows=max_rows, max_chars=max_chars)
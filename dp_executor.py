@@ -0,0 +1,93 @@
+"""
+Parallel execution of a step function over datapoint folders.
+fn(dp_folder) runs in worker processes with the absolute datapoint folder as an argument,
+it must not change the working directory. Exceptions are captured per datapoint,
+so one broken datapoint does not stop the step. Results come back in the order of folders.
+fn has to be picklable: a module-level function or a partial of one.
+"""
+
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, List
+
+from tqdm import tqdm
+
+
+@dataclass
+class DPResult:
+    dp_folder: Path
+    # return value of fn
+    value: Any = None
+    # formatted traceback if fn raised
+    error: str | None = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _run(fn: Callable[[Path], Any], dp_folder: Path) -> DPResult:
+    start = time.perf_counter()
+    try:
+        value = fn(dp_folder)
+    except Exception:
+        return DPResult(
+            dp_folder, error=traceback.format_exc(), duration=time.perf_counter() - start
+        )
+
+    return DPResult(dp_folder, value, duration=time.perf_counter() - start)
+
+
+def dp_map(
+    fn: Callable[[Path], Any],
+    folders: List[Path],
+    workers: int | None = None,
+    desc: str | None = None,
+) -> List[DPResult]:
+    """
+    Run fn for every datapoint folder on a process pool (workers=1 runs in this process).
+    Prints throughput and the last line of the traceback of failed datapoints
+    """
+
+    folders = [Path(folder).resolve() for folder in folders]
+    if len(folders) == 0:
+        return []
+
+    workers = min(workers or os.cpu_count() or 1, len(folders))
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_run(fn, folder) for folder in tqdm(folders, desc=desc)]
+    else:
+        # a few chunks per worker, datapoints differ a lot in run time
+        chunksize = max(1, len(folders) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(
+                tqdm(
+                    pool.map(partial(_run, fn), folders, chunksize=chunksize),
+                    total=len(folders),
+                    desc=desc,
+                )
+            )
+
+    report(results, time.perf_counter() - start, workers, desc)
+
+    return results
+
+
+def report(results: List[DPResult], elapsed: float, workers: int, desc: str | None) -> None:
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        print(f"dp {result.dp_folder.name}: {result.error.strip().splitlines()[-1]}")
+
+    rate = len(results) / elapsed if elapsed > 0 else float("inf")
+    prefix = f"{desc}: " if desc else ""
+    print(
+        f"{prefix}{len(results)} datapoints in {elapsed:.1f} s ({rate:.1f} dp/s, "
+        f"{workers} workers), {len(failed)} failed"
+    )
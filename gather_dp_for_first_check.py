@@ -2,14 +2,16 @@ import os
 import shutil
 from pathlib import Path
 
-from omegaconf import OmegaConf
+from omegaconf import DictConfig, OmegaConf
 from tqdm import tqdm
 
 from data import get_dp_folders
 
-if __name__ == "__main__":
-    config_path = "configs/config.yaml"
-    config = OmegaConf.load(config_path)
+def gather_for_first_check(config: DictConfig) -> None:
+    """
+    Copy split notebooks to valid_dp/invalid_dp folders depending on presence of all datapoint files
+    """
+
     dataset_folder = Path(config.matplotlib_dataset_path)
 
     dp_folders = get_dp_folders(dataset_folder)
@@ -46,3 +48,7 @@ if __name__ == "__main__":
                 dp_folder / "split_data.ipynb",
                 invalid_dp_folder / f"split_data_{idx}.ipynb",
             )
+
+
+if __name__ == "__main__":
+    gather_for_first_check(OmegaConf.load("configs/config.yaml"))
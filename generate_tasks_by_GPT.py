@@ -1,37 +1,49 @@
+import asyncio
 import glob
 import json
 import os
 import random
 from pathlib import Path
+from typing import List
 
+from omegaconf import DictConfig, OmegaConf
 from tqdm import tqdm
 
+from background_writer import writer_from_config
+from batch_api import BatchClient, run_batch
 from data import get_dp_folders
 from GPT4V_backbone import GPT4V
+from image_encoding import configure_image_encoder
 from LLM_utils import generate_task_request, prepare_pipeline
+from preflight import TPMScheduler, dry_run_report, estimate_items, order_by_tokens
+from response_cache import cache_from_config
+from streaming import task_prefix_validator
+from transport import configure_transport
+from utils import filter_dp_folders
 
-if __name__ == "__main__":
-    # TODO use prepare_pipeline function instead
 
-    config_path = "configs/config.yaml"
+def generate_tasks(config: DictConfig, ids: List[int] | None = None) -> None:
     out_filename = "gpt_tasks.jsonl"
-    pipline_parameters = prepare_pipeline(
-        config_path, out_filename, "prompts/task_gen.json"
-    )
+    pipline_parameters = prepare_pipeline(config, out_filename, "prompts/task_gen.json")
     pipline_parameters.dataset_folder = pipline_parameters.config.dataset_valid_step_1
 
+    transport = configure_transport(pipline_parameters.config)
     gpt4v = GPT4V(
         api_key=pipline_parameters.openai_token,
         system_prompt=pipline_parameters.instructs["system prompt"],
+        cache=cache_from_config(pipline_parameters.config),
+        transport=transport,
+        image_encoder=configure_image_encoder(pipline_parameters.config),
     )
 
     dp_folders = get_dp_folders(pipline_parameters.dataset_folder)
-    responses = []
+    dp_folders = filter_dp_folders(dp_folders, ids)
     # dp_folders = dp_folders[:2]
     # dp_folders = random.sample(dp_folders, 20)
-    for i, dp_folder in tqdm(enumerate(dp_folders), total=len(dp_folders)):
+    items = []
+    for dp_folder in dp_folders:
         index = int(dp_folder.name)
-        if index in pipline_parameters.existing_ids:
+        if index in pipline_parameters.results:
             continue
 
         code_file = dp_folder / "plot.py"
@@ -46,15 +58,69 @@ if __name__ == "__main__":
             df_summary = f.read()
 
         request = generate_task_request(code, df_summary, pipline_parameters.instructs)
-        response = gpt4v.make_request(
-            request=request, images=plot_files, image_detail="low"
+        items.append(
+            {"id": index, "request": request, "images": plot_files, "image_detail": "low"}
         )
 
-        if response is None:
+    estimates = estimate_items(
+        items,
+        gpt4v.model_name,
+        gpt4v.system_prompt,
+        output_tokens=config.get("task_output_tokens", 400),
+        cache_dir=config.get("tiktoken_cache_dir"),
+    )
+    items = order_by_tokens(items)
+    tpm, rpm = config.get("tpm_limit", 300000), config.get("rpm_limit", 500)
+    batch_mode = config.get("batch_mode", False)
+
+    async def gather_responses():
+        responses = gpt4v.make_requests_many(
+            items,
+            max_concurrency=config.get("max_concurrency", 8),
+            scheduler=TPMScheduler(tpm, rpm),
+            validator=task_prefix_validator if config.get("stream", False) else None,
+        )
+        progress = tqdm(total=len(items))
+        with writer_from_config(pipline_parameters.results, config) as writer:
+            async for response in responses:
+                progress.update(1)
+                if "error" in response:
+                    print(f"Skipping dp {response['id']}")
+                    continue
+
+                writer.put(response)
+        progress.close()
+
+    if config.get("dry_run", False):
+        report = dry_run_report(
+            "generate_tasks", estimates, gpt4v.model_name, tpm, rpm, batch=batch_mode
+        )
+        print(json.dumps(report, indent=2))
+    elif batch_mode:
+        client = BatchClient(
+            api_key=pipline_parameters.openai_token,
+            base_url=config.get("openai_base_url", "https://api.openai.com/v1"),
+            transport=transport,
+        )
+        failed_ids = run_batch(
+            gpt4v,
+            items,
+            pipline_parameters.results,
+            client,
+            work_folder=pipline_parameters.out_folder / "batch_tasks",
+            poll_interval=config.get("batch_poll_interval", 60),
+        )
+        for index in failed_ids:
             print(f"Skipping dp {index}")
-        else:
-            response["id"] = index
-            responses.append(response)
-            with open(pipline_parameters.output_file, "a") as f:
-                json.dump(response, f)
-                f.write("\n")
+    else:
+        asyncio.run(gather_responses())
+
+    pipline_parameters.results.save_index()
+    print(f"HTTP timings: {transport.timing_summary()}")
+    print(f"Image encoding: {gpt4v.image_encoder.stats()}")
+    if gpt4v.cache is not None:
+        print(f"Response cache: {gpt4v.cache.stats()}")
+
+
+if __name__ == "__main__":
+    generate_tasks(OmegaConf.load("configs/config.yaml"))
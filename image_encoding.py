@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def target_size(width: int, height: int, image_detail: str) -> Tuple[int, int]:
+    """
+    Resolution the OpenAI vision models actually use for the given detail level.
+    low: image is fit into 512x512.
+    high/auto: image is fit into 2048x2048, then the shortest side is scaled to 768.
+    Images are never upscaled.
+    """
+
+    if image_detail == "low":
+        scale = min(1.0, 512 / max(width, height))
+    else:
+        scale = min(1.0, 2048 / max(width, height))
+        scale *= min(1.0, 768 / (min(width, height) * scale))
+
+    return max(1, math.floor(width * scale)), max(1, math.floor(height * scale))
+
+
+class ImageEncoder:
+    """
+    Memoized image encoder for vision requests.
+    Images are keyed by the content hash, downscaled to the resolution used by image_detail
+    and optionally transcoded to JPEG/WebP. Each image is encoded once per (detail, format).
+    """
+
+    def __init__(
+        self,
+        image_format: str = "png",
+        quality: int = 85,
+        downscale: bool = True,
+        max_entries: int = 4096,
+    ) -> None:
+        if image_format not in MIME_TYPES:
+            raise ValueError(f"Unsupported image format {image_format}")
+
+        self.image_format = image_format
+        self.quality = quality
+        self.downscale = downscale
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        self._cache: OrderedDict[tuple, str] = OrderedDict()
+        # path -> (mtime_ns, size, sha256) to avoid re-reading unchanged files
+        self._path_hashes: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def encode_path(self, image_path: str | Path, image_detail: str = "auto") -> str:
+        """
+        Returns data URL of the image file
+        """
+
+        image_path = str(image_path)
+        file_stat = os.stat(image_path)
+        stamp = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        cached_hash = self._path_hashes.get(image_path)
+        if cached_hash is not None and cached_hash[:2] == stamp:
+            data_url = self._lookup((cached_hash[2], image_detail))
+            if data_url is not None:
+                return data_url
+
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+        content_hash = hashlib.sha256(image_bytes).hexdigest()
+        self._path_hashes[image_path] = stamp + (content_hash,)
+
+        return self._encode(image_bytes, content_hash, image_detail)
+
+    def encode_bytes(self, image_bytes: bytes, image_detail: str = "auto") -> str:
+        content_hash = hashlib.sha256(image_bytes).hexdigest()
+        return self._encode(image_bytes, content_hash, image_detail)
+
+    def _lookup(self, key: tuple) -> str | None:
+        with self._lock:
+            data_url = self._cache.get(key)
+            if data_url is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        return data_url
+
+    def _encode(self, image_bytes: bytes, content_hash: str, image_detail: str) -> str:
+        key = (content_hash, image_detail)
+        data_url = self._lookup(key)
+        if data_url is not None:
+            return data_url
+
+        encoded_bytes, image_format = self._transcode(image_bytes, image_detail)
+        encoded = base64.b64encode(encoded_bytes).decode("utf-8")
+        data_url = f"data:{MIME_TYPES[image_format]};base64,{encoded}"
+
+        with self._lock:
+            self.misses += 1
+            self.bytes_in += len(image_bytes)
+            self.bytes_out += len(encoded_bytes)
+            self._cache[key] = data_url
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+        return data_url
+
+    def _transcode(self, image_bytes: bytes, image_detail: str) -> Tuple[bytes, str]:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(image_bytes))
+        source_format = (image.format or "").lower()
+
+        size = image.size
+        if self.downscale:
+            size = target_size(image.width, image.height, image_detail)
+        resized = size != image.size
+        if not resized and source_format == self.image_format:
+            return image_bytes, source_format
+
+        if resized:
+            image = image.resize(size, Image.LANCZOS)
+
+        out = io.BytesIO()
+        if self.image_format == "jpeg":
+            if image.mode in ("RGBA", "LA", "P"):
+                # plots are drawn on white, so flatten transparency on white
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            image.convert("RGB").save(out, format="JPEG", quality=self.quality, optimize=True)
+        elif self.image_format == "webp":
+            image.save(out, format="WEBP", quality=self.quality, method=4)
+        else:
+            image.save(out, format="PNG", optimize=True)
+        encoded_bytes = out.getvalue()
+
+        # transcoding without resizing may produce a larger file, keep the original then
+        if not resized and len(encoded_bytes) >= len(image_bytes) and source_format in MIME_TYPES:
+            return image_bytes, source_format
+
+        return encoded_bytes, self.image_format
+
+
+_shared_encoder: ImageEncoder | None = None
+
+
+def get_image_encoder() -> ImageEncoder:
+    global _shared_encoder
+    if _shared_encoder is None:
+        _shared_encoder = ImageEncoder()
+    return _shared_encoder
+
+
+def configure_image_encoder(config) -> ImageEncoder:
+    global _shared_encoder
+    _shared_encoder = ImageEncoder(
+        image_format=config.get("image_format", "png"),
+        quality=config.get("image_quality", 85),
+        downscale=config.get("image_downscale", True),
+    )
+    return _shared_encoder
@@ -0,0 +1,250 @@
+"""
+Dataset-wide store of plot images.
+Ingested PNGs are losslessly recompressed, kept once in a content-addressed blob store
+and hardlinked into datapoint folders, so copies between dataset stages share disk space.
+A difference hash (dHash) of every image is recorded to flag near-duplicate plots.
+Blobs are read-only: an image in a datapoint folder is replaced by unlinking it first,
+writing to it in place would change every datapoint sharing the blob.
+"""
+
+import errno
+import hashlib
+import io
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Dict, Hashable, List
+
+from blob_store import BLOB_PREFIX, BlobStore
+from result_store import ResultStore
+
+INDEX_NAME = "images.jsonl"
+DUPLICATES_NAME = "near_duplicates.json"
+HASH_BITS = 64
+
+
+@dataclass
+class ImageRecord:
+    # reference of the optimized image in the blob store
+    ref: str
+    # 64-bit difference hash as a hex string
+    dhash: str
+    size: int
+    original_size: int
+
+
+def optimize_png(data: bytes) -> bytes:
+    """
+    Lossless recompression, the original is kept if it is not larger.
+    Pixels, mode and dpi stay the same, text chunks are dropped
+    """
+
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format != "PNG":
+            return data
+        kwargs = {"dpi": image.info["dpi"]} if "dpi" in image.info else {}
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True, **kwargs)
+
+    optimized = buffer.getvalue()
+    return optimized if len(optimized) < len(data) else data
+
+
+def dhash(data: bytes, hash_size: int = 8) -> int:
+    """
+    Difference hash: sign of horizontal gradients of a (hash_size + 1) x hash_size grayscale thumbnail
+    """
+
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        thumbnail = image.convert("L").resize(
+            (hash_size + 1, hash_size), Image.LANCZOS
+        )
+    pixels = list(thumbnail.tobytes())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def find_near_duplicates(
+    hashes: Dict[Hashable, int], max_distance: int = 4
+) -> List[List[Hashable]]:
+    """
+    Groups of keys with hashes within max_distance bits of each other (transitively).
+    Hashes are split into max_distance + 1 bands, two hashes this close agree on at least one band,
+    so only keys sharing a band are compared
+    """
+
+    bands = max_distance + 1
+    width = HASH_BITS // bands
+    buckets = {}
+    for key, value in hashes.items():
+        for band in range(bands):
+            shift = band * width
+            bits = width if band < bands - 1 else HASH_BITS - shift
+            bucket = (band, (value >> shift) & ((1 << bits) - 1))
+            buckets.setdefault(bucket, []).append(key)
+
+    parent = {key: key for key in hashes}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for keys in buckets.values():
+        for i, first in enumerate(keys):
+            for second in keys[i + 1 :]:
+                if find(first) != find(second) and (
+                    hamming(hashes[first], hashes[second]) <= max_distance
+                ):
+                    parent[find(first)] = find(second)
+
+    groups = {}
+    for key in hashes:
+        groups.setdefault(find(key), []).append(key)
+
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def link_or_copy(source: str | Path, target: str | Path) -> None:
+    """
+    Hardlink source to target, copy if linking is not possible (other filesystem, no support)
+    """
+
+    target = Path(target)
+    if target.exists() or target.is_symlink():
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copyfile(source, target)
+
+
+class ImageStore:
+    def __init__(self, root: str | Path) -> None:
+        self.blobs = BlobStore(root)
+        self.root = self.blobs.root
+        # keyed by the reference of the ingested bytes, so re-ingesting skips optimization
+        self.index = ResultStore(self.root / INDEX_NAME)
+
+    @classmethod
+    def beside(cls, dataset_folder: str | Path) -> "ImageStore":
+        """
+        Store shared by datasets in the same parent folder, next to them on the same filesystem
+        """
+
+        return cls(Path(dataset_folder).resolve().parent / "image_store")
+
+    def ingest(self, data: bytes) -> ImageRecord:
+        original_ref = BLOB_PREFIX + hashlib.sha256(data).hexdigest()
+        if original_ref in self.index:
+            entry = self.index[original_ref]
+            if entry["ref"] in self.blobs:
+                return ImageRecord(
+                    entry["ref"], entry["dhash"], entry["size"], entry["original_size"]
+                )
+
+        optimized = optimize_png(data)
+        ref = self.blobs.put(optimized)
+        os.chmod(self.blobs.path(ref), 0o444)
+        record = ImageRecord(
+            ref, f"{dhash(optimized):016x}", len(optimized), len(data)
+        )
+        self.index.upsert({"id": original_ref, **record.__dict__})
+        if ref != original_ref:
+            # images read back from datapoint folders are the optimized bytes
+            self.index.upsert({"id": ref, **record.__dict__})
+
+        return record
+
+    def write(self, data: bytes, target: str | Path) -> ImageRecord:
+        """
+        Ingest image bytes and link the stored image to target
+        """
+
+        record = self.ingest(data)
+        link_or_copy(self.blobs.path(record.ref), target)
+        return record
+
+    def ingest_file(self, path: str | Path) -> ImageRecord:
+        """
+        Replace an image file by a link to its stored (optimized) copy
+        """
+
+        with open(path, "rb") as f:
+            data = f.read()
+        return self.write(data, path)
+
+    def records(self) -> Dict[str, ImageRecord]:
+        records = {}
+        for entry in self.index.values():
+            records[entry["ref"]] = ImageRecord(
+                entry["ref"], entry["dhash"], entry["size"], entry["original_size"]
+            )
+        return records
+
+    def close(self) -> None:
+        self.index.close()
+
+
+def ingest_dp_images(dp_folder: Path, store: ImageStore) -> Dict[str, ImageRecord]:
+    return {
+        image_path.name: store.ingest_file(image_path)
+        for image_path in sorted(dp_folder.glob("*.png"))
+    }
+
+
+def ingest_dataset_images(folder, ids=None, max_distance=4, store=None, workers=None):
+    """
+    Move plot images of all datapoints to the image store and write
+    near-duplicate groups of datapoint images to <folder>/near_duplicates.json
+    """
+
+    from data import get_dp_folders
+    from dp_executor import dp_map
+    from utils import filter_dp_folders
+
+    folder = Path(folder)
+    store = store or ImageStore.beside(folder)
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
+
+    results = dp_map(partial(ingest_dp_images, store=store), dp_folders, workers, "ingest_images")
+    store.index.refresh()
+    store.index.save_index()
+
+    hashes = {}
+    original_size, size = 0, 0
+    for result in results:
+        for name, record in (result.value or {}).items():
+            hashes[f"{result.dp_folder.name}/{name}"] = int(record.dhash, 16)
+            original_size += record.original_size
+            size += record.size
+
+    groups = find_near_duplicates(hashes, max_distance)
+    with open(folder / DUPLICATES_NAME, "w") as f:
+        json.dump(groups, f, indent=1)
+
+    unique = len({value for value in hashes.values()})
+    print(
+        f"{len(hashes)} images, {unique} distinct hashes, {len(groups)} near-duplicate groups, "
+        f"{original_size / 2**20:.1f} MB -> {size / 2**20:.1f} MB"
+    )
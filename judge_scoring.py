@@ -0,0 +1,186 @@
+"""
+Vectorized scoring of judge responses requested with top_logprobs (see GPT4V.construct_logit_args).
+All judgments are loaded into an (ids x score options) logprob matrix and scored in one pass.
+"""
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+SCORE_OPTIONS = [str(i) for i in range(11)]
+
+
+@dataclass
+class JudgeLogprobs:
+    ids: np.ndarray
+    # numeric value of every score option
+    values: np.ndarray
+    # (n_ids, n_options), -inf where the option is absent from top_logprobs
+    logprobs: np.ndarray
+
+
+def load_judge_logprobs(
+    response_file: str | Path, options: List[str] = SCORE_OPTIONS
+) -> JudgeLogprobs:
+    option_index = {option: i for i, option in enumerate(options)}
+    ids = []
+    rows = []
+    with open(response_file, "r") as file:
+        for line in file:
+            entry = json.loads(line)
+            if entry.get("id") is None:
+                continue
+            logprobs = entry["choices"][0].get("logprobs")
+            if not logprobs:
+                continue
+
+            row = np.full(len(options), -np.inf)
+            for top in logprobs["content"][0]["top_logprobs"]:
+                column = option_index.get(top["token"].strip())
+                # the same option can appear with and without a leading space
+                if column is not None:
+                    row[column] = np.logaddexp(row[column], top["logprob"])
+            ids.append(entry["id"])
+            rows.append(row)
+
+    logprobs = np.vstack(rows) if rows else np.empty((0, len(options)))
+
+    return JudgeLogprobs(
+        ids=np.asarray(ids),
+        values=np.asarray([float(option) for option in options]),
+        logprobs=logprobs,
+    )
+
+
+def option_probs(logprobs: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+    """
+    Probabilities renormalized over score options, with temperature scaling
+    """
+
+    logits = logprobs / temperature
+    max_logits = np.max(logits, axis=1, keepdims=True)
+    # rows without any option would give nan, keep them as zeros
+    max_logits = np.where(np.isfinite(max_logits), max_logits, 0.0)
+    probs = np.exp(logits - max_logits)
+    norm = probs.sum(axis=1, keepdims=True)
+
+    return np.divide(probs, norm, out=np.zeros_like(probs), where=norm > 0)
+
+
+def answered_rows(logprobs: np.ndarray) -> np.ndarray:
+    """
+    Rows with at least one score option in top_logprobs
+    """
+
+    return np.isfinite(logprobs).any(axis=1)
+
+
+def score_judgments(
+    judgments: JudgeLogprobs, temperature: float = 1.0
+) -> Dict[str, np.ndarray]:
+    """
+    Scores of judgments without any score option in top_logprobs are nan
+    """
+
+    probs = option_probs(judgments.logprobs, temperature)
+    log_probs = np.log(probs, out=np.zeros_like(probs), where=probs > 0)
+    answered = answered_rows(judgments.logprobs)
+
+    return {
+        "ids": judgments.ids,
+        "answered": answered,
+        "expected": np.where(answered, probs @ judgments.values, np.nan),
+        "argmax": np.where(
+            answered, judgments.values[np.argmax(judgments.logprobs, axis=1)], np.nan
+        ),
+        "entropy": np.where(answered, -(probs * log_probs).sum(axis=1), np.nan),
+        # probability mass the model put on the score options before renormalization
+        "coverage": np.exp(judgments.logprobs).sum(axis=1),
+        "probs": probs,
+    }
+
+
+def fit_temperature(
+    judgments: JudgeLogprobs,
+    reference_scores: np.ndarray,
+    temperatures: np.ndarray = np.linspace(0.25, 5.0, 96),
+) -> float:
+    """
+    Temperature minimizing NLL of reference scores (e.g. human labels) for all judgments at once.
+    Judgments whose reference score is not among their top_logprobs (including judgments
+    without any score option) have infinite NLL at every temperature and are left out.
+    Reference scores that are not score options raise ValueError
+    """
+
+    unknown = ~np.isin(reference_scores, judgments.values)
+    if unknown.any():
+        unknown_scores = np.unique(reference_scores[unknown])
+        raise ValueError(f"Reference scores {unknown_scores} are not score options")
+    targets = np.searchsorted(judgments.values, reference_scores)
+    target_logprobs = np.take_along_axis(judgments.logprobs, targets[:, None], axis=1)[:, 0]
+    usable = np.isfinite(target_logprobs)
+    if not usable.any():
+        raise ValueError("No judgment has its reference score among the top_logprobs")
+    logprobs, targets = judgments.logprobs[usable], targets[usable]
+
+    # (n_temperatures, n_ids, n_options)
+    logits = logprobs[None, :, :] / temperatures[:, None, None]
+    log_norm = np.logaddexp.reduce(logits, axis=2)
+    target_logits = np.take_along_axis(
+        logits, np.broadcast_to(targets[None, :, None], logits.shape[:2] + (1,)), axis=2
+    )[..., 0]
+    nll = (log_norm - target_logits).mean(axis=1)
+
+    return float(temperatures[np.argmin(nll)])
+
+
+def aggregate_by_class(
+    values: np.ndarray, classes: np.ndarray
+) -> Dict[str, Dict[str, float]]:
+    """
+    Count, mean and std of values per plot_class, nan values are not counted
+    """
+
+    class_names, inverse = np.unique(classes, return_inverse=True)
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0.0)
+    counts = np.bincount(inverse, weights=valid, minlength=len(class_names))
+    sums = np.bincount(inverse, weights=values, minlength=len(class_names))
+    squares = np.bincount(inverse, weights=values**2, minlength=len(class_names))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        stds = np.sqrt(np.maximum(squares / counts - means**2, 0.0))
+
+    return {
+        str(name): {"count": int(count), "mean": float(mean), "std": float(std)}
+        for name, count, mean, std in zip(class_names, counts, means, stds)
+    }
+
+
+def load_plot_classes(dataset_folder: str | Path, ids: np.ndarray) -> np.ndarray:
+    plot_classes = []
+    for idx in ids:
+        with open(Path(dataset_folder) / str(idx) / "info.json", "r") as f:
+            plot_classes.append(json.load(f)["plot_class"])
+
+    return np.asarray(plot_classes)
+
+
+def summarize_judgments(
+    response_file: str | Path, dataset_folder: str | Path, temperature: float = 1.0
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Per plot_class aggregates of expected and argmax scores and entropy
+    """
+
+    judgments = load_judge_logprobs(response_file)
+    scores = score_judgments(judgments, temperature)
+    classes = load_plot_classes(dataset_folder, judgments.ids)
+
+    return {
+        metric: aggregate_by_class(scores[metric], classes)
+        for metric in ["expected", "argmax", "entropy"]
+    }
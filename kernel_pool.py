@@ -0,0 +1,253 @@
+"""
+In-process notebook execution on a pool of warm Jupyter kernels, replacing
+`jupyter nbconvert --execute --to notebook --inplace` calls.
+Every worker thread owns one kernel with plotting libraries pre-imported,
+resets its state before each notebook and runs notebooks from a shared queue.
+As with nbconvert, a notebook is written back in place only if all cells ran without errors.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import List
+
+from sandbox import SandboxLimits, apply_limits
+
+PRELOAD_CODE = """
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy
+import pandas
+"""
+
+# modules stay imported, so the user namespace, cwd, open figures and matplotlib settings
+# (rcParams and styles) are reset. %matplotlib inline applies the inline backend settings
+# again, as in a fresh kernel
+RESET_CODE = """
+%reset -f
+import os
+os.chdir({cwd!r})
+import matplotlib
+import matplotlib.pyplot as plt
+plt.close("all")
+matplotlib.rcdefaults()
+%matplotlib inline
+"""
+
+_STOP = object()
+
+
+@dataclass
+class NotebookRun:
+    path: str
+    # ok, error, timeout, oom or dead (kernel died, it is restarted for the next notebook)
+    status: str
+    error: str | None = None
+    duration: float = 0.0
+
+
+class KernelPool:
+    def __init__(
+        self,
+        size: int | None = None,
+        timeout: float = 600,
+        kernel_name: str = "python3",
+        startup_timeout: float = 60,
+        preload_code: str = PRELOAD_CODE,
+        limits: SandboxLimits | None = None,
+    ) -> None:
+        self.size = size if size is not None else os.cpu_count() or 1
+        self.timeout = timeout
+        self.kernel_name = kernel_name
+        self.startup_timeout = startup_timeout
+        self.preload_code = preload_code
+        self.limits = limits
+
+        self._jobs = queue.Queue()
+        self._workers: List[threading.Thread] = []
+
+    def start(self) -> "KernelPool":
+        for i in range(self.size):
+            worker = threading.Thread(
+                target=self._worker, name=f"kernel-pool-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+        return self
+
+    def _start_kernel(self):
+        from jupyter_client.manager import AsyncKernelManager
+        from jupyter_core.utils import run_sync
+
+        km = AsyncKernelManager(kernel_name=self.kernel_name)
+        kwargs = {}
+        if self.limits is not None:
+            # kernels run many notebooks, so CPU time is bounded by the timeout instead.
+            # Network is not denied, the kernel talks to its client over sockets
+            limits = replace(self.limits, cpu_seconds=None)
+            kwargs["preexec_fn"] = lambda: apply_limits(limits)
+        run_sync(km.start_kernel)(**kwargs)
+        kc = km.client()
+        try:
+            kc.start_channels()
+            run_sync(kc.wait_for_ready)(timeout=self.startup_timeout)
+            self._run_code(kc, self.preload_code, self.startup_timeout)
+        except BaseException:
+            self._stop_kernel(km, kc)
+            raise
+
+        return km, kc
+
+    @staticmethod
+    def _run_code(kc, code: str, timeout: float) -> None:
+        from jupyter_core.utils import run_sync
+
+        reply = run_sync(kc.execute_interactive)(
+            code, timeout=timeout, output_hook=lambda msg: None
+        )
+        if reply["content"]["status"] != "ok":
+            raise RuntimeError(f"Kernel setup failed: {reply['content'].get('evalue')}")
+
+    @staticmethod
+    def _stop_kernel(km, kc) -> None:
+        from jupyter_core.utils import run_sync
+
+        kc.stop_channels()
+        try:
+            run_sync(km.shutdown_kernel)(now=True)
+        except Exception as e:
+            print(f"Kernel shutdown failed: {type(e).__name__}: {e}")
+
+    def _worker(self) -> None:
+        # kernel clients are bound to the event loop of the thread that created them
+        kernel = None
+        try:
+            kernel = self._start_kernel()
+        except Exception as e:
+            # started again for the first job, which reports the error if it fails again
+            print(f"Kernel start failed: {type(e).__name__}: {e}")
+
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is _STOP:
+                    break
+                nb_path, timeout, future = job
+                # every job resolves its future, otherwise execute_many would wait forever
+                try:
+                    if kernel is None:
+                        kernel = self._start_kernel()
+                    run = self._execute(*kernel, nb_path, timeout)
+                except BaseException as e:
+                    run = NotebookRun(str(nb_path), "error", f"{type(e).__name__}: {e}")
+                if run.status == "dead":
+                    # restarted for the next job
+                    self._stop_kernel(*kernel)
+                    kernel = None
+                future.set_result(run)
+        finally:
+            if kernel is not None:
+                self._stop_kernel(*kernel)
+
+    def _execute(self, km, kc, nb_path: str | Path, timeout: float) -> NotebookRun:
+        import nbformat
+        from nbclient import NotebookClient
+        from nbclient.exceptions import CellExecutionError, DeadKernelError
+        from jupyter_core.utils import run_sync
+
+        nb_path = Path(nb_path)
+        start = time.perf_counter()
+        with open(nb_path) as f:
+            nb = nbformat.read(f, as_version=4)
+
+        timed_out = threading.Event()
+
+        def interrupt() -> None:
+            timed_out.set()
+            run_sync(km.interrupt_kernel)()
+
+        # interrupting the kernel ends the running cell with KeyboardInterrupt
+        timer = threading.Timer(timeout, interrupt)
+        try:
+            self._run_code(
+                kc, RESET_CODE.format(cwd=str(nb_path.parent.resolve())), timeout
+            )
+            client = NotebookClient(
+                nb, km=km, kernel_name=self.kernel_name, timeout=None
+            )
+            client.kc = kc
+            timer.start()
+            client.execute()
+        except DeadKernelError as e:
+            return NotebookRun(
+                str(nb_path), "dead", str(e), time.perf_counter() - start
+            )
+        except (CellExecutionError, RuntimeError, TimeoutError) as e:
+            if timed_out.is_set():
+                status = "timeout"
+            elif getattr(e, "ename", None) == "MemoryError":
+                status = "oom"
+            else:
+                status = "error"
+            return NotebookRun(str(nb_path), status, str(e), time.perf_counter() - start)
+        finally:
+            timer.cancel()
+
+        with open(nb_path, "w") as f:
+            nbformat.write(nb, f)
+
+        return NotebookRun(str(nb_path), "ok", None, time.perf_counter() - start)
+
+    def submit(self, nb_path: str | Path, timeout: float | None = None) -> Future:
+        future = Future()
+        self._jobs.put((nb_path, timeout or self.timeout, future))
+        return future
+
+    def execute_many(
+        self, nb_paths: List[str | Path], timeout: float | None = None
+    ) -> List[NotebookRun]:
+        """
+        Execute notebooks in parallel, returns runs in the order of nb_paths
+        """
+
+        from tqdm import tqdm
+
+        futures = [self.submit(nb_path, timeout) for nb_path in nb_paths]
+        runs = [future.result() for future in tqdm(futures)]
+        for run in runs:
+            if run.status != "ok":
+                print(f"Notebook {run.path}: {run.status}")
+
+        return runs
+
+    def shutdown(self) -> None:
+        for _ in self._workers:
+            self._jobs.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def __enter__(self) -> "KernelPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+
+def execute_notebooks(
+    nb_paths: List[str | Path],
+    workers: int | None = None,
+    timeout: float = 600,
+    limits: SandboxLimits | None = None,
+) -> List[NotebookRun]:
+    if len(nb_paths) == 0:
+        return []
+
+    workers = min(workers or os.cpu_count() or 1, len(nb_paths))
+    with KernelPool(size=workers, timeout=timeout, limits=limits) as pool:
+        return pool.execute_many(nb_paths, timeout)
@@ -1,11 +1,15 @@
-import subprocess
+from functools import partial
 from pathlib import Path
+from typing import List
 
+from columnar import ensure_feather
+from dp_executor import dp_map
+from kernel_pool import execute_notebooks
 from notebook_utils import build_new_nb
-from omegaconf import OmegaConf
-from tqdm import tqdm
+from omegaconf import DictConfig, OmegaConf
 
-from utils import read_jsonl
+from result_store import ResultStore
+from sandbox import SandboxLimits, limits_from_config, run_sandboxed
 
 
 def filter_prints(code: str):
@@ -39,41 +43,71 @@ def get_code_blocks(gpt_response: dict):
     return code_blocks
 
 
-if __name__ == "__main__":
-    config_path = "configs/config.yaml"
-    config = OmegaConf.load(config_path)
+def build_split_notebook(
+    dp_folder: Path, code_split_results: ResultStore, limits: SandboxLimits
+) -> Path:
+    gpt_response = code_split_results[int(dp_folder.name)]
+    nb_path = dp_folder / "split_data.ipynb"
+    code_blocks = get_code_blocks(gpt_response)
+
+    if len(code_blocks) >= 2:
+        # we assume that the code block is first, but just in case, I formulate it is penultimate
+        data_block = code_blocks[-2]
+        data_block += "\ndf.to_csv('data.csv', index=False)"
+        data_block_file = dp_folder / "data_block.py"
+        with open(data_block_file, "w") as f:
+            f.write(data_block)
+        # run data script to generate the data file, GPT code is run with limits
+        result = run_sandboxed(data_block_file, dp_folder, limits)
+        if result.status != "ok":
+            stderr = result.stderr.strip().splitlines()[-1:]
+            print(f"Data block of dp {dp_folder.name}: {result.status} {stderr}")
+        else:
+            ensure_feather(dp_folder)
+
+        # add printing df into notebook
+        code_blocks[-2] += "\ndf.head(15)"
+
+    # add a block with full plotting script to be able to compare results and code
+    code_file = dp_folder / "plot.py"
+    with open(code_file, "r") as f:
+        code_joined = f.read()
+    code_blocks.append(code_joined)
+
+    build_new_nb(code_blocks, nb_path)
+
+    return nb_path
+
+
+def build_split_notebooks(config: DictConfig, ids: List[int] | None = None) -> None:
+    """
+    Build split_data.ipynb from the code split by GPT, generate data.csv and run the notebook
+    """
+
     dataset_folder = Path(config.matplotlib_dataset_path)
-    code_split_results = read_jsonl(dataset_folder / "gpt_response.jsonl")
-    # first line is model prompt
-    code_split_results = code_split_results[1:]
-
-    for gpt_response in tqdm(code_split_results):
-        idx = gpt_response["id"]
-        dp_folder = dataset_folder / str(idx)
-        nb_path = dp_folder / "split_data.ipynb"
-        code_blocks = get_code_blocks(gpt_response)
-
-        if len(code_blocks) >= 2:
-            # we assume that the code block is first, but just in case, I formulate it is penultimate
-            data_block = code_blocks[-2]
-            data_block += "\ndf.to_csv('data.csv', index=False)"
-            data_block_file = dp_folder / "data_block.py"
-            with open(data_block_file, "w") as f:
-                f.write(data_block)
-            # run data script to generate the data file
-            subprocess.run(["python", data_block_file], cwd=dp_folder)
-
-            # add printing df into notebook
-            code_blocks[-2] += "\ndf.head(15)"
-
-        # add a block with full plotting script to be able to compare results and code
-        code_file = dp_folder / "plot.py"
-        with open(code_file, "r") as f:
-            code_joined = f.read()
-        code_blocks.append(code_joined)
-
-        build_new_nb(code_blocks, nb_path)
-
-        # run the notebook to generate all outputs
-        cmd = f'jupyter nbconvert --execute --to notebook --inplace "{nb_path}"'
-        subprocess.call(cmd, shell=True)
+    # prompt lines of the runs have no id and are not indexed
+    code_split_results = ResultStore(dataset_folder / "gpt_response.jsonl")
+    if ids is None:
+        ids = list(code_split_results)
+    ids = [idx for idx in ids if idx in code_split_results]
+
+    limits = limits_from_config(config)
+    results = dp_map(
+        partial(build_split_notebook, code_split_results=code_split_results, limits=limits),
+        [dataset_folder / str(idx) for idx in ids],
+        config.get("dp_workers"),
+        "build_split_notebooks",
+    )
+    nb_paths = [result.value for result in results if result.ok]
+
+    # run the notebooks to generate all outputs
+    execute_notebooks(
+        nb_paths,
+        workers=config.get("notebook_workers"),
+        timeout=config.get("notebook_timeout", 600),
+        limits=limits,
+    )
+
+
+if __name__ == "__main__":
+    build_split_notebooks(OmegaConf.load("configs/config.yaml"))
@@ -2,14 +2,21 @@ import base64
 import json
 import os
 import shutil
-import subprocess
+from functools import partial
 
 import nbformat as nbf
-from nbformat.v4 import new_markdown_cell
-from omegaconf import OmegaConf
-from tqdm import tqdm
 
 from data import get_dp_folders
+from dp_executor import dp_map
+from image_store import ImageStore
+from kernel_pool import execute_notebooks
+from nb_transform import (
+    add_info_cell,
+    apply_transforms,
+    keep_plot_cell,
+    transform_notebooks,
+)
+from utils import filter_dp_folders
 
 # %%
 
@@ -20,70 +27,33 @@ def clear_notebook(notebook_path):
     Also, if there is savefig command, delete it and replace it by plt.show()
     """
 
-    with open(notebook_path, "r") as f:
-        nb = nbf.read(f, as_version=4)
-
-    index = 0
-    for cell in nb["cells"]:
-        if cell["cell_type"] == "code":
-            if index == 0 and cell["source"].strip() != "%matplotlib inline":
-                new_cells = cell
-                break
-
-            if index == 1:
-                new_cells = cell
-                break
-
-            index += 1
-
-    # replace cells with our modified cells
-
-    cell_cleared = []
-    add_show = False
-    for line in new_cells["source"].split("\n"):
-        if "plt.savefig" in line:
-            add_show = True
-        else:
-            cell_cleared.append(line)
+    apply_transforms(notebook_path, [keep_plot_cell])
 
-    if add_show:
-        cell_cleared.append("plt.show()")
 
-    new_cells["source"] = "\n".join(cell_cleared)
-
-    nb["cells"] = [new_cells]
-
-    with open(notebook_path, "w") as f:
-        nbf.write(nb, f)
-
-
-def copy_and_clean(source_folder_path, target_folder_path):
+def copy_and_clean(source_folder_path, target_folder_path, workers=None):
     """
     traverse source folder and copy notebooks (except cached) into target folder.
     perform cleaning of the notebook
     """
 
+    source_paths, target_paths = [], []
     for root, dirs, files in os.walk(source_folder_path):
         dirs[:] = [d for d in dirs if d not in [".ipynb_checkpoints"]]
         for file in files:
             if file.endswith(".ipynb"):
                 subfolder_name = os.path.basename(root)
                 new_file_name = subfolder_name + "__" + file
-                source_file_path = os.path.join(root, file)
-                target_file_path = os.path.join(target_folder_path, new_file_name)
+                source_paths.append(os.path.join(root, file))
+                target_paths.append(os.path.join(target_folder_path, new_file_name))
 
-                shutil.copy2(source_file_path, target_file_path)
                 if file.startswith("pgf"):
                     print(file)
 
-                try:
-                    clear_notebook(target_file_path)
-                except UnicodeEncodeError:
-                    print(f"Can not cleat NB {file}")
-                    os.remove(target_file_path)
+    # cleaned notebooks are written directly to the target folder, failed ones are not copied
+    transform_notebooks(source_paths, [keep_plot_cell], target_paths, workers=workers)
 
 
-def run_notebooks(dataset_folder):
+def run_notebooks(dataset_folder, workers=None):
     """
     traverse all notebooks and run them to get plot image inside it
     """
@@ -94,9 +64,7 @@ def run_notebooks(dataset_folder):
         if f.endswith(".ipynb")
     ]
 
-    for file in tqdm(ipynb_files):
-        cmd = f'jupyter nbconvert --execute --to notebook --inplace "{file}"'
-        subprocess.call(cmd, shell=True)
+    execute_notebooks(ipynb_files, workers=workers)
 
 
 def check_image_existance(notebook_path):
@@ -152,7 +120,7 @@ def seaprate_by_folders(dataset_folder):
             json.dump(info, json_file)
 
 
-def parse_code_and_images(notebook_filepath):
+def parse_code_and_images(notebook_filepath, store: ImageStore):
     dp_folder = notebook_filepath.parent
 
     with open(notebook_filepath, "r") as f:
@@ -168,57 +136,34 @@ def parse_code_and_images(notebook_filepath):
             image_data = output["data"]["image/png"]
             break
 
-    with open(dp_folder / "plot.png", "wb") as f:
-        f.write(base64.b64decode(image_data))
-
-
-def generate_separate_code_and_images(dataset_folder):
-    dp_folders = get_dp_folders(dataset_folder)
-    print("Extracting code and images from notebooks")
-
-    for folder in tqdm(dp_folders):
-        new_notebook_path = folder / "plot.ipynb"
-        parse_code_and_images(new_notebook_path)
+    store.write(base64.b64decode(image_data), dp_folder / "plot.png")
 
 
-def add_info_to_nb(dp_folder):
-    with open(dp_folder / "info.json", "r") as f:
-        info_data = json.load(f)
-
-    info_string = json.dumps(info_data)
-
-    md_cell = new_markdown_cell("INFO: " + info_string)
-    md_cell.pop("id", None)
-
-    with open(dp_folder / "plot.ipynb", "r") as f:
-        nb = nbf.read(f, as_version=4)
+def extract_code_and_image(dp_folder, store: ImageStore):
+    parse_code_and_images(dp_folder / "plot.ipynb", store)
 
-    nb.cells.insert(0, md_cell)
 
-    with open(dp_folder / "plot.ipynb", "w") as f:
-        nbf.write(nb, f)
-
-
-def add_info_to_nb_datapoints(dataset_folder):
-    dp_folders = get_dp_folders(dataset_folder)
+def generate_separate_code_and_images(dataset_folder, ids=None, workers=None):
+    dp_folders = filter_dp_folders(get_dp_folders(dataset_folder), ids)
+    store = ImageStore.beside(dataset_folder)
+    print("Extracting code and images from notebooks")
 
-    for dp_folder in tqdm(dp_folders):
-        add_info_to_nb(dp_folder)
+    dp_map(
+        partial(extract_code_and_image, store=store),
+        dp_folders,
+        workers,
+        "generate_separate_code_and_images",
+    )
+    store.index.refresh()
+    store.index.save_index()
 
 
-# %%
+def add_info_to_nb(dp_folder):
+    apply_transforms(dp_folder / "plot.ipynb", [add_info_cell])
 
-if __name__ == "__main__":
-    config_path = "configs/config.yaml"
-    config = OmegaConf.load(config_path)
-    dataset_folder = config.matplotlib_dataset_path
-    source_folder = config.matplotlib_source_path
 
-    # copy_and_clean(source_folder, dataset_folder)
-    # run_notebooks(dataset_folder)
-    # filter_nb_by_image(dataset_folder)
-    # seaprate_by_folders(dataset_folder)
-    # generate_separate_code_and_images(dataset_folder)
-    # add_info_to_nb_datapoints(dataset_folder)
+def add_info_to_nb_datapoints(dataset_folder, ids=None, workers=None):
+    dp_folders = filter_dp_folders(get_dp_folders(dataset_folder), ids)
 
-# %%
+    nb_paths = [dp_folder / "plot.ipynb" for dp_folder in dp_folders]
+    transform_notebooks(nb_paths, [add_info_cell], workers=workers)
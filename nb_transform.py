@@ -0,0 +1,263 @@
+"""
+Lightweight notebook transformations on raw JSON.
+A notebook is read once, all transforms are applied to the plain dict and it is written once,
+without the NotebookNode conversion and schema validation of nbformat.read / nbformat.write.
+Written files are the same as nbformat writes them: multiline strings split to lines,
+transient metadata stripped, indent 1 and sorted keys.
+Transforms are functions (nb, path) -> None modifying nb in place. To run them in worker
+processes they have to be module-level functions or partials of them.
+"""
+
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+Transform = Callable[[Dict, Path], None]
+
+# mimebundle values that nbformat stores as lists of lines
+SPLIT_MIMES = {"image/svg+xml", "application/javascript"}
+
+DATA_STRING = "import pandas as pd\n" + 'df = pd.read_csv("data.csv")\n'
+
+
+@dataclass
+class TransformResult:
+    path: str
+    # seconds per transform, and for "read" and "write"
+    timings: Dict[str, float] = field(default_factory=dict)
+    # exception of a failed transform, the notebook is not written then
+    error: str | None = None
+
+
+def _join(value):
+    return "".join(value) if isinstance(value, list) else value
+
+
+def _split(value):
+    return value.splitlines(True) if isinstance(value, str) else value
+
+
+def _map_text(cell: Dict, convert: Callable) -> None:
+    if "source" in cell:
+        cell["source"] = convert(cell["source"])
+
+    bundles = list(cell.get("attachments", {}).values())
+    for output in cell.get("outputs", []):
+        if output["output_type"] in ("execute_result", "display_data"):
+            bundles.append(output.get("data", {}))
+        elif output["output_type"] == "stream":
+            output["text"] = convert(output["text"])
+
+    for bundle in bundles:
+        for key, value in bundle.items():
+            if key.startswith("text/") or key in SPLIT_MIMES:
+                bundle[key] = convert(value)
+
+
+def read_notebook(path: str | Path) -> Dict:
+    """
+    Read notebook JSON with cell sources and text outputs joined to strings
+    """
+
+    with open(path, "r", encoding="utf8") as f:
+        nb = json.load(f)
+
+    if nb.get("nbformat") != 4:
+        import nbformat
+
+        nb = json.loads(nbformat.writes(nbformat.read(path, as_version=4)))
+
+    for cell in nb["cells"]:
+        _map_text(cell, _join)
+
+    return nb
+
+
+def write_notebook(nb: Dict, path: str | Path) -> None:
+    nb["metadata"].pop("orig_nbformat", None)
+    nb["metadata"].pop("orig_nbformat_minor", None)
+    nb["metadata"].pop("signature", None)
+    for cell in nb["cells"]:
+        cell.get("metadata", {}).pop("trusted", None)
+        _map_text(cell, _split)
+
+    text = json.dumps(
+        nb, indent=1, sort_keys=True, separators=(",", ": "), ensure_ascii=False
+    )
+    with open(path, "w", encoding="utf8") as f:
+        f.write(text + "\n")
+
+
+def new_code_cell(source: str = "") -> Dict:
+    return {
+        "cell_type": "code",
+        "execution_count": None,
+        "metadata": {},
+        "outputs": [],
+        "source": source,
+    }
+
+
+def new_markdown_cell(source: str = "") -> Dict:
+    return {"cell_type": "markdown", "metadata": {}, "source": source}
+
+
+def insert_cell(nb: Dict, index: int, cell: Dict) -> None:
+    # cell ids are required since nbformat 4.5
+    if nb.get("nbformat_minor", 0) >= 5:
+        cell.setdefault("id", uuid.uuid4().hex[:8])
+    nb["cells"].insert(index, cell)
+
+
+def transform_name(transform: Transform) -> str:
+    while isinstance(transform, partial):
+        transform = transform.func
+    return transform.__name__
+
+
+def apply_transforms(
+    path: str | Path, transforms: List[Transform], out_path: str | Path | None = None
+) -> Dict[str, float]:
+    """
+    Read the notebook once, apply transforms in order and write it to out_path (in place by default).
+    Returns seconds spent per transform and in reading and writing
+    """
+
+    path = Path(path)
+    timings = {}
+
+    start = time.perf_counter()
+    nb = read_notebook(path)
+    timings["read"] = time.perf_counter() - start
+
+    for transform in transforms:
+        start = time.perf_counter()
+        transform(nb, path)
+        timings[transform_name(transform)] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_notebook(nb, out_path or path)
+    timings["write"] = time.perf_counter() - start
+
+    return timings
+
+
+def _apply_job(
+    job: Tuple[Path, Path | None], transforms: List[Transform]
+) -> TransformResult:
+    path, out_path = job
+    try:
+        return TransformResult(str(path), apply_transforms(path, transforms, out_path))
+    except Exception as e:
+        return TransformResult(str(path), error=f"{type(e).__name__}: {e}")
+
+
+def transform_notebooks(
+    paths: List[str | Path],
+    transforms: List[Transform],
+    out_paths: List[str | Path] | None = None,
+    workers: int | None = None,
+) -> List[TransformResult]:
+    """
+    Apply transforms to notebooks in parallel, one read and write per notebook.
+    Prints total time per transform and failed notebooks, results are in the order of paths
+    """
+
+    if len(paths) == 0:
+        return []
+
+    jobs = list(zip(paths, out_paths or [None] * len(paths)))
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers == 1:
+        results = [_apply_job(job, transforms) for job in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(
+                pool.map(partial(_apply_job, transforms=transforms), jobs, chunksize=chunksize)
+            )
+
+    report_timings(results)
+
+    return results
+
+
+def report_timings(results: List[TransformResult]) -> None:
+    totals = defaultdict(float)
+    for result in results:
+        for name, seconds in result.timings.items():
+            totals[name] += seconds
+        if result.error is not None:
+            print(f"Notebook {result.path}: {result.error}")
+
+    summary = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in totals.items())
+    print(f"Transformed {len(results)} notebooks: {summary}")
+
+
+# transforms used by the pipeline steps
+
+
+def keep_plot_cell(nb: Dict, path: Path) -> None:
+    """
+    Keep only the first code cell that is not '%matplotlib inline',
+    replace plt.savefig lines by a single plt.show()
+    """
+
+    code_cells = [cell for cell in nb["cells"] if cell["cell_type"] == "code"]
+    if code_cells and code_cells[0]["source"].strip() == "%matplotlib inline":
+        code_cells = code_cells[1:]
+    cell = code_cells[0]
+
+    lines = cell["source"].split("\n")
+    cleared = [line for line in lines if "plt.savefig" not in line]
+    if len(cleared) != len(lines):
+        cleared.append("plt.show()")
+    cell["source"] = "\n".join(cleared)
+
+    nb["cells"] = [cell]
+
+
+def cut_to_plot_cell(nb: Dict, path: Path) -> None:
+    """
+    Keep only the second cell without outputs and read data.csv in it
+    """
+
+    nb["cells"] = nb["cells"][1:2]
+    cell = nb["cells"][0]
+    cell["outputs"] = []
+    cell["source"] = DATA_STRING + cell["source"]
+
+
+def keep_first_cell(nb: Dict, path: Path) -> None:
+    nb["cells"] = nb["cells"][:1]
+
+
+def split_data_cell(nb: Dict, path: Path) -> None:
+    """
+    Move data reading lines of the first cell to a new cell in front of it
+    """
+
+    lines_to_remove = set(DATA_STRING.splitlines(True))
+    cell = nb["cells"][0]
+    cell["source"] = "".join(
+        line for line in cell["source"].splitlines(True) if line not in lines_to_remove
+    )
+    insert_cell(nb, 0, new_code_cell(DATA_STRING))
+
+
+def add_info_cell(nb: Dict, path: Path) -> None:
+    """
+    Insert info.json of the datapoint folder as the first markdown cell
+    """
+
+    with open(path.parent / "info.json", "r") as f:
+        info = json.load(f)
+
+    insert_cell(nb, 0, new_markdown_cell("INFO: " + json.dumps(info)))
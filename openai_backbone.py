@@ -5,6 +5,10 @@ import backoff
 import openai
 from typing_extensions import TypedDict
 
+from response_cache import ResponseCache
+from streaming import StreamAccumulator, StreamFormatError, StreamValidator
+from transport import HTTPTransport, get_transport
+
 
 class ChatMessage(TypedDict):
     role: str
@@ -19,21 +23,43 @@ class OpenAIBackbone:
         model_name: str,
         parameters: Dict[str, Any] = {},
         api_key: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        transport: Optional[HTTPTransport] = None,
     ):
+        self._transport = transport if transport is not None else get_transport()
         self._client = openai.OpenAI(
-            api_key=api_key if api_key else os.environ.get("OPENAI_API_KEY")
+            api_key=api_key if api_key else os.environ.get("OPENAI_API_KEY"),
+            http_client=self._transport.client,
+            timeout=self._transport.timeout,
         )
         self._model_name = model_name
         self._parameters = parameters
+        self._cache = cache
 
     @backoff.on_exception(backoff.expo, openai.APIError)
-    def _get_chat_completion(
+    def _create_chat_completion(
         self, messages: List[ChatMessage]
     ) -> openai.types.chat.ChatCompletion:
         return self._client.chat.completions.create(
             messages=messages, model=self._model_name, **self._parameters
         )
 
+    def _get_chat_completion(
+        self, messages: List[ChatMessage]
+    ) -> openai.types.chat.ChatCompletion:
+        if self._cache is None:
+            return self._create_chat_completion(messages)
+
+        key = ResponseCache.make_key(self._model_name, messages, self._parameters)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return openai.types.chat.ChatCompletion.model_validate(cached)
+
+        response = self._create_chat_completion(messages)
+        self._cache.put(key, response.model_dump(mode="json"))
+
+        return response
+
     def generate_msg(self, message: List[ChatMessage]) -> Dict[str, Optional[str]]:
         response = self._get_chat_completion(messages=message)
         assert response.choices[
@@ -45,3 +71,57 @@ class OpenAIBackbone:
             "model": response.model,
             "system_fingerprint": response.system_fingerprint,
         }
+
+    def generate_msg_stream(
+        self, message: List[ChatMessage], validator: Optional[StreamValidator] = None
+    ) -> Dict[str, Any]:
+        """
+        Same as generate_msg, but streams the completion and adds "stream_metrics".
+        Raises StreamFormatError as soon as the validator reports a format failure.
+        """
+
+        key = None
+        if self._cache is not None:
+            # streamed entries have the generate_msg layout, not a ChatCompletion dump
+            key = ResponseCache.make_key(
+                self._model_name, message, self._parameters, {"stream": True}
+            )
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
+        accumulator = StreamAccumulator(validator)
+        aborted = False
+        stream = self._client.chat.completions.create(
+            messages=message,
+            model=self._model_name,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._parameters,
+        )
+        created = None
+        system_fingerprint = None
+        for chunk in stream:
+            created = chunk.created
+            system_fingerprint = chunk.system_fingerprint
+            if accumulator.feed(chunk.model_dump()) is not None:
+                aborted = True
+                stream.close()
+                break
+
+        failure = accumulator.finish(aborted)
+        if failure is not None:
+            raise StreamFormatError(failure, accumulator.text)
+        assert accumulator.text, "Empty content in OpenAI API response."
+
+        response = {
+            "prediction": accumulator.text,
+            "created": str(created),
+            "model": accumulator.model,
+            "system_fingerprint": system_fingerprint,
+            "stream_metrics": accumulator.response()["stream_metrics"],
+        }
+        if key is not None:
+            self._cache.put(key, response)
+
+        return response
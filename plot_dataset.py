@@ -0,0 +1,311 @@
+"""
+Lazy access to a dataset folder through a prebuilt manifest.
+dataset_manifest.jsonl has one line per datapoint with its plot class, file names and sizes
+and token counts, so listing, filtering and sampling datapoints reads no datapoint files.
+Code, task, data and images of a datapoint are read only when accessed.
+"""
+
+import json
+import os
+import random
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+MANIFEST_NAME = "dataset_manifest.jsonl"
+# text files counted in manifest token counts
+TOKEN_FILES = {"code": "plot.py", "task": "task.json", "data_descr": "data_descr.txt"}
+
+
+def image_sort_key(name: str) -> Tuple[str, int]:
+    """
+    plot.png, plot_1.png, plot_2.png, ..., plot_10.png: numeric suffixes are sorted as numbers
+    """
+
+    stem = Path(name).stem
+    prefix, _, suffix = stem.rpartition("_")
+    if prefix and suffix.isdigit():
+        return prefix, int(suffix)
+    return stem, -1
+
+
+class DPRecord:
+    __slots__ = ("id", "plot_class", "plot_name", "files", "tokens")
+
+    def __init__(
+        self,
+        id: int,
+        plot_class: str | None,
+        plot_name: str | None,
+        files: Dict[str, int],
+        tokens: Dict[str, int | None],
+    ) -> None:
+        self.id = id
+        self.plot_class = plot_class
+        self.plot_name = plot_name
+        # file name -> size in bytes
+        self.files = files
+        self.tokens = tokens
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def image_names(self) -> List[str]:
+        names = [name for name in self.files if name.endswith(".png")]
+        return sorted(names, key=image_sort_key)
+
+
+class DataPoint:
+    """
+    View of one datapoint, files are read on every access
+    """
+
+    __slots__ = ("record", "folder")
+
+    def __init__(self, record: DPRecord, folder: Path) -> None:
+        self.record = record
+        self.folder = folder
+
+    @property
+    def id(self) -> int:
+        return self.record.id
+
+    @property
+    def plot_class(self) -> str | None:
+        return self.record.plot_class
+
+    @property
+    def code(self) -> str:
+        with open(self.folder / "plot.py", "r") as f:
+            return f.read()
+
+    @property
+    def task(self) -> Dict:
+        with open(self.folder / "task.json", "r") as f:
+            return json.load(f)
+
+    @property
+    def data_descr(self) -> str:
+        with open(self.folder / "data_descr.txt", "r") as f:
+            return f.read()
+
+    @property
+    def data(self):
+        from columnar import load_data
+
+        return load_data(self.folder)
+
+    @property
+    def image_paths(self) -> List[Path]:
+        # plot.png sorts before plot_{i}.png
+        return [self.folder / name for name in self.record.image_names]
+
+    @property
+    def images(self) -> List[bytes]:
+        images = []
+        for path in self.image_paths:
+            with open(path, "rb") as f:
+                images.append(f.read())
+        return images
+
+
+@lru_cache(maxsize=None)
+def _tokenizer(model_name: str):
+    from preflight import get_tokenizer
+
+    try:
+        return get_tokenizer(model_name)
+    except Exception:
+        # tiktoken could not load the encoding (e.g. offline without a cache), counts are None
+        return None
+
+
+def _count_tokens(tokenizer, path: Path) -> int | None:
+    if tokenizer is None or not path.exists():
+        return None
+    with open(path, "r") as f:
+        return len(tokenizer.encode(f.read()))
+
+
+def _image_tokens(path: Path) -> int:
+    from preflight import image_size, image_tokens
+
+    return image_tokens(*image_size(path), "high")
+
+
+def manifest_record(dp_folder: Path, model_name: str = "gpt-4-turbo") -> Dict:
+    """
+    Manifest line of a datapoint, plot class and name come from its info.json
+    """
+
+    tokenizer = _tokenizer(model_name)
+    info_file = dp_folder / "info.json"
+    info = {}
+    if info_file.exists():
+        with open(info_file, "r") as f:
+            info = json.load(f)
+
+    files = {
+        entry.name: entry.stat().st_size
+        for entry in sorted(os.scandir(dp_folder), key=lambda entry: entry.name)
+        if entry.is_file()
+    }
+    tokens = {
+        key: _count_tokens(tokenizer, dp_folder / name) for key, name in TOKEN_FILES.items()
+    }
+    tokens["images"] = sum(
+        _image_tokens(dp_folder / name) for name in files if name.endswith(".png")
+    )
+
+    record = DPRecord(
+        int(dp_folder.name), info.get("plot_class"), info.get("plot_name"), files, tokens
+    )
+    return record.to_dict()
+
+
+def build_manifest(dataset_folder, ids=None, workers=None) -> None:
+    """
+    Write dataset_manifest.jsonl, entries of datapoints outside ids are kept
+    """
+
+    from data import get_dp_folders
+    from dp_executor import dp_map
+    from utils import filter_dp_folders
+
+    dataset_folder = Path(dataset_folder)
+    manifest_path = dataset_folder / MANIFEST_NAME
+    dp_folders = filter_dp_folders(get_dp_folders(dataset_folder), ids)
+
+    records = {}
+    if ids is not None and manifest_path.exists():
+        records = {record.id: record.to_dict() for record in read_manifest(manifest_path)}
+
+    results = dp_map(manifest_record, dp_folders, workers, "build_manifest")
+    for result in results:
+        if result.ok:
+            records[result.value["id"]] = result.value
+
+    temp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(temp_path, "w") as f:
+        for dp_id in sorted(records):
+            json.dump(records[dp_id], f)
+            f.write("\n")
+    os.replace(temp_path, manifest_path)
+
+
+def read_manifest(manifest_path: Path) -> List[DPRecord]:
+    with open(manifest_path, "r") as f:
+        return [DPRecord(**json.loads(line)) for line in f if line.strip()]
+
+
+class PlotDataset:
+    def __init__(
+        self, folder: str | Path, records: List[DPRecord] | None = None, build: bool = True
+    ) -> None:
+        """
+        Dataset of the folder manifest. A missing manifest is built,
+        or the dataset is empty if build is False
+        """
+
+        self.folder = Path(folder)
+        if records is None:
+            manifest_path = self.folder / MANIFEST_NAME
+            if not manifest_path.exists() and build:
+                build_manifest(self.folder)
+            records = read_manifest(manifest_path) if manifest_path.exists() else []
+        self.records = records
+        self._positions = {record.id: i for i, record in enumerate(records)}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, dp_id: int) -> bool:
+        return dp_id in self._positions
+
+    def __getitem__(self, dp_id: int) -> DataPoint:
+        record = self.records[self._positions[int(dp_id)]]
+        return DataPoint(record, self.folder / str(record.id))
+
+    def __iter__(self) -> Iterator[DataPoint]:
+        for record in self.records:
+            yield DataPoint(record, self.folder / str(record.id))
+
+    @property
+    def ids(self) -> List[int]:
+        return [record.id for record in self.records]
+
+    def image_paths(self, dp_id: int) -> List[Path]:
+        """
+        Images of a datapoint, found in its folder if it is not in the manifest
+        (e.g. gathered after the manifest was built)
+        """
+
+        if int(dp_id) in self:
+            return self[dp_id].image_paths
+        paths = (self.folder / str(dp_id)).glob("*.png")
+        return sorted(paths, key=lambda path: image_sort_key(path.name))
+
+    def plot_classes(self) -> Counter:
+        return Counter(record.plot_class for record in self.records)
+
+    def filter(
+        self,
+        predicate: Callable[[DPRecord], bool] | None = None,
+        plot_class: str | List[str] | None = None,
+        ids=None,
+    ) -> "PlotDataset":
+        """
+        Subset by a record predicate, plot class(es) and ids, only the manifest is read
+        """
+
+        records = self.records
+        if plot_class is not None:
+            classes = {plot_class} if isinstance(plot_class, str) else set(plot_class)
+            records = [record for record in records if record.plot_class in classes]
+        if ids is not None:
+            ids = set(ids)
+            records = [record for record in records if record.id in ids]
+        if predicate is not None:
+            records = [record for record in records if predicate(record)]
+
+        return PlotDataset(self.folder, records)
+
+    def sample(self, n: int, seed: int = 0) -> "PlotDataset":
+        """
+        Stratified sample by plot class: classes get shares proportional to their size
+        (largest remainder), every class gets at least one datapoint if n allows
+        """
+
+        if n >= len(self.records):
+            return PlotDataset(self.folder, list(self.records))
+
+        rng = random.Random(seed)
+        by_class: Dict = {}
+        for record in self.records:
+            by_class.setdefault(record.plot_class, []).append(record)
+
+        classes = sorted(by_class, key=str)
+        quotas = {name: n * len(by_class[name]) / len(self.records) for name in classes}
+        counts = {name: int(quotas[name]) for name in classes}
+        if n >= len(classes):
+            for name in classes:
+                counts[name] = max(counts[name], 1)
+        remainder = sorted(classes, key=lambda name: counts[name] - quotas[name])
+        while sum(counts.values()) < n:
+            for name in remainder:
+                if sum(counts.values()) < n and counts[name] < len(by_class[name]):
+                    counts[name] += 1
+        minimum = 1 if n >= len(classes) else 0
+        while sum(counts.values()) > n:
+            candidates = [name for name in classes if counts[name] > minimum]
+            name = max(candidates, key=lambda name: counts[name] - quotas[name])
+            counts[name] -= 1
+
+        records = []
+        for name in classes:
+            records.extend(rng.sample(by_class[name], counts[name]))
+        records.sort(key=lambda record: record.id)
+
+        return PlotDataset(self.folder, records)
@@ -0,0 +1,297 @@
+"""
+Headless rendering of plot scripts without notebooks.
+Scripts run with the Agg backend in workers forked from a fork server that has
+matplotlib, pandas, numpy and seaborn (and the matplotlib font cache) already loaded.
+All figures open after the script are returned as PNG bytes.
+"""
+
+import contextlib
+import io
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import nbformat as nbf
+from tqdm import tqdm
+
+from columnar import patch_read_csv
+from image_store import ImageStore
+from sandbox import SandboxLimits, apply_limits, deny_network
+from utils import filter_dp_folders
+
+PRELOAD_MODULES = [
+    "matplotlib",
+    "matplotlib.pyplot",
+    "matplotlib.font_manager",
+    "numpy",
+    "pandas",
+    "seaborn",
+]
+
+
+@dataclass
+class RenderResult:
+    images: List[bytes] = field(default_factory=list)
+    stdout: str = ""
+    # formatted traceback, "Timeout" if the script ran longer than the timeout
+    error: str | None = None
+    # seconds spent in the script and in saving figures
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame) -> None:
+    raise RenderTimeout()
+
+
+def _init_worker(limits: SandboxLimits | None = None) -> None:
+    if limits is not None:
+        # workers live for many scripts, so CPU time is bounded by the timeout instead
+        apply_limits(replace(limits, cpu_seconds=None))
+        if not limits.allow_network:
+            deny_network()
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # plots are collected from open figures, show would only close them in some backends
+    plt.show = lambda *args, **kwargs: None
+    # scripts reading data.csv get the memory-mapped feather copy
+    patch_read_csv()
+
+
+def _reset_matplotlib() -> None:
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    # workers run many scripts, so figures, styles and rcParams of the previous one are dropped.
+    # The backend is not reset by rcdefaults
+    plt.close("all")
+    matplotlib.rcdefaults()
+
+
+def _render_job(code: str, cwd: str | None, timeout: float) -> RenderResult:
+    _reset_matplotlib()
+    return render_code(code, cwd, timeout)
+
+
+def render_code(
+    code: str, cwd: str | Path | None = None, timeout: float | None = None, dpi=None
+) -> RenderResult:
+    """
+    Run code and collect all open figures. Runs in a renderer worker,
+    but can be called directly in a process using the Agg backend.
+    """
+
+    import matplotlib.pyplot as plt
+
+    if cwd is not None:
+        os.chdir(cwd)
+
+    result = RenderResult()
+    stdout = io.StringIO()
+    start = time.perf_counter()
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with contextlib.redirect_stdout(stdout):
+            exec(compile(code, "<plot>", "exec"), {"__name__": "__main__"})
+    except RenderTimeout:
+        result.error = "Timeout"
+    except BaseException:
+        result.error = traceback.format_exc()
+    finally:
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    result.timings["exec"] = time.perf_counter() - start
+    result.stdout = stdout.getvalue()
+
+    start = time.perf_counter()
+    for num in plt.get_fignums():
+        buffer = io.BytesIO()
+        plt.figure(num).savefig(buffer, format="png", bbox_inches="tight", dpi=dpi)
+        result.images.append(buffer.getvalue())
+    plt.close("all")
+    result.timings["save"] = time.perf_counter() - start
+
+    return result
+
+
+class PlotRenderer:
+    def __init__(
+        self,
+        workers: int | None = None,
+        timeout: float = 60,
+        preload: List[str] = PRELOAD_MODULES,
+        limits: SandboxLimits | None = None,
+    ) -> None:
+        self.workers = workers
+        self.timeout = timeout
+        self.limits = limits
+
+        self._context = multiprocessing.get_context("forkserver")
+        # modules missing in the environment are skipped by the fork server
+        self._context.set_forkserver_preload(preload + ["plot_renderer"])
+        self._pool = self._start_pool()
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self.limits,),
+        )
+
+    def submit(self, code: str, cwd: str | Path | None = None) -> Future:
+        # workers have their own working directory
+        if cwd is not None:
+            cwd = str(Path(cwd).resolve())
+        return self._pool.submit(_render_job, code, cwd, self.timeout)
+
+    def _render(self, jobs, indices, results, progress) -> List[int]:
+        """
+        Render jobs at indices into results, returns indices of the jobs lost to a broken pool
+        """
+
+        futures = []
+        broken = []
+        for i in indices:
+            try:
+                futures.append((i, self.submit(*jobs[i])))
+            except BrokenProcessPool:
+                broken.append(i)
+        for i, future in futures:
+            try:
+                results[i] = future.result()
+                progress.update()
+            except BrokenProcessPool:
+                broken.append(i)
+
+        if broken:
+            # a worker died (e.g. a crash or os._exit in a script), the pool fails all its jobs
+            self._pool.shutdown()
+            self._pool = self._start_pool()
+
+        return sorted(broken)
+
+    def render_many(self, jobs: List[Tuple[str, str | Path | None]]) -> List[RenderResult]:
+        """
+        Render (code, cwd) jobs in parallel, results are in the order of jobs.
+        Jobs lost to a dead worker are rendered again, together once and then one by one,
+        so only the scripts that kill their worker get an error
+        """
+
+        results = [None] * len(jobs)
+        with tqdm(total=len(jobs)) as progress:
+            broken = self._render(jobs, range(len(jobs)), results, progress)
+            broken = self._render(jobs, broken, results, progress)
+            for i in broken:
+                if self._render(jobs, [i], results, progress):
+                    results[i] = RenderResult(
+                        error="Renderer worker died", timings={"exec": 0.0, "save": 0.0}
+                    )
+                    progress.update()
+
+        return results
+
+    def shutdown(self) -> None:
+        self._pool.shutdown()
+
+    def __enter__(self) -> "PlotRenderer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+
+def write_plots(dp_folder: Path, images: List[bytes], store: ImageStore) -> None:
+    # same naming as gather_plot_from_nb: plot.png for a single figure, plot_{i}.png otherwise
+    for i, image in enumerate(images):
+        suffix = "" if len(images) == 1 else f"_{i}"
+        store.write(image, dp_folder / f"plot{suffix}.png")
+
+
+def report_failures(dp_folders: List[Path], results: List[RenderResult]) -> None:
+    exec_times = sorted(result.timings["exec"] for result in results)
+    if exec_times:
+        median = exec_times[len(exec_times) // 2]
+        print(f"Rendered {len(results)} plots, median exec {median:.2f} s")
+    for dp_folder, result in zip(dp_folders, results):
+        if result.error is not None:
+            print(f"dp {dp_folder.name}: {result.error.strip().splitlines()[-1]}")
+        elif len(result.images) == 0:
+            print(f"dp {dp_folder.name}: no figures")
+
+
+def render_gallery_plots(dataset_folder, ids=None, workers=None):
+    """
+    Extract plot.py from the gallery notebook and render plot.png without executing the notebook
+    """
+
+    from data import get_dp_folders
+
+    dp_folders = filter_dp_folders(get_dp_folders(dataset_folder), ids)
+
+    jobs = []
+    for dp_folder in dp_folders:
+        with open(dp_folder / "plot.ipynb", "r") as f:
+            nb = nbf.read(f, as_version=4)
+        code = next(cell["source"] for cell in nb.cells if cell["cell_type"] == "code")
+        with open(dp_folder / "plot.py", "w") as f:
+            f.write(code)
+        jobs.append((code, dp_folder))
+
+    with PlotRenderer(workers=workers) as renderer:
+        results = renderer.render_many(jobs)
+
+    # as with executed notebooks, failed scripts give no plots
+    store = ImageStore.beside(dataset_folder)
+    for dp_folder, result in zip(dp_folders, results):
+        if result.error is None and result.images:
+            write_plots(dp_folder, result.images[:1], store)
+    store.index.save_index()
+    report_failures(dp_folders, results)
+
+
+def render_plots(folder, ids=None, workers=None):
+    """
+    Render plots of split_data_cut.ipynb code cells, replaces notebook execution and gather_plots
+    """
+
+    from data import get_dp_folders
+
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
+
+    jobs = []
+    for dp_folder in dp_folders:
+        with open(dp_folder / "split_data_cut.ipynb", "r") as f:
+            nb = nbf.read(f, as_version=4)
+        code = "\n".join(
+            cell["source"] for cell in nb.cells if cell["cell_type"] == "code"
+        )
+        jobs.append((code, dp_folder))
+
+    with PlotRenderer(workers=workers) as renderer:
+        results = renderer.render_many(jobs)
+
+    store = ImageStore.beside(folder)
+    for dp_folder, result in zip(dp_folders, results):
+        for file in dp_folder.glob("*.png"):
+            os.remove(file)
+        if result.error is None:
+            write_plots(dp_folder, result.images, store)
+    store.index.save_index()
+    report_failures(dp_folders, results)
@@ -0,0 +1,224 @@
+"""
+Token and cost estimation of requests before sending them, and pacing under TPM/RPM limits.
+"""
+
+import asyncio
+import base64
+import io
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
+
+from image_encoding import target_size
+
+# USD per 1M tokens (input, output)
+PRICING = {
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+BATCH_DISCOUNT = 0.5
+
+# chat format adds a few tokens per message and for the reply priming
+TOKENS_PER_MESSAGE = 3
+TOKENS_REPLY_PRIMING = 3
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: str, cache_dir: str | None = None):
+    """
+    tiktoken downloads encodings on first use and keeps them in TIKTOKEN_CACHE_DIR.
+    With cache_dir the encodings are read from (and downloaded once into) that folder,
+    it works offline only after an online run has filled it
+    """
+
+    if cache_dir is not None:
+        os.environ["TIKTOKEN_CACHE_DIR"] = str(cache_dir)
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except Exception as e:
+        if cache_dir is None:
+            raise
+        raise RuntimeError(
+            f"Encoding of {model_name} is not in {cache_dir} and could not be downloaded: {e}"
+        ) from e
+
+
+def image_tokens(width: int, height: int, image_detail: str = "auto") -> int:
+    """
+    OpenAI image tile formula: 85 base tokens plus 170 per 512px tile of the resized image.
+    auto is counted as high, which is the upper bound.
+    """
+
+    if image_detail == "low":
+        return 85
+
+    width, height = target_size(width, height, "high")
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+
+    return 85 + 170 * tiles
+
+
+def image_size(image: str | Path) -> tuple:
+    from PIL import Image
+
+    if isinstance(image, Path):
+        with Image.open(image) as img:
+            return img.size
+    if image.startswith("data:"):
+        image = image.split(",", 1)[1]
+    with Image.open(io.BytesIO(base64.b64decode(image))) as img:
+        return img.size
+
+
+@dataclass
+class RequestEstimate:
+    id: int | str
+    prompt_tokens: int
+    image_tokens: int
+    output_tokens: int
+
+    @property
+    def input_tokens(self) -> int:
+        return self.prompt_tokens + self.image_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+def estimate_request(
+    tokenizer,
+    item: Dict,
+    system_prompt: str,
+    output_tokens: int,
+) -> RequestEstimate:
+    """
+    item has the GPT4V.make_requests_many layout: "id", "request", optional "images", "image_detail"
+    """
+
+    texts = [item.get("system_prompt") or system_prompt, item["request"]]
+    prompt_tokens = sum(len(tokenizer.encode(text)) for text in texts)
+    prompt_tokens += TOKENS_PER_MESSAGE * len(texts) + TOKENS_REPLY_PRIMING
+
+    detail = item.get("image_detail", "auto")
+    images_tokens = sum(
+        image_tokens(*image_size(image), detail) for image in item.get("images", [])
+    )
+
+    return RequestEstimate(item["id"], prompt_tokens, images_tokens, output_tokens)
+
+
+def estimate_messages(
+    tokenizer, dp_id: int | str, messages: List[Dict], output_tokens: int
+) -> RequestEstimate:
+    """
+    Estimate of a text-only chat request given as a list of {"role", "content"} messages
+    """
+
+    prompt_tokens = sum(len(tokenizer.encode(message["content"])) for message in messages)
+    prompt_tokens += TOKENS_PER_MESSAGE * len(messages) + TOKENS_REPLY_PRIMING
+
+    return RequestEstimate(dp_id, prompt_tokens, 0, output_tokens)
+
+
+def estimate_items(
+    items: List[Dict],
+    model_name: str,
+    system_prompt: str,
+    output_tokens: int,
+    cache_dir: str | None = None,
+) -> List[RequestEstimate]:
+    """
+    Estimate every item and store the estimate in item["tokens"] for the scheduler
+    """
+
+    tokenizer = get_tokenizer(model_name, cache_dir)
+    estimates = []
+    for item in items:
+        estimate = estimate_request(tokenizer, item, system_prompt, output_tokens)
+        item["tokens"] = estimate.total_tokens
+        estimates.append(estimate)
+
+    return estimates
+
+
+def order_by_tokens(items: List[Dict]) -> List[Dict]:
+    """
+    Largest requests go first, so the end of the run is made of small requests that pack well under the limit
+    """
+
+    return sorted(items, key=lambda item: item.get("tokens", 0), reverse=True)
+
+
+def dry_run_report(
+    step: str,
+    estimates: List[RequestEstimate],
+    model_name: str,
+    tpm: int,
+    rpm: int,
+    headroom: float = 0.9,
+    batch: bool = False,
+) -> Dict:
+    input_tokens = sum(e.input_tokens for e in estimates)
+    output_tokens = sum(e.output_tokens for e in estimates)
+    input_price, output_price = PRICING.get(model_name, PRICING["gpt-4-turbo"])
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1e6
+    if batch:
+        cost *= BATCH_DISCOUNT
+
+    wall_minutes = max(
+        (input_tokens + output_tokens) / (tpm * headroom), len(estimates) / (rpm * headroom)
+    )
+
+    return {
+        "step": step,
+        "requests": len(estimates),
+        "prompt_tokens": sum(e.prompt_tokens for e in estimates),
+        "image_tokens": sum(e.image_tokens for e in estimates),
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "cost_usd": round(cost, 2),
+        "wall_time_s": round(60 * wall_minutes, 1),
+    }
+
+
+class TPMScheduler:
+    """
+    Paces requests so that tokens and requests in any 60 s window stay under headroom * limit
+    """
+
+    def __init__(self, tpm: int, rpm: int, headroom: float = 0.9, window: float = 60.0) -> None:
+        self.token_budget = tpm * headroom
+        self.request_budget = rpm * headroom
+        self.window = window
+
+        self._sent: deque[tuple] = deque()
+        self._tokens_in_window = 0
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._sent and now - self._sent[0][0] >= self.window:
+            self._tokens_in_window -= self._sent.popleft()[1]
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                fits_tokens = self._tokens_in_window + tokens <= self.token_budget
+                fits_requests = len(self._sent) + 1 <= self.request_budget
+                # a single request larger than the budget is sent when the window is empty
+                if (fits_tokens and fits_requests) or not self._sent:
+                    self._sent.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                await asyncio.sleep(self.window - (now - self._sent[0][0]))
@@ -2,18 +2,28 @@ import base64
 import glob
 import os
 import shutil
-import subprocess
-from pathlib import Path
+import time
+from functools import partial
 
 import nbformat as nbf
-import numpy as np
-import pandas as pd
-from matplotlib.patches import Circle
-from omegaconf import OmegaConf
 from tqdm import tqdm
 
 from data import get_dp_folders
-from user_api import get_pycharm_dataframe_description
+from df_summary import SummaryCache, summarize_csv, summarize_dataframe
+from dp_executor import dp_map
+from image_store import ImageStore
+from kernel_pool import execute_notebooks
+from nb_transform import (
+    DATA_STRING,
+    apply_transforms,
+    cut_to_plot_cell,
+    keep_first_cell,
+    read_notebook,
+    split_data_cell,
+    transform_notebooks,
+)
+from sandbox import SandboxLimits, SandboxResult, run_code_sandboxed
+from utils import filter_dp_folders
 
 
 def copy_valid_dp(data_folder, source_folder, target_folder):
@@ -43,20 +53,7 @@ def cut_noteboook(notebook_path):
     Keep only second cell in the notebook
     """
 
-    with open(notebook_path) as f:
-        nb = nbf.read(f, as_version=4)
-
-    nb.cells = nb.cells[1:2]
-
-    nb["cells"][0]["outputs"] = []
-    nb.cells[0]["source"] = (
-        "import pandas as pd\n"
-        + 'df = pd.read_csv("data.csv")\n'
-        + nb.cells[0]["source"]
-    )
-
-    with open(notebook_path, "w") as f:
-        nbf.write(nb, f)
+    apply_transforms(notebook_path, [cut_to_plot_cell])
 
 
 def clean_noteboook(notebook_path):
@@ -64,42 +61,37 @@ def clean_noteboook(notebook_path):
     Keep only first cell in the notebook
     """
 
-    with open(notebook_path) as f:
-        nb = nbf.read(f, as_version=4)
-
-    nb.cells = nb.cells[:1]
+    apply_transforms(notebook_path, [keep_first_cell])
 
-    with open(notebook_path, "w") as f:
-        nbf.write(nb, f)
 
-
-def generate_stand_alone_dps(folder):
+def generate_stand_alone_dps(folder, ids=None, workers=None):
     """
     generates stand-alone notebook (only loading data from csv and plotting) and runs it
     """
 
-    dp_folders = get_dp_folders(folder)
-
-    for dp_folder in tqdm(dp_folders):
-        nb_path_orig = dp_folder / "split_data.ipynb"
-        nb_path_copy = dp_folder / "split_data_cut.ipynb"
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
 
-        shutil.copy2(nb_path_orig, nb_path_copy)
-
-        cut_noteboook(nb_path_copy)
+    # the cut notebook is written from split_data.ipynb in the same pass, without a copy
+    nb_paths_orig = [dp_folder / "split_data.ipynb" for dp_folder in dp_folders]
+    nb_paths = [dp_folder / "split_data_cut.ipynb" for dp_folder in dp_folders]
+    results = transform_notebooks(
+        nb_paths_orig, [cut_to_plot_cell], nb_paths, workers=workers
+    )
 
-        cmd = f'jupyter nbconvert --execute --to notebook --inplace "{nb_path_copy}"'
-        subprocess.call(cmd, shell=True)
+    nb_paths = [
+        nb_path for nb_path, result in zip(nb_paths, results) if result.error is None
+    ]
+    execute_notebooks(nb_paths, workers=workers)
 
 
-def gather_nbs(folder, target_folder):
+def gather_nbs(folder, target_folder, ids=None):
     """
     gather notebooks from datapoint folders to single folder
     """
 
     os.makedirs(target_folder, exist_ok=True)
 
-    dp_folders = get_dp_folders(folder)
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
 
     for dp_folder in tqdm(dp_folders):
         idx = int(dp_folder.name)
@@ -109,19 +101,18 @@ def gather_nbs(folder, target_folder):
         shutil.copy2(nb_path_cut, nb_path_copy)
 
 
-def clean_dp_nbs(folder):
+def clean_dp_nbs(folder, ids=None, workers=None):
     """
     keep only one code cell in the notebook
     """
 
-    dp_folders = get_dp_folders(folder)
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
 
-    for dp_folder in tqdm(dp_folders):
-        nb_path_copy = dp_folder / "split_data_cut.ipynb"
-        clean_noteboook(nb_path_copy)
+    nb_paths = [dp_folder / "split_data_cut.ipynb" for dp_folder in dp_folders]
+    transform_notebooks(nb_paths, [keep_first_cell], workers=workers)
 
 
-def gather_plot_from_nb(nb_path):
+def gather_plot_from_nb(nb_path, store: ImageStore):
     """
     Extracts plot from the output of the first cell of the notebook
     """
@@ -144,24 +135,27 @@ def gather_plot_from_nb(nb_path):
             else:
                 suffix = f"_{i}"
 
-            with open(dp_folder / f"plot{suffix}.png", "wb") as f:
-                f.write(base64.b64decode(image_data))
+            store.write(base64.b64decode(image_data), dp_folder / f"plot{suffix}.png")
+
+
+def gather_dp_plots(dp_folder, store: ImageStore):
+    for file in dp_folder.glob("*.png"):
+        os.remove(file)
 
+    gather_plot_from_nb(dp_folder / "split_data_cut.ipynb", store)
 
-def gather_plots(folder):
+
+def gather_plots(folder, ids=None, workers=None):
     """
     Extracts plots from notebooks in all datapoints
     """
 
-    dp_folders = get_dp_folders(folder)
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
+    store = ImageStore.beside(folder)
 
-    for dp_folder in tqdm(dp_folders):
-        files = glob.glob(f"{dp_folder}/*.png")
-        for file in files:
-            os.remove(file)
-
-        nb_path = dp_folder / "split_data_cut.ipynb"
-        gather_plot_from_nb(nb_path)
+    dp_map(partial(gather_dp_plots, store=store), dp_folders, workers, "gather_plots")
+    store.index.refresh()
+    store.index.save_index()
 
 
 def split_noteboook(notebook_path):
@@ -169,31 +163,14 @@ def split_noteboook(notebook_path):
     Split notebook cell to the data reading and convering cell and plotting df dataframe
     """
 
-    data_string = "import pandas as pd\n" + 'df = pd.read_csv("data.csv")\n'
-    lines_to_remove = {"import pandas as pd\n", 'df = pd.read_csv("data.csv")\n'}
-
-    with open(notebook_path) as f:
-        nb = nbf.read(f, as_version=4)
+    apply_transforms(notebook_path, [split_data_cell])
 
-    code = nb.cells[0]["source"]
-    code_new = "".join(
-        line for line in code.splitlines(True) if line not in lines_to_remove
-    )
-    nb.cells[0]["source"] = code_new
 
-    new_cell = nbf.v4.new_code_cell(data_string)
-    nb.cells.insert(0, new_cell)
+def split_noteboooks(folder, ids=None, workers=None):
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
 
-    with open(notebook_path, "w") as f:
-        nbf.write(nb, f)
-
-
-def split_noteboooks(folder):
-    dp_folders = get_dp_folders(folder)
-
-    for dp_folder in tqdm(dp_folders):
-        nb_path = dp_folder / "split_data_cut.ipynb"
-        split_noteboook(nb_path)
+    nb_paths = [dp_folder / "split_data_cut.ipynb" for dp_folder in dp_folders]
+    transform_notebooks(nb_paths, [split_data_cell], workers=workers)
 
 
 def str_in_notebook(folder, substrings):
@@ -214,53 +191,66 @@ def str_in_notebook(folder, substrings):
             print(dp_folder.name)
 
 
-def generate_df_description(dp_folder):
-    os.chdir(dp_folder)
-    nb_path = dp_folder / "split_data_cut.ipynb"
-
-    with open(nb_path, "r") as f:
-        nb = nbf.read(f, as_version=4)
+def generate_df_description(
+    dp_folder, limits: SandboxLimits = SandboxLimits(), cache: SummaryCache | None = None
+) -> SandboxResult:
+    """
+    Describe df of the data cell. If the cell only reads data.csv, the csv is summarized directly,
+    otherwise the cell is run in a sandbox and pickles df to be described here in the same format
+    """
 
-    code = nb.cells[0]["source"]
+    nb_path = dp_folder / "split_data_cut.ipynb"
+    code = read_notebook(nb_path)["cells"][0]["source"]
+    df_descr_file = dp_folder / "data_descr.txt"
 
-    locals_dict = {}
-    exec(code, {"np": np, "Circle": Circle}, locals_dict)
+    if code.strip() == DATA_STRING.strip():
+        start = time.perf_counter()
+        try:
+            df_descr = summarize_csv(dp_folder / "data.csv", cache)
+        except Exception as e:
+            # pyarrow is stricter than pandas with malformed files
+            print(f"dp {dp_folder.name}: csv summary failed, {e}")
+        else:
+            with open(df_descr_file, "w") as f:
+                f.write(df_descr)
+            return SandboxResult("ok", None, "", "", time.perf_counter() - start)
+
+    import pandas as pd
+
+    df_file = dp_folder / "_df.pkl"
+    # names the data cells used to get from the exec globals
+    script = "\n".join(
+        [
+            "import numpy as np",
+            "from matplotlib.patches import Circle",
+            code,
+            f"df.to_pickle({str(df_file.resolve())!r})",
+        ]
+    )
+    result = run_code_sandboxed(script, dp_folder, limits)
+    if result.status != "ok":
+        return result
 
-    df = locals_dict["df"]
+    df = pd.read_pickle(df_file)
+    os.remove(df_file)
 
-    df_descr = get_pycharm_dataframe_description(df)
-    df_descr_file = dp_folder / "data_descr.txt"
+    df_descr = summarize_dataframe(df)
 
     with open(df_descr_file, "w") as f:
         f.write(df_descr)
 
-    return None
+    return result
 
 
-def generate_df_description_all(folder):
-    dp_folders = get_dp_folders(folder)
-    for dp_folder in tqdm(dp_folders):
-        try:
-            generate_df_description(dp_folder)
-        except NameError:
-            print(dp_folder.name)
+def generate_df_description_all(folder, ids=None, workers=None):
+    dp_folders = filter_dp_folders(get_dp_folders(folder), ids)
+    cache = SummaryCache.beside(folder)
+    results = dp_map(
+        partial(generate_df_description, cache=cache), dp_folders, workers, "df_descriptions"
+    )
+    for dp_result in results:
+        result = dp_result.value
+        if dp_result.ok and result.status != "ok":
+            print(dp_result.dp_folder.name, result.status, result.stderr.strip().splitlines()[-1:])
 
     return None
-
-
-if __name__ == "__main__":
-    config_path = "configs/config.yaml"
-    config = OmegaConf.load(config_path)
-
-    data_folder = Path(config.matplotlib_dataset_path)
-    validated_notebooks = Path(config.validated_notebooks)
-    dataset_valid_step_1 = Path(config.dataset_valid_step_1)
-    cut_notebooks_folder = Path(config.dataset_valid_step_1_notebooks)
-
-    # copy_valid_dp(data_folder, validated_notebooks, dataset_valid_step_1)
-    # generate_stand_alone_dps(dataset_valid_step_1)
-    # gather_nbs(dataset_valid_step_1, cut_notebooks_folder)
-    # clean_dp_nbs(dataset_valid_step_1)
-    # gather_plots(dataset_valid_step_1)
-    # split_noteboooks(dataset_valid_step_1)
-    # generate_df_description_all(target_folder)
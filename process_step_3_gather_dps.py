@@ -1,13 +1,17 @@
 import glob
 import json
 import os
-import shutil
 from pathlib import Path
+from typing import List
 
-from omegaconf import OmegaConf
+from omegaconf import DictConfig, OmegaConf
 from tqdm import tqdm
 
+from columnar import DATA_LOAD_CODE, FEATHER_NAME, ensure_feather, feather_is_fresh
+from dataset_assembly import assemble_files, write_if_changed
 from LLM_utils import read_task_responses
+from nb_transform import DATA_STRING
+from plot_dataset import build_manifest
 from utils import read_nb_data_cell
 
 """
@@ -44,10 +48,10 @@ def format_task(message):
     return task_dict
 
 
-if __name__ == "__main__":
-    config_path = "configs/config.yaml"
-    config = OmegaConf.load(config_path)
-    openai_token_file = config.openai_token_file
+def gather_dps(config: DictConfig, ids: List[int] | None = None) -> List[int]:
+    """
+    Copy datapoints with a task to the final dataset, returns their ids
+    """
 
     dataset_folder = Path(config.dataset_valid_step_1)
     output_folder = Path(config.out_folder)
@@ -57,9 +61,13 @@ if __name__ == "__main__":
 
     response = read_task_responses(response_path)
     dp_ids = sorted(list(response.keys()))
+    if ids is not None:
+        ids = set(ids)
+        dp_ids = [idx for idx in dp_ids if idx in ids]
 
     files_list = ["plot.py", "data_descr.txt", "data.csv", "plot_original.py"]
 
+    pairs = []
     for idx in tqdm(dp_ids):
         task_dict = format_task(response[idx])
         dp_folder = dataset_folder / str(idx)
@@ -72,16 +80,36 @@ if __name__ == "__main__":
         for file in files_list:
             plot_code_file = dp_folder / file
             dp_files.append(plot_code_file)
+        # plot class and name for the dataset manifest
+        if (dp_folder / "info.json").exists():
+            dp_files.append(dp_folder / "info.json")
 
         data_code = read_nb_data_cell(dp_folder / "split_data_cut.ipynb")
+        if data_code.strip() == DATA_STRING.strip():
+            # the final dataset loads the memory-mapped copy when pyarrow is available,
+            # data Arrow can't store keeps reading data.csv
+            ensure_feather(dp_folder)
+            if feather_is_fresh(dp_folder):
+                dp_files.append(dp_folder / FEATHER_NAME)
+                data_code = DATA_LOAD_CODE
         data_code_file = dp_folder_final / "data_load.py"
         task_file = dp_folder_final / "task.json"
 
-        with open(data_code_file, "w") as f:
-            f.write(data_code)
+        write_if_changed(data_code_file, data_code)
+        write_if_changed(task_file, json.dumps(task_dict))
+
+        pairs.extend((file, dp_folder_final / file.name) for file in dp_files)
 
-        with open(task_file, "w") as f:
-            json.dump(task_dict, f)
+    # files are reflinked or hardlinked when possible, unchanged files are skipped
+    counts = assemble_files(
+        dataset_folder_final, pairs, workers=config.get("assembly_workers")
+    )
+    print(", ".join(f"{method} {count}" for method, count in counts.items()))
 
-        for file in dp_files:
-            shutil.copy2(file, dp_folder_final / file.name)
+    build_manifest(dataset_folder_final, ids, workers=config.get("dp_workers"))
+
+    return dp_ids
+
+
+if __name__ == "__main__":
+    gather_dps(OmegaConf.load("configs/config.yaml"))
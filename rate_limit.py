@@ -0,0 +1,113 @@
+import asyncio
+import re
+import time
+from typing import Mapping
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_time(value: str | None) -> float | None:
+    """
+    Parse OpenAI reset durations like "20ms", "1s" or "6m0s" into seconds
+    """
+
+    if not value:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+
+    return sum(float(number) * _UNIT_SECONDS[unit] for number, unit in parts)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter that adapts the number of in-flight requests to the rate limit headers.
+    The limit is increased by one on a healthy response and halved on 429 (AIMD).
+    When the remaining budget is exhausted, new requests are paused until the reported reset time.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        low_watermark: float = 0.1,
+        default_wait: float = 20.0,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.low_watermark = low_watermark
+        self.default_wait = default_wait
+
+        self.limit = max_concurrency
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            async with self._cond:
+                if self._paused_until > time.monotonic():
+                    continue
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return
+                await self._cond.wait()
+
+    async def release(
+        self, status_code: int | None = None, headers: Mapping[str, str] = {}
+    ) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            self._update(status_code, headers)
+            self._cond.notify_all()
+
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _update(self, status_code: int | None, headers: Mapping[str, str]) -> None:
+        if status_code == 429:
+            self.limit = max(self.min_concurrency, self.limit // 2)
+            wait_time = (
+                parse_reset_time(headers.get("retry-after"))
+                or parse_reset_time(headers.get("x-ratelimit-reset-requests"))
+                or parse_reset_time(headers.get("x-ratelimit-reset-tokens"))
+                or self.default_wait
+            )
+            print(f"Rate limited, concurrency {self.limit}, waiting {wait_time:.1f} s")
+            self._pause(wait_time)
+            return
+
+        if status_code is None or status_code >= 400:
+            return
+
+        low_budget = False
+        for kind in ["requests", "tokens"]:
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            if remaining is None or limit is None:
+                continue
+
+            remaining, limit = int(remaining), int(limit)
+            if remaining == 0:
+                reset = parse_reset_time(headers.get(f"x-ratelimit-reset-{kind}"))
+                self._pause(reset if reset is not None else self.default_wait)
+            if limit > 0 and remaining / limit < self.low_watermark:
+                low_budget = True
+
+        if low_budget:
+            self.limit = max(self.min_concurrency, self.limit - 1)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM responses stored in SQLite.
+    Keys are stable hashes of the request (model, messages with encoded images, arguments).
+    Entries older than max_age_days are dropped, and the least recently used entries are
+    evicted when the total size exceeds max_size_mb.
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        max_size_mb: float = 1024,
+        max_age_days: float = 30,
+        evict_every: int = 100,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 24 * 3600
+        self.evict_every = evict_every
+
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Stable hash of json-serializable request parts
+        """
+
+        serialized = json.dumps(
+            parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict) -> None:
+        serialized = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, len(serialized), now, now),
+            )
+            self._conn.commit()
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        self._conn.execute(
+            "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+        )
+
+        total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total_size > self.max_size:
+            to_free = total_size - self.max_size
+            stale_keys = []
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            ):
+                if to_free <= 0:
+                    break
+                stale_keys.append((key,))
+                to_free -= size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+
+        self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size": size}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def cache_from_config(config) -> ResponseCache | None:
+    cache_file = config.get("response_cache_file")
+    if cache_file is None:
+        return None
+
+    return ResponseCache(
+        cache_file,
+        max_size_mb=config.get("response_cache_max_size_mb", 1024),
+        max_age_days=config.get("response_cache_max_age_days", 30),
+    )
@@ -0,0 +1,234 @@
+"""
+Pipeline results stored as JSONL with an offset index, so resume checks and lookups by id
+do not depend on the file size. The JSONL file stays readable line by line as before.
+The index is kept in a <file>.idx sidecar; lines appended after it was saved
+(e.g. by another process or an interrupted run) are indexed when the store is opened.
+The index is dropped if the file was replaced or rewritten since it was saved.
+Later lines with the same id replace earlier ones.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+# bytes hashed at the start and the end of the indexed part of the file
+FINGERPRINT_BYTES = 4096
+
+
+class ResultStore(Mapping):
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self._offsets: Dict = {}
+        self._indexed_size = 0
+        self._reader = None
+
+        self._load_index()
+        indexed_size = self._indexed_size
+        self.refresh()
+        # keep the scan for the next reader
+        if self._indexed_size > indexed_size:
+            self.save_index()
+
+    def _load_index(self) -> None:
+        if not self.index_path.exists() or not self.path.exists():
+            return
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except ValueError:
+            return
+        # the file was replaced, truncated or rewritten since the index was saved
+        if index["size"] > self.path.stat().st_size:
+            return
+        if index.get("fingerprint") != self._fingerprint(index["size"]):
+            return
+
+        self._offsets = {dp_id: offset for dp_id, offset in index["offsets"]}
+        self._indexed_size = index["size"]
+
+    def _fingerprint(self, size: int) -> Dict:
+        """
+        Inode and hashes of the first and the last block of the first size bytes of the file.
+        Appending lines does not change it
+        """
+
+        with open(self.path, "rb") as f:
+            head = f.read(min(size, FINGERPRINT_BYTES))
+            tail_start = max(0, size - FINGERPRINT_BYTES)
+            f.seek(tail_start)
+            tail = f.read(size - tail_start)
+            inode = os.fstat(f.fileno()).st_ino
+
+        return {
+            "inode": inode,
+            "head": hashlib.sha256(head).hexdigest(),
+            "tail": hashlib.sha256(tail).hexdigest(),
+        }
+
+    def save_index(self) -> None:
+        if not self.path.exists():
+            return
+        index = {
+            "size": self._indexed_size,
+            "fingerprint": self._fingerprint(self._indexed_size),
+            "offsets": list(self._offsets.items()),
+        }
+        # several processes may save the index of the same file
+        temp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(temp_path, self.index_path)
+
+    def refresh(self) -> None:
+        """
+        Index lines appended since the last scan
+        """
+
+        if not self.path.exists():
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._indexed_size)
+            offset = self._indexed_size
+            for line in f:
+                # partially written last line, it is indexed when complete
+                if not line.endswith(b"\n"):
+                    break
+                self._index_line(line, offset)
+                offset += len(line)
+        self._indexed_size = offset
+
+    def _index_line(self, line: bytes, offset: int) -> None:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # empty line or a line torn by a killed writer
+            return
+        if isinstance(entry, dict) and entry.get("id") is not None:
+            self._offsets[entry["id"]] = offset
+
+    def has(self, dp_id) -> bool:
+        return dp_id in self._offsets
+
+    def __contains__(self, dp_id) -> bool:
+        return dp_id in self._offsets
+
+    def __getitem__(self, dp_id) -> Dict:
+        offset = self._offsets[dp_id]
+        if self._reader is None:
+            self._reader = open(self.path, "rb")
+        self._reader.seek(offset)
+
+        return json.loads(self._reader.readline())
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._offsets))
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def upsert(self, entry: Dict) -> None:
+        """
+        Append entry as a single line, it replaces the previous entry with the same id
+        """
+
+        if entry.get("id") is None:
+            raise ValueError("Result entry must have an id")
+        self.append(entry)
+
+    def append(self, entry: Dict) -> None:
+        """
+        Append any entry (e.g. prompts of the run), entries without id are not indexed
+        """
+
+        self.append_many([entry])
+
+    def append_many(self, entries: List[Dict], fsync: bool = False) -> None:
+        """
+        Append entries with a single write, lines of concurrent writers never interleave
+        """
+
+        lines = [(json.dumps(entry) + "\n").encode() for entry in entries]
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # other processes may append to the same file
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self.refresh()
+            offset = os.fstat(fd).st_size
+            # terminate a torn last line, so it does not swallow these entries
+            prefix = b"\n" if offset > self._indexed_size else b""
+            data = memoryview(prefix + b"".join(lines))
+            while data:
+                data = data[os.write(fd, data) :]
+            if fsync:
+                os.fsync(fd)
+            offset += len(prefix)
+            for line in lines:
+                self._index_line(line, offset)
+                offset += len(line)
+            self._indexed_size = offset
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def compact(self) -> None:
+        """
+        Rewrite the file keeping only the latest entry per id (and lines without id)
+        """
+
+        if not self.path.exists():
+            return
+
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(self.path, "rb") as source, open(temp_path, "wb") as target:
+            fcntl.flock(source.fileno(), fcntl.LOCK_EX)
+            self.refresh()
+            latest = set(self._offsets.values())
+            offsets = {}
+            offset = 0
+            for line in source:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    offset += len(line)
+                    continue
+                dp_id = entry.get("id") if isinstance(entry, dict) else None
+                if dp_id is not None and offset not in latest:
+                    offset += len(line)
+                    continue
+                if dp_id is not None:
+                    offsets[dp_id] = target.tell()
+                target.write(line)
+                offset += len(line)
+            os.replace(temp_path, self.path)
+
+        self.close()
+        self._offsets = offsets
+        self._indexed_size = self.path.stat().st_size
+        self.save_index()
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def __getstate__(self) -> Dict:
+        # stores are passed to worker processes, which open their own reader
+        state = self.__dict__.copy()
+        state["_reader"] = None
+        return state
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.path.exists():
+            self.save_index()
+        self.close()
@@ -0,0 +1,186 @@
+"""
+Execution of datapoint code (GPT-generated data blocks, dataframe scripts) in a child process
+with rlimits on CPU time, address space and open files, a wall-clock timeout and no network.
+Outcomes are reported as ok / timeout / oom / exception instead of stalling the pipeline.
+"""
+
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+OOM_EXIT_CODE = 86
+
+# runs the script as __main__ after denying network access in the child interpreter,
+# same as deny_network, the child may not have this module on its path
+BOOTSTRAP = """
+import runpy, socket, sys, traceback
+
+def deny(*args, **kwargs):
+    raise PermissionError("Network access is disabled in the sandbox")
+
+if sys.argv[2] == "deny":
+    socket.socket.connect = deny
+    socket.socket.connect_ex = deny
+    socket.socket.sendto = deny
+    socket.getaddrinfo = deny
+    socket.create_connection = deny
+
+script = sys.argv[1]
+sys.argv = sys.argv[1:2]
+try:
+    runpy.run_path(script, run_name="__main__")
+except MemoryError:
+    traceback.print_exc()
+    sys.exit({oom_exit_code})
+""".format(oom_exit_code=OOM_EXIT_CODE)
+
+
+@dataclass
+class SandboxLimits:
+    # None means no limit
+    cpu_seconds: int | None = 60
+    memory_mb: int | None = 4096
+    open_files: int | None = 256
+    wall_timeout: float | None = 120
+    allow_network: bool = False
+
+
+@dataclass
+class SandboxResult:
+    # ok, timeout, oom or exception
+    status: str
+    returncode: int | None
+    stdout: str
+    stderr: str
+    duration: float
+
+
+def apply_limits(limits: SandboxLimits) -> None:
+    """
+    Set rlimits of the current process, used before exec of the child and in renderer workers
+    """
+
+    if limits.cpu_seconds is not None:
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1)
+        )
+    if limits.memory_mb is not None:
+        memory = limits.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    if limits.open_files is not None:
+        resource.setrlimit(
+            resource.RLIMIT_NOFILE, (limits.open_files, limits.open_files)
+        )
+
+
+def _deny(*args, **kwargs):
+    raise PermissionError("Network access is disabled in the sandbox")
+
+
+def deny_network() -> None:
+    """
+    Block outgoing connections and name resolution in the current process
+    """
+
+    socket.socket.connect = _deny
+    socket.socket.connect_ex = _deny
+    socket.socket.sendto = _deny
+    socket.getaddrinfo = _deny
+    socket.create_connection = _deny
+
+
+def limits_preexec(limits: SandboxLimits) -> Callable[[], None]:
+    def preexec() -> None:
+        apply_limits(limits)
+        if not limits.allow_network and hasattr(os, "unshare"):
+            # an empty network namespace, only available with enough privileges
+            try:
+                os.unshare(os.CLONE_NEWNET)
+            except OSError:
+                pass
+
+    return preexec
+
+
+def _status(returncode: int, timed_out: bool) -> str:
+    if timed_out or returncode == -signal.SIGXCPU:
+        return "timeout"
+    # SIGKILL not sent by the wall timeout comes from the OOM killer
+    if returncode in (OOM_EXIT_CODE, -signal.SIGKILL):
+        return "oom"
+    if returncode != 0:
+        return "exception"
+    return "ok"
+
+
+def run_sandboxed(
+    script: str | Path,
+    cwd: str | Path | None = None,
+    limits: SandboxLimits = SandboxLimits(),
+    python: str = sys.executable,
+) -> SandboxResult:
+    network = "allow" if limits.allow_network else "deny"
+    # the child runs in cwd, a relative script path is relative to the current directory
+    script = Path(script).resolve()
+    start = time.perf_counter()
+    # own session, so the timeout kills the whole process group
+    process = subprocess.Popen(
+        [python, "-c", BOOTSTRAP, str(script), network],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        preexec_fn=limits_preexec(limits),
+        start_new_session=True,
+    )
+    timed_out = False
+    try:
+        stdout, stderr = process.communicate(timeout=limits.wall_timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        os.killpg(process.pid, signal.SIGKILL)
+        stdout, stderr = process.communicate()
+
+    return SandboxResult(
+        status=_status(process.returncode, timed_out),
+        returncode=process.returncode,
+        stdout=stdout,
+        stderr=stderr,
+        duration=time.perf_counter() - start,
+    )
+
+
+def run_code_sandboxed(
+    code: str,
+    cwd: str | Path,
+    limits: SandboxLimits = SandboxLimits(),
+    script_name: str = "_sandbox_script.py",
+) -> SandboxResult:
+    """
+    Write code to a script in cwd and run it sandboxed, the script is removed afterwards
+    """
+
+    script = Path(cwd).resolve() / script_name
+    with open(script, "w") as f:
+        f.write(code)
+    try:
+        return run_sandboxed(script, cwd, limits)
+    finally:
+        os.remove(script)
+
+
+def limits_from_config(config) -> SandboxLimits:
+    return SandboxLimits(
+        cpu_seconds=config.get("sandbox_cpu_seconds", 60),
+        memory_mb=config.get("sandbox_memory_mb", 4096),
+        open_files=config.get("sandbox_open_files", 256),
+        wall_timeout=config.get("sandbox_wall_timeout", 120),
+        allow_network=config.get("sandbox_allow_network", False),
+    )
@@ -2,7 +2,7 @@ import os
 
 import requests
 from bs4 import BeautifulSoup
-from omegaconf import OmegaConf
+from omegaconf import DictConfig, OmegaConf
 from tqdm import tqdm
 
 # %%
@@ -71,13 +71,9 @@ def get_gallary_links():
     return plot_links
 
 
-# %%
-if __name__ == "__main__":
+def parse_seaborn_gallery(config: DictConfig) -> None:
     plot_links = get_gallary_links()
 
-    config_path = "configs/config.yaml"
-    config = OmegaConf.load(config_path)
-
     out_base_folder = config.seaborn_out_path
 
     for plot_url in tqdm(plot_links):
@@ -92,3 +88,8 @@ if __name__ == "__main__":
         code_block = soup.find("div", class_="highlight").get_text()
         image_url = get_image(soup, out_folder)[0]
         get_code(soup, out_folder)
+
+
+# %%
+if __name__ == "__main__":
+    parse_seaborn_gallery(OmegaConf.load("configs/config.yaml"))
@@ -1,55 +1,113 @@
 import json
 from pathlib import Path
+from typing import List
 
-from omegaconf import OmegaConf
+from omegaconf import DictConfig, OmegaConf
 from tqdm import tqdm
 
+from background_writer import writer_from_config
 from data import get_dp_folders
 from openai_backbone import ChatMessage, OpenAIBackbone
+from preflight import dry_run_report, estimate_messages, get_tokenizer
+from response_cache import cache_from_config
+from result_store import ResultStore
+from streaming import StreamFormatError, code_blocks_validator
+from transport import configure_transport
+from utils import filter_dp_folders
 
-config_path = "configs/config.yaml"
-config = OmegaConf.load(config_path)
-openai_token_file = config.openai_token_file
-dataset_folder = config.matplotlib_dataset_path
-
-output_file = Path(dataset_folder) / "gpt_response.jsonl"
-
-with open(openai_token_file, "r") as f:
-    openai_token = f.read()
-
-chat = OpenAIBackbone(model_name="gpt-4", api_key=openai_token)
 system_prompt = "You are a helpful programming assistant proficient in python, matplotlib and pandas dataframes. All used variables should be defined. In the end you code should run without exceptions."
 instruction = """Change code, so that all data before plotting is gathered to a single dataframe named "df".
   Your response MUST contain EXACTLY TWO codeblocks.
   First for the dataframe construction.
   Second separate codeblock for the plotting the dataframe."""
-chat_prompt = ChatMessage(role="system", content=system_prompt)
-prompts = {"system prompt": system_prompt, "instruction": instruction}
-with open(output_file, "a") as f:
-    json.dump(prompts, f)
-    f.write("\n")
-
-dp_folders = get_dp_folders(dataset_folder)
-responses = []
-for i, dp_folder in tqdm(enumerate(dp_folders), total=len(dp_folders)):
-    index = int(dp_folder.name)
+
+
+def split_request(dp_folder: Path) -> List[ChatMessage]:
     code_file = dp_folder / "plot.py"
     with open(code_file, "r") as f:
         code = f.read()
 
     message = f"Here is a plotting code. {code} \n{instruction}"
 
-    chat_message = ChatMessage(role="user", content=message)
+    return [
+        ChatMessage(role="system", content=system_prompt),
+        ChatMessage(role="user", content=message),
+    ]
+
+
+def split_code(config: DictConfig, ids: List[int] | None = None) -> None:
+    openai_token_file = config.openai_token_file
+    dataset_folder = config.matplotlib_dataset_path
+    model_name = "gpt-4"
+
+    output_file = Path(dataset_folder) / "gpt_response.jsonl"
+    results = ResultStore(output_file)
+
+    dp_folders = filter_dp_folders(get_dp_folders(dataset_folder), ids)
+    # datapoints split in previous runs are skipped
+    dp_folders = [dp for dp in dp_folders if int(dp.name) not in results]
+
+    if config.get("dry_run", False):
+        tokenizer = get_tokenizer(model_name, config.get("tiktoken_cache_dir"))
+        output_tokens = config.get("split_output_tokens", 1000)
+        estimates = [
+            estimate_messages(tokenizer, int(dp.name), split_request(dp), output_tokens)
+            for dp in dp_folders
+        ]
+        report = dry_run_report(
+            "split_code",
+            estimates,
+            model_name,
+            config.get("tpm_limit", 300000),
+            config.get("rpm_limit", 500),
+        )
+        print(json.dumps(report, indent=2))
+        return
+
+    with open(openai_token_file, "r") as f:
+        openai_token = f.read()
+
+    transport = configure_transport(config)
+    chat = OpenAIBackbone(
+        model_name=model_name,
+        api_key=openai_token,
+        cache=cache_from_config(config),
+        transport=transport,
+    )
+    prompts = {"system prompt": system_prompt, "instruction": instruction}
+    results.append(prompts)
+
+    stream = config.get("stream", False)
+    validator = code_blocks_validator(min_blocks=2)
+    stream_attempts = config.get("stream_attempts", 3)
+
+    # pending responses are written also when a request fails
+    with writer_from_config(results, config) as writer:
+        for i, dp_folder in tqdm(enumerate(dp_folders), total=len(dp_folders)):
+            index = int(dp_folder.name)
+            request = split_request(dp_folder)
+
+            if stream:
+                for attempt in range(stream_attempts):
+                    # the last attempt is not validated, so the datapoint still gets a response
+                    last_attempt = attempt == stream_attempts - 1
+                    try:
+                        response = chat.generate_msg_stream(
+                            request, validator=None if last_attempt else validator
+                        )
+                        break
+                    except StreamFormatError as e:
+                        print(f"Retrying dp {index}: {e.reason}")
+            else:
+                response = chat.generate_msg(request)
+            response["id"] = index
+            writer.put(response)
 
-    request = [chat_prompt, chat_message]
+            # if i > 3-1:
+            #     break
 
-    response = chat.generate_msg(request)
-    response["id"] = index
-    responses.append(response)
+    print(f"HTTP timings: {transport.timing_summary()}")
 
-    with open(output_file, "a") as f:
-        json.dump(response, f)
-        f.write("\n")
 
-    # if i > 3-1:
-    #     break
+if __name__ == "__main__":
+    split_code(OmegaConf.load("configs/config.yaml"))
@@ -0,0 +1,163 @@
+"""
+Consumption of streamed (server-sent events) chat completions with early format validation.
+A validator gets the text generated so far and whether the stream is finished,
+and returns a failure reason (or None) so a bad completion can be aborted and retried.
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional
+
+StreamValidator = Callable[[str, bool], Optional[str]]
+
+
+class StreamFormatError(Exception):
+    def __init__(self, reason: str, partial: str = "") -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial
+
+
+def task_prefix_validator(text: str, done: bool) -> str | None:
+    """
+    Task generation answer should start with "TASK:" (see read_task_responses)
+    """
+
+    stripped = text.lstrip()
+    if len(stripped) < len("TASK:") and not done:
+        return None
+    if not stripped.startswith("TASK:"):
+        return f"Response does not start with TASK: {stripped[:20]!r}"
+    return None
+
+
+def code_blocks_validator(
+    min_blocks: int = 2, max_chars_before_fence: int = 1500
+) -> StreamValidator:
+    """
+    Code split answer should contain at least min_blocks ``` code blocks (see get_code_blocks)
+    """
+
+    def validate(text: str, done: bool) -> str | None:
+        fences = text.count("```")
+        if fences == 0 and len(text) > max_chars_before_fence:
+            return f"No code block in the first {max_chars_before_fence} characters"
+        if done and fences < 2 * min_blocks:
+            return f"Response has {fences // 2} code blocks, expected {min_blocks}"
+        return None
+
+    return validate
+
+
+def parse_sse_line(line: str) -> Dict | None:
+    """
+    Returns event data of a "data: {...}" line, None for other lines, {} for [DONE]
+    """
+
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return {}
+    return json.loads(data)
+
+
+@dataclass
+class StreamMetrics:
+    ttft: float | None = None
+    total: float = 0.0
+    completion_tokens: int = 0
+    tokens_per_sec: float = 0.0
+    aborted: bool = False
+
+
+class StreamAccumulator:
+    """
+    Collects content deltas of a chat completion stream and measures TTFT and tokens/sec
+    """
+
+    def __init__(self, validator: StreamValidator | None = None) -> None:
+        self.validator = validator
+        self.metrics = StreamMetrics()
+        # extended by every delta, not joined again from all parts for each chunk
+        self.text = ""
+        self.chunks = 0
+        self.finish_reason = None
+        self.model = None
+        self.usage = None
+        self.failure = None
+        self._start = time.perf_counter()
+        self._first_token = None
+
+    def feed(self, event: Dict) -> str | None:
+        """
+        Add a stream event, returns failure reason if the stream should be aborted
+        """
+
+        self.model = event.get("model", self.model)
+        if event.get("usage"):
+            self.usage = event["usage"]
+        deltas = []
+        for choice in event.get("choices", []):
+            delta = choice.get("delta", {}).get("content")
+            if delta:
+                if self._first_token is None:
+                    self._first_token = time.perf_counter()
+                deltas.append(delta)
+                self.chunks += 1
+            if choice.get("finish_reason"):
+                self.finish_reason = choice["finish_reason"]
+
+        # the text is validated again only when it has grown
+        if deltas:
+            self.text += "".join(deltas)
+            if self.validator is not None:
+                self.failure = self.validator(self.text, False)
+        return self.failure
+
+    def finish(self, aborted: bool = False) -> str | None:
+        end = time.perf_counter()
+        metrics = self.metrics
+        metrics.aborted = aborted
+        metrics.total = end - self._start
+        if self._first_token is not None:
+            metrics.ttft = self._first_token - self._start
+        # usage is reported only for completed streams, otherwise count content chunks
+        if self.usage is not None:
+            metrics.completion_tokens = self.usage.get("completion_tokens", self.chunks)
+        else:
+            metrics.completion_tokens = self.chunks
+        if self._first_token is not None and end > self._first_token:
+            metrics.tokens_per_sec = metrics.completion_tokens / (
+                end - self._first_token
+            )
+
+        if not aborted and self.validator is not None:
+            self.failure = self.validator(self.text, True)
+        return self.failure
+
+    def response(self) -> Dict:
+        """
+        Response in the layout of a non-streamed chat completion
+        """
+
+        if self.failure is not None:
+            return {
+                "error": {
+                    "message": f"Stream aborted: {self.failure}",
+                    "type": "stream_format",
+                },
+                "partial": self.text,
+                "stream_metrics": asdict(self.metrics),
+            }
+
+        message = {"role": "assistant", "content": self.text}
+        return {
+            "model": self.model,
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": self.finish_reason}
+            ],
+            "usage": self.usage,
+            "stream_metrics": asdict(self.metrics),
+        }
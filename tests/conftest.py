@@ -0,0 +1,136 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class ChatStub:
+    """
+    Local chat completions endpoint answering with a fixed text.
+    Records request bodies and the peak number of requests in flight
+    """
+
+    def __init__(self, text: str = "TASK:\n1. Draw the plot.", delay: float = 0.0) -> None:
+        self.text = text
+        self.delay = delay
+        # statuses returned before the normal answers, e.g. [500] for one failure
+        self.statuses = []
+        self.requests = []
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def completion(self, body: dict) -> dict:
+        choices = [
+            {
+                "index": i,
+                "message": {"role": "assistant", "content": self.text},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }
+            for i in range(body.get("n", 1))
+        ]
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model", "stub"),
+            "choices": choices,
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    def chunks(self, body: dict):
+        for word in self.text.split(" "):
+            yield {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+        yield {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+
+
+def _make_handler(stub: ChatStub):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with stub.lock:
+                stub.requests.append(body)
+                stub.in_flight += 1
+                stub.peak = max(stub.peak, stub.in_flight)
+                status = stub.statuses.pop(0) if stub.statuses else 200
+            try:
+                time.sleep(stub.delay)
+                if status != 200:
+                    self._send_json({"error": {"message": f"status {status}"}}, status)
+                elif body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for chunk in stub.chunks(body):
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.write(b"data: [DONE]\n\n")
+                else:
+                    self._send_json(stub.completion(body))
+            finally:
+                with stub.lock:
+                    stub.in_flight -= 1
+
+        def _send_json(self, data: dict, status: int = 200) -> None:
+            payload = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def chat_stub():
+    """
+    ChatStub served on a free local port, its base url is stub.url
+    """
+
+    stub = ChatStub()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub.url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_gpt4v(chat_stub):
+    """
+    Factory of GPT4V clients sending to chat_stub through their own transport
+    """
+
+    from GPT4V_backbone import GPT4V
+    from transport import HTTPTransport
+
+    def make(**kwargs) -> GPT4V:
+        kwargs = {"wait_time": 0, "transport": HTTPTransport(), **kwargs}
+        gpt4v = GPT4V(api_key="test", system_prompt="system", **kwargs)
+        gpt4v.model_url = f"{chat_stub.url}/chat/completions"
+        return gpt4v
+
+    return make
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from background_writer import BackgroundWriter
+from result_store import ResultStore
+
+
+def test_writes_entries_in_batches(tmp_path):
+    store = ResultStore(tmp_path / "results.jsonl")
+    with BackgroundWriter(store, flush_interval=10.0, flush_size=5) as writer:
+        for i in range(10):
+            writer.put({"id": i})
+        writer.flush()
+        assert writer.stats() == {"written": 10, "batches": 2}
+
+    assert sorted(ResultStore(tmp_path / "results.jsonl")) == list(range(10))
+
+
+def test_flushes_after_interval(tmp_path):
+    store = ResultStore(tmp_path / "results.jsonl")
+    writer = BackgroundWriter(store, flush_interval=0.05, flush_size=100, fsync="never")
+    writer.put({"id": 1})
+    time.sleep(0.3)
+
+    assert 1 in ResultStore(tmp_path / "results.jsonl")
+    writer.close()
+
+
+def test_fsync_always_writes_each_entry(tmp_path):
+    store = ResultStore(tmp_path / "results.jsonl")
+    with BackgroundWriter(store, flush_size=3, fsync="always") as writer:
+        for i in range(3):
+            writer.put({"id": i})
+
+    assert len(ResultStore(tmp_path / "results.jsonl")) == 3
+
+
+def test_write_errors_reach_producer(tmp_path):
+    store = ResultStore(tmp_path / "results.jsonl")
+    writer = BackgroundWriter(store, flush_interval=0.01)
+    writer.put({"id": 1, "value": object()})
+    writer.flush()
+
+    with pytest.raises(RuntimeError):
+        writer.put({"id": 2})
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def test_rejects_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        BackgroundWriter(ResultStore(tmp_path / "results.jsonl"), fsync="sometimes")
@@ -0,0 +1,165 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from batch_api import (
+    BatchClient,
+    ingest_batch_results,
+    run_batch,
+    write_batch_file,
+    write_batch_files,
+)
+from batch_stub_server import STUB_TASK, BatchStubState, make_handler
+from GPT4V_backbone import GPT4V
+from result_store import ResultStore
+from transport import HTTPTransport
+
+
+class ExpiringState(BatchStubState):
+    """
+    Batches expire with only the first request done
+    """
+
+    def _complete(self, batch: dict) -> None:
+        super()._complete(batch)
+        content = self.files[batch["output_file_id"]].decode().splitlines()
+        self.files[batch["output_file_id"]] = content[0].encode()
+        batch["status"] = "expired"
+
+
+def serve(state: BatchStubState):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+@pytest.fixture
+def gpt4v() -> GPT4V:
+    return GPT4V(api_key="test", system_prompt="system", transport=HTTPTransport())
+
+
+ITEMS = [{"id": i, "request": f"request {i}"} for i in range(3)]
+
+
+def test_write_batch_file(tmp_path, gpt4v):
+    id_map = write_batch_file(gpt4v, ITEMS, tmp_path / "batch.jsonl")
+
+    with open(tmp_path / "batch.jsonl") as f:
+        lines = [json.loads(line) for line in f]
+    assert id_map == {"0": 0, "1": 1, "2": 2}
+    assert lines[1]["custom_id"] == "1"
+    assert lines[1]["body"]["messages"][1]["content"][0]["text"] == "request 1"
+
+
+def test_ingest_batch_results(tmp_path):
+    body = {"choices": [{"message": {"content": "answer"}}]}
+    ok = {"custom_id": "1", "response": {"status_code": 200, "body": body}, "error": None}
+    failed = {"custom_id": "2", "response": {"status_code": 500, "body": {}}, "error": None}
+    content = json.dumps(ok) + "\n" + json.dumps(failed) + "\n"
+    results = ResultStore(tmp_path / "results.jsonl")
+
+    ingested, failed_ids = ingest_batch_results(content, results, {"1": 1, "2": 2})
+
+    assert (ingested, failed_ids) == (1, [2])
+    assert results[1]["response"] == "answer"
+
+
+def test_run_batch_completed(tmp_path, gpt4v):
+    server, url = serve(BatchStubState(delay=0))
+    client = BatchClient("test", base_url=url, transport=HTTPTransport())
+    results = ResultStore(tmp_path / "results.jsonl")
+
+    failed_ids = run_batch(gpt4v, ITEMS, results, client, tmp_path / "work", poll_interval=0)
+    server.shutdown()
+
+    assert failed_ids == []
+    assert sorted(results) == [0, 1, 2]
+    assert results[2]["response"] == STUB_TASK
+    assert not (tmp_path / "work" / "batch_state.json").exists()
+
+
+def test_run_batch_expired_ingests_partial_output_and_is_not_resumed(tmp_path, gpt4v):
+    server, url = serve(ExpiringState(delay=0))
+    client = BatchClient("test", base_url=url, transport=HTTPTransport())
+    results = ResultStore(tmp_path / "results.jsonl")
+    work_folder = tmp_path / "work"
+
+    with pytest.raises(RuntimeError, match="expired"):
+        run_batch(gpt4v, ITEMS, results, client, work_folder, poll_interval=0)
+
+    assert list(results) == [0]
+    assert not (work_folder / "batch_state.json").exists()
+    assert len(list(work_folder.glob("batch_state_*_expired.json"))) == 1
+
+    # the next run submits the remaining items as a new batch
+    with pytest.raises(RuntimeError, match="expired"):
+        run_batch(gpt4v, ITEMS[1:], results, client, work_folder, poll_interval=0)
+    server.shutdown()
+    assert sorted(results) == [0, 1]
+
+
+def test_write_batch_files_splits_at_limits(tmp_path, gpt4v):
+    items = [{"id": i, "request": f"request {i}"} for i in range(7)]
+    write_batch_file(gpt4v, items[:1], tmp_path / "one.jsonl")
+    line_size = (tmp_path / "one.jsonl").stat().st_size
+
+    by_count = write_batch_files(gpt4v, items, tmp_path, max_requests=3)
+    assert [list(batch["id_map"].values()) for batch in by_count] == [[0, 1, 2], [3, 4, 5], [6]]
+
+    by_size = write_batch_files(gpt4v, items, tmp_path, max_bytes=2 * line_size + 1)
+    assert [len(batch["id_map"]) for batch in by_size] == [2, 2, 2, 1]
+    assert all((tmp_path / batch["file"]).stat().st_size <= 2 * line_size + 1 for batch in by_size)
+
+    with pytest.raises(ValueError, match="larger than"):
+        write_batch_files(gpt4v, items, tmp_path, max_bytes=10)
+
+
+def test_run_batch_submits_several_batches(tmp_path, gpt4v):
+    state = BatchStubState(delay=0)
+    server, url = serve(state)
+    client = BatchClient("test", base_url=url, transport=HTTPTransport())
+    results = ResultStore(tmp_path / "results.jsonl")
+    items = [{"id": i, "request": f"request {i}"} for i in range(5)]
+
+    failed_ids = run_batch(
+        gpt4v, items, results, client, tmp_path / "work", poll_interval=0, max_requests=2
+    )
+    server.shutdown()
+
+    assert failed_ids == []
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert len(state.batches) == 3
+    assert list((tmp_path / "work").iterdir()) == []
+
+
+def test_run_batch_resumes_interrupted_submission(tmp_path, gpt4v):
+    state = BatchStubState(delay=0)
+    server, url = serve(state)
+    results = ResultStore(tmp_path / "results.jsonl")
+
+    class InterruptedClient(BatchClient):
+        def create(self, input_file_id: str, metadata: dict | None = None) -> dict:
+            if state.batches:
+                raise KeyboardInterrupt
+            return super().create(input_file_id, metadata)
+
+    with pytest.raises(KeyboardInterrupt):
+        run_batch(
+            gpt4v,
+            ITEMS,
+            results,
+            InterruptedClient("test", base_url=url, transport=HTTPTransport()),
+            tmp_path / "work",
+            poll_interval=0,
+            max_requests=2,
+        )
+
+    client = BatchClient("test", base_url=url, transport=HTTPTransport())
+    failed_ids = run_batch(gpt4v, [], results, client, tmp_path / "work", poll_interval=0)
+    server.shutdown()
+
+    assert failed_ids == []
+    assert sorted(results) == [0, 1, 2]
+    assert len(state.batches) == 2
@@ -0,0 +1,79 @@
+import base64
+import io
+import json
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from blob_store import BlobStore, externalize_images, is_blob_ref, load_image, migrate_results_file
+from GPT4V_backbone import GPT4V
+from LLM_utils import generate_benchmark_request
+from transport import HTTPTransport
+
+
+def png_bytes(color=(10, 120, 200)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def test_put_is_content_addressed(tmp_path):
+    store = BlobStore(tmp_path)
+    ref = store.put(b"image")
+
+    assert is_blob_ref(ref)
+    assert store.put(b"image") == ref
+    assert ref in store
+    assert bytes(store.get(ref)) == b"image"
+    assert bytes(load_image(ref, store)) == bytes(load_image(b64(b"image"), store))
+
+
+def test_migrate_results_file(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    image = b64(png_bytes())
+    entry = {"id": 1, "plot results": {"images": [image, image]}}
+    results = tmp_path / "results.jsonl"
+    results.write_text(json.dumps(entry) + "\n")
+    (tmp_path / "results.jsonl.idx").write_text("{}")
+
+    assert migrate_results_file(results, store) == 2
+
+    migrated = json.loads(results.read_text())
+    refs = migrated["plot results"]["images"]
+    assert refs[0] == refs[1] and is_blob_ref(refs[0])
+    assert not (tmp_path / "results.jsonl.idx").exists()
+    # already externalized images are kept
+    assert externalize_images(migrated, store) == 0
+
+
+def test_gpt4v_encodes_blob_references(tmp_path):
+    store = BlobStore(tmp_path)
+    ref = store.put(png_bytes())
+    gpt4v = GPT4V(api_key="test", system_prompt="s", transport=HTTPTransport(), blob_store=store)
+
+    encoded = gpt4v.encode_images([ref], "low")[0]
+
+    assert encoded == gpt4v.encode_images([b64(png_bytes())], "low")[0]
+    with pytest.raises(ValueError):
+        GPT4V(api_key="test", system_prompt="s", transport=HTTPTransport()).encode_images([ref])
+
+
+def test_benchmark_request_resolves_result_image(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    ref = store.put(png_bytes())
+    dp_folder = tmp_path / "3"
+    dp_folder.mkdir()
+    (dp_folder / "plot.png").write_bytes(png_bytes((0, 0, 0)))
+    instructs = {"request judge": "compare"}
+
+    task, plots = generate_benchmark_request(dp_folder, instructs, {"images": [ref]}, store)
+
+    assert task == "compare"
+    assert plots == [store.path(ref), Path(dp_folder / "plot.png")]
+    with pytest.raises(ValueError):
+        generate_benchmark_request(dp_folder, instructs, {"images": [ref]})
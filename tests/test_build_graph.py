@@ -0,0 +1,88 @@
+import pytest
+from omegaconf import OmegaConf
+
+from build_graph import MANIFEST_NAME, Rule, build_order, build_rule
+
+
+@pytest.fixture
+def config(tmp_path):
+    folder = tmp_path / "dps"
+    for idx in [1, 2]:
+        (folder / str(idx)).mkdir(parents=True)
+        (folder / str(idx) / "in.txt").write_text(f"input {idx}")
+    return OmegaConf.create({"folder": str(folder)})
+
+
+def copy_rule(calls, skip=()):
+    def run(config, ids):
+        calls.append(list(ids))
+        for idx in ids:
+            if idx in skip:
+                continue
+            dp_folder = f"{config.folder}/{idx}"
+            with open(f"{dp_folder}/in.txt") as source, open(f"{dp_folder}/out.txt", "w") as f:
+                f.write(source.read())
+
+    return Rule("copy", "folder", run, inputs=("in.txt",), outputs=("out.txt",))
+
+
+def test_unchanged_datapoints_are_skipped(config, tmp_path):
+    calls = []
+    assert build_rule(config, copy_rule(calls)) == (2, 0, [])
+    assert build_rule(config, copy_rule(calls)) == (0, 2, [])
+
+    (tmp_path / "dps" / "2" / "in.txt").write_text("changed")
+    assert build_rule(config, copy_rule(calls)) == (1, 1, [])
+    assert calls == [[1, 2], [2]]
+    assert (tmp_path / "dps" / MANIFEST_NAME).exists()
+
+
+def test_stale_outputs_of_failed_build(config, tmp_path):
+    calls = []
+    build_rule(config, copy_rule(calls))
+    (tmp_path / "dps" / "2" / "in.txt").write_text("changed")
+
+    # the step fails for datapoint 2 and leaves its old output
+    assert build_rule(config, copy_rule(calls, skip={2})) == (0, 1, [2])
+    # not recorded as built, so it is built again
+    assert build_rule(config, copy_rule(calls)) == (1, 1, [])
+    assert calls[1:] == [[2], [2]]
+
+
+def test_force_and_ids(config):
+    calls = []
+    build_rule(config, copy_rule(calls), ids=[1])
+    build_rule(config, copy_rule(calls), force=True)
+
+    assert calls == [[1], [1, 2]]
+
+
+def test_build_order():
+    def rule(name, deps=()):
+        return Rule(name, "folder", None, (), (), deps=deps)
+
+    rules = [rule("c", ("b",)), rule("b", ("a",)), rule("a"), rule("other")]
+
+    assert [r.name for r in build_order(rules, ["c"])] == ["a", "b", "c"]
+
+
+def test_reported_ids_keep_unchanged_outputs(config, tmp_path):
+    from dataset_assembly import write_if_changed
+
+    calls = []
+
+    def run(config, ids):
+        calls.append(list(ids))
+        for idx in ids:
+            # the output does not depend on the input content
+            write_if_changed(tmp_path / "dps" / str(idx) / "out.txt", "same")
+        return [idx for idx in ids if idx != 1]
+
+    rule = Rule("report", "folder", run, inputs=("in.txt",), outputs=("out.txt",))
+    assert build_rule(config, rule) == (1, 0, [1])
+
+    (tmp_path / "dps" / "2" / "in.txt").write_text("changed")
+    # out.txt of 2 is unchanged, the step reports it built
+    assert build_rule(config, rule) == (1, 0, [1])
+    assert build_rule(config, rule) == (0, 1, [1])
+    assert calls == [[1, 2], [1, 2], [1]]
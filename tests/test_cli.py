@@ -0,0 +1,53 @@
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from cli import HEAVY_MODULES, STEPS, count_datapoints, parse_args
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def module_functions(module: str) -> dict:
+    path = REPO / (module if module.endswith(".py") else module.replace(".", "/") + ".py")
+    tree = ast.parse(path.read_text())
+    return {node.name: node for node in tree.body if isinstance(node, ast.FunctionDef)}
+
+
+@pytest.mark.parametrize("name", list(STEPS))
+def test_step_functions_exist(name):
+    step = STEPS[name]
+    functions = module_functions(step.module)
+
+    assert step.function in functions
+    arg_names = [arg.arg for arg in functions[step.function].args.args]
+    if step.supports_ids:
+        assert "ids" in arg_names
+    expected_args = 1 if step.folders is None else len(step.folders)
+    assert len(arg_names) - ("ids" in arg_names) >= expected_args
+
+
+def test_import_loads_no_heavy_modules():
+    code = f"import sys, cli; print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO, capture_output=True, text=True, check=True
+    )
+    assert output.stdout.strip() == "[]"
+
+
+def test_parse_args():
+    args = parse_args(["run", "status", "--ids", "1", "2"])
+    assert (args.command, args.steps, args.ids) == ("run", ["status"], [1, 2])
+    with pytest.raises(SystemExit):
+        parse_args(["run", "no_such_step"])
+
+
+def test_count_datapoints(tmp_path):
+    for name in ["1", "2", "notes"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / "3").write_text("")
+
+    assert count_datapoints(tmp_path) == 2
+    assert count_datapoints(tmp_path / "missing") == 0
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from coalescing import RequestCoalescer
+
+
+def test_threads_share_one_call():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"value": 1}
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: coalescer.run("key", fn), range(4)))
+
+    assert len(calls) == 1
+    assert results == [{"value": 1}] * 4
+    # every caller gets its own copy
+    assert len({id(result) for result in results}) == 4
+
+
+def test_owner_exception_reaches_waiters():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+
+    def fn():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("failed")
+
+    with ThreadPoolExecutor(2) as pool:
+        owner = pool.submit(coalescer.run, "key", fn)
+        started.wait()
+        waiter = pool.submit(coalescer.run, "key", fn)
+        with pytest.raises(ValueError):
+            owner.result()
+        with pytest.raises(ValueError):
+            waiter.result()
+
+
+def test_async_callers_share_one_call():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [1]
+
+    async def run():
+        return await asyncio.gather(*(coalescer.run_async("key", fn) for _ in range(5)))
+
+    assert asyncio.run(run()) == [[1]] * 5
+    assert len(calls) == 1
+    assert coalescer.coalesced == 4
+
+
+def test_concurrent_ask_keeps_each_system_prompt(chat_stub, make_gpt4v):
+    chat_stub.delay = 0.02
+    gpt4v = make_gpt4v()
+
+    def ask(i):
+        return gpt4v.ask(f"request {i}", system_prompt=f"prompt {i}")
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(ask, range(16)))
+
+    for body in chat_stub.requests:
+        request = body["messages"][1]["content"][0]["text"]
+        system_prompt = body["messages"][0]["content"][0]["text"]
+        assert request.split()[-1] == system_prompt.split()[-1]
+    assert gpt4v.system_prompt == "system"
+
+
+def test_sample_gets_k_completions_in_one_request(chat_stub, make_gpt4v):
+    responses = make_gpt4v().sample("request", k=3)
+
+    assert [response["sample_index"] for response in responses] == [0, 1, 2]
+    assert len(chat_stub.requests) == 1
+    assert chat_stub.requests[0]["n"] == 3
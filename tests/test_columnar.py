@@ -0,0 +1,89 @@
+import os
+import warnings
+
+import pandas as pd
+import pytest
+
+from columnar import (
+    DATA_LOAD_CODE,
+    FEATHER_NAME,
+    ensure_feather,
+    feather_is_fresh,
+    load_data,
+    patch_read_csv,
+    read_feather,
+)
+
+
+@pytest.fixture
+def dp_folder(tmp_path):
+    df = pd.DataFrame({"x": [1, 2, 3], "y": [0.5, None, 1.5], "name": ["a", "b", None]})
+    df.to_csv(tmp_path / "data.csv", index=False)
+    return tmp_path
+
+
+def test_feather_copy_equals_csv(dp_folder):
+    assert ensure_feather(dp_folder)
+    assert not ensure_feather(dp_folder)
+
+    df = read_feather(dp_folder / FEATHER_NAME)
+    pd.testing.assert_frame_equal(df, pd.read_csv(dp_folder / "data.csv"))
+    pd.testing.assert_frame_equal(load_data(dp_folder), df)
+
+
+def test_feather_dataframe_is_writable(dp_folder):
+    ensure_feather(dp_folder)
+    df = read_feather(dp_folder / FEATHER_NAME)
+
+    df.loc[0, "x"] = 10
+    df.iloc[2, 1] = 2.5
+
+    assert df["x"].tolist() == [10, 2, 3]
+    assert df["y"].iloc[2] == 2.5
+
+
+def test_stale_copy_is_not_used(dp_folder):
+    ensure_feather(dp_folder)
+    (dp_folder / "data.csv").write_text("x\n7\n")
+    stat = (dp_folder / FEATHER_NAME).stat()
+    os.utime(dp_folder / "data.csv", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert not feather_is_fresh(dp_folder)
+    assert load_data(dp_folder)["x"].tolist() == [7]
+
+
+def test_mixed_type_column_gets_no_copy(tmp_path):
+    # the chunked parser gives an object column of ints and strings
+    (tmp_path / "data.csv").write_text("v\n" + "1\n" * 300000 + "a\n" + "2\n" * 300000)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        assert not ensure_feather(tmp_path)
+
+    assert not feather_is_fresh(tmp_path)
+    assert list(tmp_path.iterdir()) == [tmp_path / "data.csv"]
+
+
+def test_patched_read_csv(dp_folder, monkeypatch):
+    monkeypatch.setattr(pd, "read_csv", pd.read_csv)
+    monkeypatch.chdir(dp_folder)
+    ensure_feather(dp_folder)
+    os.remove(dp_folder / "data.csv")
+    patch_read_csv()
+
+    # data.csv is gone, so the frame comes from the feather copy
+    df = pd.read_csv("data.csv")
+    assert df["x"].tolist() == [1, 2, 3]
+    df.loc[1, "y"] = 1.0
+
+
+def test_truncated_copy_falls_back_to_csv(dp_folder, monkeypatch):
+    ensure_feather(dp_folder)
+    path = dp_folder / FEATHER_NAME
+    path.write_bytes(path.read_bytes()[:100])
+    expected = pd.read_csv(dp_folder / "data.csv")
+
+    pd.testing.assert_frame_equal(load_data(dp_folder), expected)
+    monkeypatch.chdir(dp_folder)
+    namespace = {}
+    exec(DATA_LOAD_CODE, namespace)
+    pd.testing.assert_frame_equal(namespace["df"], expected)
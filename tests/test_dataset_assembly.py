@@ -0,0 +1,67 @@
+import json
+import os
+
+import pytest
+
+from dataset_assembly import MANIFEST_NAME, assemble_files, place_file, write_if_changed
+
+
+@pytest.fixture
+def pairs(tmp_path):
+    source, target = tmp_path / "source", tmp_path / "final"
+    source.mkdir()
+    pairs = []
+    for idx in range(3):
+        (source / f"{idx}.csv").write_text(f"x\n{idx}\n")
+        pairs.append((source / f"{idx}.csv", target / str(idx) / "data.csv"))
+    return pairs
+
+
+def test_copies_then_skips_unchanged(pairs, tmp_path):
+    root = tmp_path / "final"
+    assert assemble_files(root, pairs, methods=("copy",)) == {"copy": 3}
+    assert (root / "1" / "data.csv").read_text() == "x\n1\n"
+
+    assert assemble_files(root, pairs, methods=("copy",)) == {"unchanged": 3}
+
+    pairs[0][0].write_text("x\nchanged\n")
+    assert assemble_files(root, pairs, methods=("copy",)) == {"copy": 1, "unchanged": 2}
+    assert (root / "0" / "data.csv").read_text() == "x\nchanged\n"
+
+    with open(root / MANIFEST_NAME) as f:
+        assert sorted(json.load(f)["files"]) == [f"{idx}/data.csv" for idx in range(3)]
+
+
+def test_hardlinked_target_is_the_source(pairs, tmp_path):
+    root = tmp_path / "final"
+    counts = assemble_files(root, pairs, methods=("hardlink", "copy"))
+    if counts != {"hardlink": 3}:
+        pytest.skip("hardlinks are not supported here")
+
+    assert (root / "2" / "data.csv").samefile(pairs[2][0])
+    # rewriting the source in place changes the linked file, nothing is placed again
+    pairs[2][0].write_text("x\nnew\n")
+    assert assemble_files(root, pairs, methods=("hardlink", "copy")) == {"unchanged": 3}
+
+
+def test_place_file_falls_back_to_copy(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("a")
+    (tmp_path / "b.txt").write_text("old")
+
+    # the first method the filesystem supports is used
+    method = place_file(source, tmp_path / "b.txt")
+
+    assert method in ("reflink", "hardlink", "copy")
+    assert (tmp_path / "b.txt").read_text() == "a"
+    assert [path.name for path in tmp_path.iterdir() if path.suffix == ".tmp"] == []
+
+
+def test_write_if_changed(tmp_path):
+    path = tmp_path / "task.json"
+    assert write_if_changed(path, "{}")
+    os.utime(path, ns=(0, 0))
+
+    assert not write_if_changed(path, "{}")
+    assert path.stat().st_mtime_ns == 0
+    assert write_if_changed(path, '{"a": 1}')
@@ -0,0 +1,77 @@
+import tarfile
+
+import pytest
+
+from dataset_pack import INDEX_NAME, PackedDataset, pack_dp_folders
+
+
+@pytest.fixture
+def dp_folders(tmp_path):
+    folders = []
+    for idx in range(5):
+        dp_folder = tmp_path / "dataset" / str(idx)
+        dp_folder.mkdir(parents=True)
+        (dp_folder / "task.json").write_text(f'{{"id": {idx}}}')
+        (dp_folder / "plot.png").write_bytes(bytes([idx]) * 1000 * (idx + 1))
+        folders.append(dp_folder)
+    return folders
+
+
+def test_random_access(dp_folders, tmp_path):
+    pack_dp_folders(dp_folders, tmp_path / "packed", shard_size=4000)
+
+    with PackedDataset(tmp_path / "packed") as packed:
+        assert len(packed.shards) > 1
+        assert packed.ids() == [0, 1, 2, 3, 4]
+        assert packed.file_names(3) == ["plot.png", "task.json"]
+        files = packed.read(3)
+        assert files["task.json"] == b'{"id": 3}'
+        assert files["plot.png"] == bytes([3]) * 4000
+        assert packed.read_file(1, "task.json") == b'{"id": 1}'
+        with pytest.raises(KeyError):
+            packed.read_file(1, "data.csv")
+
+
+def test_stream_in_shard_order(dp_folders, tmp_path):
+    pack_dp_folders(dp_folders, tmp_path / "packed", shard_size=4000)
+
+    with PackedDataset(tmp_path / "packed") as packed:
+        streamed = list(packed.stream())
+        assert [dp_id for dp_id, _ in streamed] == [0, 1, 2, 3, 4]
+        assert all(files == packed.read(dp_id) for dp_id, files in streamed)
+
+
+def test_shards_are_plain_tar(dp_folders, tmp_path):
+    # hardlinked plots are stored as regular files
+    (dp_folders[1] / "copy.png").hardlink_to(dp_folders[1] / "plot.png")
+    pack_dp_folders(dp_folders, tmp_path / "packed")
+
+    with tarfile.open(tmp_path / "packed" / "shard-00000.tar") as tar:
+        members = tar.getmembers()
+    assert all(member.isfile() for member in members)
+    assert len(members) == 11
+
+
+def test_stale_shards_are_removed(dp_folders, tmp_path):
+    pack_dp_folders(dp_folders, tmp_path / "packed", shard_size=4000)
+    pack_dp_folders(dp_folders[:2], tmp_path / "packed")
+
+    names = sorted(path.name for path in (tmp_path / "packed").iterdir())
+    assert names == [INDEX_NAME, "shard-00000.tar"]
+    assert PackedDataset(tmp_path / "packed").ids() == [0, 1]
+
+
+def test_update_keeps_other_datapoints(dp_folders, tmp_path):
+    pack_dp_folders(dp_folders, tmp_path / "packed", shard_size=4000)
+    (dp_folders[1] / "task.json").write_text('{"id": "new"}')
+    pack_dp_folders(dp_folders[:2], tmp_path / "packed", update=True)
+
+    with PackedDataset(tmp_path / "packed") as packed:
+        assert packed.ids() == [0, 1, 2, 3, 4]
+        assert packed.read_file(1, "task.json") == b'{"id": "new"}'
+        assert packed.read_file(4, "plot.png") == bytes([4]) * 5000
+        streamed = list(packed.stream())
+        assert sorted(dp_id for dp_id, _ in streamed) == [0, 1, 2, 3, 4]
+        assert all(files == packed.read(dp_id) for dp_id, files in streamed)
+    # the first shard held only datapoints 0 and 1
+    assert not (tmp_path / "packed" / "shard-00000.tar").exists()
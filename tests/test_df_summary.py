@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+from df_summary import (
+    SummaryCache,
+    read_csv_table,
+    sample_indices,
+    summarize_csv,
+    summarize_dataframe,
+    summarize_table,
+)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    df = pd.DataFrame(
+        {
+            "x": range(2000),
+            "y": [None if i % 4 == 0 else i * 0.5 for i in range(2000)],
+            "name": ["a", "b", "b", "c"] * 500,
+        }
+    )
+    df.to_csv(tmp_path / "data.csv", index=False)
+    return tmp_path / "data.csv"
+
+
+def stats_line(summary, column):
+    return next(line for line in summary.splitlines() if line.startswith(column + " "))
+
+
+def test_summary_of_small_file(csv_path):
+    summary = summarize_csv(csv_path)
+
+    assert summary.startswith("Dataframe shape: 2000 rows x 3 columns\n")
+    assert "min 0, max 1999" in stats_line(summary, "x")
+    assert stats_line(summary, "y").split()[2] == "1500"
+    assert "top: b (1000), a (500), c (500)" in stats_line(summary, "name")
+    assert "Rows (10 of 2000)" in summary
+
+
+def test_streamed_file_has_exact_counts(csv_path):
+    table, num_rows, exact = read_csv_table(csv_path, max_bytes=0, sample_rows=100)
+    summary = summarize_table(table, num_rows, exact=exact)
+
+    assert num_rows == 2000
+    assert table.num_rows < 500
+    assert [stats["nulls"] for stats in exact] == [0, 500, 0]
+    assert "sampled rows" in summary
+    assert "min 0, max 1999" in stats_line(summary, "x")
+    assert "min 0.5, max 999.5" in stats_line(summary, "y")
+    assert stats_line(summary, "y").split()[2] == "1500"
+
+
+def test_rows_fit_in_description(csv_path):
+    summary = summarize_csv(csv_path, max_chars=600)
+
+    assert len(summary) <= 600
+    assert "Rows (" in summary
+    assert sample_indices(10, 4) == [0, 3, 6, 9]
+
+
+def test_dataframe_summary_has_csv_format(csv_path):
+    df = pd.read_csv(csv_path)
+    assert summarize_dataframe(df) == summarize_csv(csv_path)
+
+    # mixed types and a set index
+    mixed = pd.DataFrame({"value": [1, "two", None]}, index=pd.Index(["p", "q", "r"], name="key"))
+    summary = summarize_dataframe(mixed)
+    assert summary.startswith("Dataframe shape: 3 rows x 2 columns")
+    assert "key " in summary and "top: 1 (1), two (1)" in summary
+
+
+def test_cache_by_content(csv_path, tmp_path):
+    cache = SummaryCache(tmp_path / "cache")
+    summarize_csv(csv_path, cache)
+    [cached] = (tmp_path / "cache").glob("*/*.txt")
+
+    # unchanged files are not parsed again
+    cached.write_text("cached summary")
+    assert summarize_csv(csv_path, cache) == "cached summary"
+
+    csv_path.write_text("x\n1\n")
+    assert summarize_csv(csv_path, cache).startswith("Dataframe shape: 1 rows")
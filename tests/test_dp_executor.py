@@ -0,0 +1,37 @@
+import os
+from functools import partial
+
+import pytest
+
+from dp_executor import dp_map
+
+
+def read_value(dp_folder, scale=1):
+    # folders are absolute and the working directory is left alone
+    assert dp_folder.is_absolute()
+    return int((dp_folder / "value.txt").read_text()) * scale
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for idx in range(6):
+        os.mkdir(tmp_path / str(idx))
+        if idx != 3:
+            (tmp_path / str(idx) / "value.txt").write_text(str(idx))
+    return [str(idx) for idx in range(6)]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_results_in_order_with_errors(folders, tmp_path, workers, capsys):
+    results = dp_map(partial(read_value, scale=10), folders, workers, "read")
+
+    assert [result.dp_folder for result in results] == [tmp_path / f for f in folders]
+    assert [result.value for result in results] == [0, 10, 20, None, 40, 50]
+    assert [result.ok for result in results] == [True, True, True, False, True, True]
+    assert "FileNotFoundError" in results[3].error
+    assert "dp 3: FileNotFoundError" in capsys.readouterr().out
+
+
+def test_no_folders():
+    assert dp_map(read_value, []) == []
@@ -0,0 +1,79 @@
+import asyncio
+
+
+def collect(async_iterator) -> list:
+    async def run():
+        return [item async for item in async_iterator]
+
+    return asyncio.run(run())
+
+
+def test_make_requests_many_bounds_concurrency(chat_stub, make_gpt4v):
+    chat_stub.delay = 0.05
+    gpt4v = make_gpt4v()
+    items = [{"id": i, "request": f"request {i}"} for i in range(12)]
+
+    responses = collect(gpt4v.make_requests_many(items, max_concurrency=3))
+
+    assert sorted(response["id"] for response in responses) == list(range(12))
+    assert all(response["response"] == chat_stub.text for response in responses)
+    assert chat_stub.peak <= 3
+
+
+def test_make_requests_many_retries_failed_requests(chat_stub, make_gpt4v):
+    chat_stub.statuses = [500]
+    gpt4v = make_gpt4v()
+
+    responses = collect(gpt4v.make_requests_many([{"id": 7, "request": "request"}]))
+
+    assert len(chat_stub.requests) == 2
+    assert responses[0]["id"] == 7 and "error" not in responses[0]
+
+
+def test_make_requests_many_yields_errors(chat_stub, make_gpt4v):
+    chat_stub.statuses = [500] * 10
+    gpt4v = make_gpt4v(attempts=2)
+
+    responses = collect(gpt4v.make_requests_many([{"id": 1, "request": "request"}]))
+
+    assert responses == [{"id": 1, "error": {"message": "status 500"}}]
+
+
+def test_make_requests_many_builds_payloads_on_demand(chat_stub, make_gpt4v):
+    chat_stub.delay = 0.02
+    gpt4v = make_gpt4v()
+    build_payload = gpt4v.build_payload
+    built = []
+
+    def counting_build_payload(**kwargs):
+        # requests the stub received before this payload was built
+        built.append(len(chat_stub.requests))
+        return build_payload(**kwargs)
+
+    gpt4v.build_payload = counting_build_payload
+    items = [{"id": i, "request": f"request {i}"} for i in range(20)]
+
+    responses = collect(gpt4v.make_requests_many(items, max_concurrency=4))
+
+    assert len(responses) == 20
+    assert all(built[i] >= i - 4 for i in range(20))
+
+
+def test_make_request_returns_none_on_timeouts(chat_stub, make_gpt4v):
+    from transport import HTTPTransport
+
+    chat_stub.delay = 0.5
+    gpt4v = make_gpt4v(attempts=2, transport=HTTPTransport(read_timeout=0.05))
+
+    assert gpt4v.make_request("request") is None
+    assert len(chat_stub.requests) == 2
+
+
+def test_make_request_retries_errors_without_retry_time(chat_stub, make_gpt4v):
+    chat_stub.statuses = [500]
+    gpt4v = make_gpt4v()
+
+    response = gpt4v.make_request("request")
+
+    assert response["response"] == chat_stub.text
+    assert len(chat_stub.requests) == 2
@@ -0,0 +1,60 @@
+import base64
+import io
+
+from PIL import Image
+
+from image_encoding import ImageEncoder, target_size
+
+
+def png_bytes(size=(1600, 1200), color=(200, 30, 30)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def decode(data_url: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(data_url.split(",", 1)[1])))
+
+
+def test_target_size():
+    assert target_size(1600, 1200, "low") == (512, 384)
+    assert target_size(1600, 1200, "high") == (1024, 768)
+    assert target_size(4096, 1024, "auto") == (2048, 512)
+    assert target_size(300, 200, "high") == (300, 200)
+
+
+def test_encode_downscales_and_memoizes(tmp_path):
+    path = tmp_path / "plot.png"
+    path.write_bytes(png_bytes())
+    encoder = ImageEncoder()
+
+    first = encoder.encode_path(path, "low")
+    second = encoder.encode_path(path, "low")
+
+    assert first == second
+    assert first.startswith("data:image/png;base64,")
+    assert decode(first).size == (512, 384)
+    assert (encoder.hits, encoder.misses) == (1, 1)
+
+
+def test_encode_changed_file_is_reencoded(tmp_path):
+    path = tmp_path / "plot.png"
+    path.write_bytes(png_bytes())
+    encoder = ImageEncoder()
+    first = encoder.encode_path(path, "low")
+
+    path.write_bytes(png_bytes(color=(0, 0, 255)))
+
+    assert encoder.encode_path(path, "low") != first
+    assert encoder.misses == 2
+
+
+def test_jpeg_transcoding_flattens_transparency():
+    out = io.BytesIO()
+    Image.new("RGBA", (1600, 1200), (0, 0, 0, 0)).save(out, format="PNG")
+    encoder = ImageEncoder(image_format="jpeg")
+
+    data_url = encoder.encode_bytes(out.getvalue(), "low")
+
+    assert data_url.startswith("data:image/jpeg;base64,")
+    assert decode(data_url).getpixel((50, 50)) == (255, 255, 255)
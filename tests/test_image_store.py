@@ -0,0 +1,73 @@
+import io
+import random
+
+from PIL import Image
+
+from image_store import ImageStore, dhash, find_near_duplicates, hamming, optimize_png
+
+
+def png_bytes(image, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", **kwargs)
+    return buffer.getvalue()
+
+
+def gradient(width=90, height=80, step=3):
+    image = Image.new("L", (width, height))
+    image.putdata([(x * step + y) % 256 for y in range(height) for x in range(width)])
+    return image
+
+
+def test_optimize_png_is_lossless():
+    image = gradient().convert("RGB")
+    data = png_bytes(image, compress_level=0)
+    optimized = optimize_png(data)
+
+    assert len(optimized) < len(data)
+    assert Image.open(io.BytesIO(optimized)).tobytes() == image.tobytes()
+    # already optimized images are kept
+    assert optimize_png(optimized) == optimized
+
+
+def test_dhash_of_similar_and_different_images():
+    image = gradient()
+    noisy = image.copy()
+    random.seed(0)
+    for _ in range(20):
+        xy = (random.randrange(90), random.randrange(80))
+        noisy.putpixel(xy, 255 - noisy.getpixel(xy))
+    flipped = image.transpose(Image.FLIP_LEFT_RIGHT)
+
+    assert hamming(dhash(png_bytes(image)), dhash(png_bytes(noisy))) <= 4
+    assert hamming(dhash(png_bytes(image)), dhash(png_bytes(flipped))) > 16
+
+
+def test_near_duplicate_groups():
+    hashes = {
+        "a": 0b1111,
+        "b": 0b1110,
+        # within 4 bits of b, not of a: grouped transitively
+        "c": 0b1110 ^ (0b1111 << 20),
+        "d": (1 << 64) - 1,
+    }
+
+    groups = find_near_duplicates(hashes, max_distance=4)
+
+    assert [sorted(group) for group in groups] == [["a", "b", "c"]]
+
+
+def test_write_shares_one_blob(tmp_path):
+    store = ImageStore(tmp_path / "store")
+    data = png_bytes(gradient(), compress_level=0)
+    for dp in ["1", "2"]:
+        (tmp_path / dp).mkdir()
+        record = store.write(data, tmp_path / dp / "plot.png")
+
+    first, second = (tmp_path / "1" / "plot.png").stat(), (tmp_path / "2" / "plot.png").stat()
+    assert first.st_ino == second.st_ino
+    assert record.size < record.original_size
+    assert (tmp_path / "1" / "plot.png").read_bytes() == store.blobs.get(record.ref)[:]
+
+    # ingesting the optimized bytes read back from a folder gives the same record
+    assert store.ingest_file(tmp_path / "2" / "plot.png") == record
+    assert list(store.records()) == [record.ref]
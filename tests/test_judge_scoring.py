@@ -0,0 +1,109 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+from judge_scoring import (
+    JudgeLogprobs,
+    aggregate_by_class,
+    fit_temperature,
+    load_judge_logprobs,
+    score_judgments,
+)
+
+VALUES = np.arange(11, dtype=float)
+
+
+def judgments(rows) -> JudgeLogprobs:
+    logprobs = np.full((len(rows), 11), -np.inf)
+    for i, row in enumerate(rows):
+        for score, logprob in row.items():
+            logprobs[i, score] = logprob
+    return JudgeLogprobs(np.arange(len(rows)), VALUES, logprobs)
+
+
+def test_load_judge_logprobs_merges_spaced_tokens(tmp_path):
+    top = [
+        {"token": "7", "logprob": math.log(0.5)},
+        {"token": " 7", "logprob": math.log(0.25)},
+        {"token": "x", "logprob": math.log(0.25)},
+    ]
+    entry = {"id": 4, "choices": [{"logprobs": {"content": [{"top_logprobs": top}]}}]}
+    path = tmp_path / "judge.jsonl"
+    path.write_text(json.dumps({"system prompt": "s"}) + "\n" + json.dumps(entry) + "\n")
+
+    loaded = load_judge_logprobs(path)
+
+    assert loaded.ids.tolist() == [4]
+    assert loaded.logprobs[0, 7] == pytest.approx(math.log(0.75))
+    assert np.isneginf(loaded.logprobs[0, 6])
+
+
+def test_score_judgments():
+    scores = score_judgments(judgments([{2: math.log(0.5), 4: math.log(0.5)}]))
+
+    assert scores["expected"][0] == pytest.approx(3.0)
+    assert scores["argmax"][0] == 2.0
+    assert scores["entropy"][0] == pytest.approx(math.log(2))
+    assert scores["coverage"][0] == pytest.approx(1.0)
+
+
+def test_rows_without_score_options_are_nan():
+    scores = score_judgments(judgments([{8: 0.0}, {}]))
+
+    assert scores["answered"].tolist() == [True, False]
+    assert scores["expected"][0] == 8.0
+    assert np.isnan(scores["expected"][1])
+    assert np.isnan(scores["argmax"][1])
+    assert np.isnan(scores["entropy"][1])
+
+
+def test_aggregate_by_class_skips_nan():
+    values = np.array([4.0, 6.0, np.nan, np.nan])
+    classes = np.array(["bar", "bar", "bar", "pie"])
+
+    aggregates = aggregate_by_class(values, classes)
+
+    assert aggregates["bar"] == {"count": 2, "mean": 5.0, "std": 1.0}
+    assert aggregates["pie"]["count"] == 0
+    assert math.isnan(aggregates["pie"]["mean"])
+
+
+def test_fit_temperature_flattens_overconfident_judge():
+    # the model is overconfident: reference scores are spread over 4 and 6
+    row = {5: math.log(0.9), 4: math.log(0.05), 6: math.log(0.05)}
+    data = judgments([row] * 4)
+    reference = np.array([4, 6, 4, 6])
+
+    assert fit_temperature(data, reference) > 1.0
+
+
+def test_fit_temperature_sharpens_underconfident_judge():
+    # the model is underconfident: every reference score is its top option
+    row = {5: math.log(0.5), 4: math.log(0.25), 6: math.log(0.25)}
+    data = judgments([row] * 4)
+    reference = np.array([5, 5, 5, 5])
+
+    assert fit_temperature(data, reference) < 1.0
+
+
+def test_fit_temperature_rejects_unknown_reference_scores():
+    row = {5: math.log(0.9), 4: math.log(0.05), 6: math.log(0.05)}
+
+    with pytest.raises(ValueError, match="not score options"):
+        fit_temperature(judgments([row, row]), np.array([5, 5.5]))
+    with pytest.raises(ValueError, match="not score options"):
+        fit_temperature(judgments([row]), np.array([11]))
+
+
+def test_fit_temperature_ignores_rows_without_reference_option():
+    row = {5: math.log(0.9), 4: math.log(0.05), 6: math.log(0.05)}
+    data = judgments([row, row, {}, {5: 0.0}])
+    reference = np.array([4, 6, 3, 7])
+
+    assert fit_temperature(data, reference) == fit_temperature(
+        judgments([row, row]), np.array([4, 6])
+    )
+    with pytest.raises(ValueError):
+        fit_temperature(judgments([{}]), np.array([3]))
@@ -0,0 +1,74 @@
+import nbformat
+import pytest
+
+pytest.importorskip("ipykernel")
+pytest.importorskip("nbclient")
+
+from kernel_pool import KernelPool, NotebookRun
+
+
+def write_notebook(path, *sources):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_code_cell(source) for source in sources]
+    nbformat.write(nb, str(path))
+    return path
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with KernelPool(size=1, timeout=60) as pool:
+        yield pool
+
+
+def test_runs_notebook_in_place(pool, tmp_path):
+    nb_path = write_notebook(tmp_path / "plot.ipynb", "print(1 + 1)")
+    [run] = pool.execute_many([nb_path])
+
+    assert run.status == "ok"
+    outputs = nbformat.read(str(nb_path), as_version=4).cells[0].outputs
+    assert outputs[0]["text"] == "2\n"
+
+
+def test_unreadable_notebooks_resolve(pool, tmp_path):
+    corrupt = tmp_path / "corrupt.ipynb"
+    corrupt.write_text("{not json")
+    missing = tmp_path / "missing.ipynb"
+    ok = write_notebook(tmp_path / "ok.ipynb", "x = 1")
+
+    runs = pool.execute_many([corrupt, missing, ok], timeout=30)
+
+    assert [run.status for run in runs] == ["error", "error", "ok"]
+    assert "FileNotFoundError" in runs[1].error
+
+
+def test_matplotlib_settings_are_reset(pool, tmp_path):
+    styled = write_notebook(
+        tmp_path / "styled.ipynb",
+        "import matplotlib.pyplot as plt\n"
+        "plt.style.use('ggplot')\n"
+        "plt.rcParams['lines.linewidth'] = 9",
+    )
+    check = write_notebook(
+        tmp_path / "check.ipynb",
+        "import matplotlib\n"
+        "print(matplotlib.rcParams['lines.linewidth'], matplotlib.rcParams['axes.facecolor'])",
+    )
+    pool.execute_many([styled])
+    pool.execute_many([check])
+
+    outputs = nbformat.read(str(check), as_version=4).cells[0].outputs
+    assert outputs[0]["text"] == "1.5 white\n"
+
+
+def test_failed_kernel_start_resolves_jobs(monkeypatch, tmp_path):
+    def fail(self):
+        raise RuntimeError("no kernel")
+
+    monkeypatch.setattr(KernelPool, "_start_kernel", fail)
+    nb_path = write_notebook(tmp_path / "plot.ipynb", "x = 1")
+    with KernelPool(size=2) as failing:
+        runs = failing.execute_many([nb_path, nb_path, nb_path])
+
+    assert all(isinstance(run, NotebookRun) for run in runs)
+    assert [run.status for run in runs] == ["error"] * 3
+    assert "no kernel" in runs[0].error
@@ -0,0 +1,91 @@
+import json
+
+import nbformat
+
+from nb_transform import (
+    DATA_STRING,
+    add_info_cell,
+    apply_transforms,
+    cut_to_plot_cell,
+    keep_plot_cell,
+    read_notebook,
+    split_data_cell,
+    transform_notebooks,
+    write_notebook,
+)
+
+
+def make_notebook(path, *sources):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_code_cell(source) for source in sources]
+    nb.cells[0].outputs = [
+        nbformat.v4.new_output("stream", name="stdout", text="line 1\nline 2\n"),
+        nbformat.v4.new_output(
+            "display_data", data={"text/plain": "<Figure>\nsize", "image/png": "iVBORw0KGgo="}
+        ),
+    ]
+    nb.cells.append(nbformat.v4.new_markdown_cell("# Title\ntext"))
+    nbformat.write(nb, str(path))
+    return path
+
+
+def test_round_trip_matches_nbformat(tmp_path):
+    path = make_notebook(tmp_path / "nb.ipynb", "import numpy\nx = 1\n", "print(x)")
+    original = path.read_bytes()
+
+    nb = read_notebook(path)
+    assert nb["cells"][0]["source"] == "import numpy\nx = 1\n"
+    assert nb["cells"][0]["outputs"][0]["text"] == "line 1\nline 2\n"
+    write_notebook(nb, path)
+
+    assert path.read_bytes() == original
+
+
+def test_written_notebook_is_valid(tmp_path):
+    path = make_notebook(tmp_path / "nb.ipynb", "x = 1")
+    apply_transforms(path, [split_data_cell])
+
+    nb = nbformat.read(str(path), as_version=4)
+    nbformat.validate(nb)
+    assert nb.cells[0].source == DATA_STRING
+    assert len({cell.id for cell in nb.cells}) == len(nb.cells)
+
+
+def test_pipeline_transforms(tmp_path):
+    (tmp_path / "info.json").write_text(json.dumps({"id": 7}))
+    path = make_notebook(
+        tmp_path / "nb.ipynb", "%matplotlib inline", "plt.plot(x)\nplt.savefig('a.png')"
+    )
+
+    timings = apply_transforms(path, [keep_plot_cell, add_info_cell])
+    nb = read_notebook(path)
+
+    assert [cell["source"] for cell in nb["cells"]] == ['INFO: {"id": 7}', "plt.plot(x)\nplt.show()"]
+    assert list(timings) == ["read", "keep_plot_cell", "add_info_cell", "write"]
+
+
+def test_cut_to_plot_cell(tmp_path):
+    path = make_notebook(tmp_path / "nb.ipynb", "load()", "plt.plot(df)")
+    out_path = tmp_path / "cut.ipynb"
+    apply_transforms(path, [cut_to_plot_cell], out_path)
+
+    [cell] = read_notebook(out_path)["cells"]
+    assert cell["source"] == DATA_STRING + "plt.plot(df)"
+    assert cell["outputs"] == []
+    assert len(read_notebook(path)["cells"]) == 3
+
+
+def test_failed_notebooks_are_not_written(tmp_path):
+    paths = [make_notebook(tmp_path / f"{i}.ipynb", "x = 1") for i in range(3)]
+    # add_info_cell fails without info.json
+    (tmp_path / "info.json").write_text("{}")
+    (tmp_path / "sub").mkdir()
+    paths[1] = make_notebook(tmp_path / "sub" / "1.ipynb", "x = 1")
+    before = paths[1].read_bytes()
+
+    results = transform_notebooks(paths, [add_info_cell], workers=2)
+
+    assert [result.error is None for result in results] == [True, False, True]
+    assert "FileNotFoundError" in results[1].error
+    assert paths[1].read_bytes() == before
+    assert read_notebook(paths[2])["cells"][0]["source"] == "INFO: {}"
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+from PIL import Image
+
+from plot_dataset import MANIFEST_NAME, DPRecord, PlotDataset, manifest_record
+
+CLASSES = ["bar"] * 6 + ["line"] * 3 + ["pie"]
+
+
+@pytest.fixture
+def dataset_folder(tmp_path):
+    records = []
+    for idx, plot_class in enumerate(CLASSES):
+        dp_folder = tmp_path / str(idx)
+        dp_folder.mkdir()
+        (dp_folder / "info.json").write_text(json.dumps({"plot_class": plot_class}))
+        (dp_folder / "plot.py").write_text(f"print({idx})")
+        (dp_folder / "task.json").write_text(json.dumps({"task": idx}))
+        Image.new("RGB", (600, 400)).save(dp_folder / "plot.png")
+        records.append(manifest_record(dp_folder))
+    with open(tmp_path / MANIFEST_NAME, "w") as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+    return tmp_path
+
+
+def test_lazy_datapoints(dataset_folder):
+    dataset = PlotDataset(dataset_folder)
+
+    assert len(dataset) == 10
+    dp = dataset[3]
+    assert dp.plot_class == "bar"
+    assert dp.code == "print(3)"
+    assert dp.task == {"task": 3}
+    assert dp.image_paths == [dataset_folder / "3" / "plot.png"]
+    assert dp.record.files["plot.py"] == len("print(3)")
+    # 600x400 takes two 512px tiles
+    assert dp.record.tokens["images"] == 85 + 170 * 2
+
+
+def test_filter_and_sample(dataset_folder):
+    dataset = PlotDataset(dataset_folder)
+
+    assert dataset.filter(plot_class=["line", "pie"]).ids == [6, 7, 8, 9]
+    assert dataset.filter(ids=[1, 7], predicate=lambda record: record.plot_class == "line").ids == [7]
+
+    sample = dataset.sample(5, seed=1)
+    assert len(sample) == 5
+    assert sample.plot_classes() == {"bar": 3, "line": 1, "pie": 1}
+    assert dataset.sample(5, seed=1).ids == sample.ids
+
+
+def test_missing_manifest_is_not_built(tmp_path):
+    (tmp_path / "4").mkdir()
+    for name in ["plot_10.png", "plot_2.png", "plot.png"]:
+        Image.new("RGB", (10, 10)).save(tmp_path / "4" / name)
+
+    dataset = PlotDataset(tmp_path, build=False)
+
+    assert len(dataset) == 0
+    assert not (tmp_path / MANIFEST_NAME).exists()
+    assert dataset.image_paths(4) == [
+        tmp_path / "4" / name for name in ["plot.png", "plot_2.png", "plot_10.png"]
+    ]
+
+
+def test_image_names_sort_numerically():
+    files = {name: 1 for name in ["plot_10.png", "task.json", "plot_2.png", "plot.png"]}
+    record = DPRecord(0, None, None, files, {})
+
+    assert record.image_names == ["plot.png", "plot_2.png", "plot_10.png"]
@@ -0,0 +1,50 @@
+import pytest
+
+from plot_renderer import PlotRenderer
+
+PLOT = "import matplotlib.pyplot as plt\nplt.plot([1, 2, 3])\n"
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    with PlotRenderer(workers=1, timeout=30, preload=["matplotlib.pyplot"]) as renderer:
+        yield renderer
+
+
+def test_renders_open_figures(renderer, tmp_path):
+    (tmp_path / "data.txt").write_text("42")
+    code = PLOT + "print(open('data.txt').read())\nplt.figure()\nplt.bar([1], [2])\n"
+    [result] = renderer.render_many([(code, tmp_path)])
+
+    assert result.error is None
+    assert result.stdout == "42\n"
+    assert len(result.images) == 2
+    assert all(image.startswith(b"\x89PNG") for image in result.images)
+
+
+def test_script_errors_and_timeouts():
+    with PlotRenderer(workers=1, timeout=0.5, preload=["matplotlib.pyplot"]) as renderer:
+        error, timeout = renderer.render_many([("1 / 0", None), ("while True: pass", None)])
+
+    assert "ZeroDivisionError" in error.error
+    assert error.images == []
+    assert timeout.error == "Timeout"
+
+
+def test_matplotlib_state_does_not_leak(renderer):
+    styled = "import matplotlib.pyplot as plt\nplt.style.use('ggplot')\nplt.rcParams['lines.linewidth'] = 9\nplt.figure()\n"
+    check = "import matplotlib\nprint(matplotlib.rcParams['lines.linewidth'], matplotlib.rcParams['axes.facecolor'])\n"
+    renderer.render_many([(styled, None)])
+    [result] = renderer.render_many([(check, None)])
+
+    assert result.stdout == "1.5 white\n"
+    assert result.images == []
+
+
+def test_dead_worker_fails_only_its_job():
+    crash = "import os\nos._exit(1)\n"
+    with PlotRenderer(workers=2, timeout=30, preload=["matplotlib.pyplot"]) as renderer:
+        results = renderer.render_many([(PLOT, None), (crash, None), (PLOT, None), (PLOT, None)])
+
+    assert [result.error for result in results] == [None, "Renderer worker died", None, None]
+    assert all(len(results[i].images) == 1 for i in [0, 2, 3])
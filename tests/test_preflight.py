@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+from PIL import Image
+
+from preflight import (
+    TPMScheduler,
+    dry_run_report,
+    estimate_messages,
+    estimate_request,
+    image_tokens,
+    order_by_tokens,
+)
+
+
+class WordTokenizer:
+    def encode(self, text: str) -> list:
+        return text.split()
+
+
+def test_image_tokens():
+    assert image_tokens(4000, 4000, "low") == 85
+    # 768x768 after resizing: 2x2 tiles
+    assert image_tokens(1024, 1024, "high") == 85 + 170 * 4
+    assert image_tokens(1024, 1024, "auto") == image_tokens(1024, 1024, "high")
+
+
+def test_estimate_request_counts_text_and_images(tmp_path):
+    image_path = tmp_path / "plot.png"
+    Image.new("RGB", (100, 100)).save(image_path)
+    item = {"id": 3, "request": "draw a plot", "images": [image_path], "image_detail": "low"}
+
+    estimate = estimate_request(WordTokenizer(), item, "be helpful", output_tokens=10)
+
+    # 5 words, 2 messages with 3 tokens each and 3 reply priming tokens
+    assert estimate.prompt_tokens == 5 + 6 + 3
+    assert estimate.image_tokens == 85
+    assert estimate.total_tokens == 14 + 85 + 10
+
+
+def test_estimate_messages():
+    messages = [{"role": "system", "content": "a b"}, {"role": "user", "content": "c"}]
+
+    estimate = estimate_messages(WordTokenizer(), 1, messages, output_tokens=5)
+
+    assert (estimate.prompt_tokens, estimate.image_tokens) == (3 + 6 + 3, 0)
+
+
+def test_dry_run_report_cost_and_wall_time():
+    messages = [{"role": "user", "content": "word " * 994}]
+    estimates = [estimate_messages(WordTokenizer(), i, messages, 0) for i in range(10)]
+
+    report = dry_run_report("step", estimates, "gpt-4-turbo", tpm=10000, rpm=1000, headroom=1.0)
+    batch_report = dry_run_report("step", estimates, "gpt-4-turbo", 10000, 1000, 1.0, batch=True)
+
+    assert report["total_tokens"] == 10000
+    assert report["cost_usd"] == 0.1
+    assert batch_report["cost_usd"] == 0.05
+    assert report["wall_time_s"] == 60.0
+
+
+def test_order_by_tokens():
+    items = [{"id": 1, "tokens": 5}, {"id": 2, "tokens": 50}, {"id": 3}]
+    assert [item["id"] for item in order_by_tokens(items)] == [2, 1, 3]
+
+
+def test_scheduler_waits_for_window():
+    scheduler = TPMScheduler(tpm=100, rpm=100, headroom=1.0, window=0.2)
+
+    async def run():
+        start = time.monotonic()
+        await scheduler.acquire(60)
+        await scheduler.acquire(60)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) == pytest.approx(0.2, abs=0.1)
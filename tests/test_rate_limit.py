@@ -0,0 +1,57 @@
+import asyncio
+
+from rate_limit import AdaptiveLimiter, parse_reset_time
+
+
+def test_parse_reset_time():
+    assert parse_reset_time("20ms") == 0.02
+    assert parse_reset_time("1s") == 1.0
+    assert parse_reset_time("6m0s") == 360.0
+    assert parse_reset_time("1.5") == 1.5
+    assert parse_reset_time("soon") is None
+    assert parse_reset_time(None) is None
+
+
+def test_limiter_halves_on_429_and_grows_back():
+    async def run():
+        limiter = AdaptiveLimiter(max_concurrency=8, default_wait=0.0)
+        await limiter.acquire()
+        await limiter.release(429, {"retry-after": "0"})
+        assert limiter.limit == 4
+        await limiter.acquire()
+        await limiter.release(200, {})
+        assert limiter.limit == 5
+
+    asyncio.run(run())
+
+
+def test_limiter_shrinks_on_low_budget():
+    async def run():
+        limiter = AdaptiveLimiter(max_concurrency=8)
+        headers = {"x-ratelimit-remaining-requests": "5", "x-ratelimit-limit-requests": "100"}
+        await limiter.acquire()
+        await limiter.release(200, headers)
+        assert limiter.limit == 7
+
+    asyncio.run(run())
+
+
+def test_limiter_bounds_in_flight():
+    async def run():
+        limiter = AdaptiveLimiter(max_concurrency=2)
+        peak = in_flight = 0
+
+        async def job():
+            nonlocal peak, in_flight
+            await limiter.acquire()
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            # no status: the limit is kept as is
+            await limiter.release()
+
+        await asyncio.gather(*(job() for _ in range(10)))
+        return peak
+
+    assert asyncio.run(run()) == 2
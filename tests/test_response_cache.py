@@ -0,0 +1,50 @@
+import time
+
+from response_cache import ResponseCache
+
+
+def test_make_key_is_stable_and_order_independent():
+    assert ResponseCache.make_key({"a": 1, "b": 2}) == ResponseCache.make_key({"b": 2, "a": 1})
+    assert ResponseCache.make_key("model", [1]) != ResponseCache.make_key("model", [2])
+
+
+def test_get_put_and_persistence(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    assert cache.get("key") is None
+    cache.put("key", {"response": "text"})
+    assert cache.get("key") == {"response": "text"}
+    cache.close()
+
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    assert cache.get("key") == {"response": "text"}
+    assert cache.stats()["entries"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_age_days=1 / 86400)
+    cache.put("key", {"response": "text"})
+    time.sleep(1.1)
+    assert cache.get("key") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    value = {"response": "x" * 1000}
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_size_mb=2500 / 1024 / 1024)
+    cache.put("old", value)
+    cache.put("used", value)
+    cache.get("used")
+    cache.put("new", value)
+    cache.evict()
+
+    assert cache.get("old") is None
+    assert cache.get("used") == value
+    assert cache.get("new") == value
+
+
+def test_gpt4v_answers_repeated_request_from_cache(tmp_path, chat_stub, make_gpt4v):
+    gpt4v = make_gpt4v(cache=ResponseCache(tmp_path / "cache.sqlite"))
+    first = gpt4v.make_request("request")
+    second = gpt4v.make_request("request")
+
+    assert first["response"] == second["response"] == chat_stub.text
+    assert len(chat_stub.requests) == 1
@@ -0,0 +1,99 @@
+import json
+import pickle
+
+from result_store import ResultStore
+
+
+def test_upsert_and_lookup(tmp_path):
+    store = ResultStore(tmp_path / "results.jsonl")
+    store.append({"system prompt": "s"})
+    store.upsert({"id": 1, "response": "first"})
+    store.upsert({"id": 2, "response": "second"})
+    store.upsert({"id": 1, "response": "replaced"})
+
+    assert sorted(store) == [1, 2]
+    assert store[1]["response"] == "replaced"
+    assert 3 not in store
+
+
+def test_index_is_reused_and_extended(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with ResultStore(path) as store:
+        store.upsert({"id": 1, "response": "a"})
+    # appended by another writer after the index was saved
+    with open(path, "a") as f:
+        f.write(json.dumps({"id": 2, "response": "b"}) + "\n")
+
+    store = ResultStore(path)
+
+    assert store[1]["response"] == "a"
+    assert store[2]["response"] == "b"
+
+
+def test_rewritten_file_of_same_size_drops_index(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with ResultStore(path) as store:
+        store.upsert({"id": 1, "response": "a"})
+        store.upsert({"id": 2, "response": "b"})
+
+    # same size, ids swapped, written in place
+    with open(path, "r+") as f:
+        f.write(json.dumps({"id": 2, "response": "b"}) + "\n")
+        f.write(json.dumps({"id": 1, "response": "a"}) + "\n")
+
+    store = ResultStore(path)
+
+    assert store[1] == {"id": 1, "response": "a"}
+    assert store[2] == {"id": 2, "response": "b"}
+
+
+def test_replaced_file_drops_index(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with ResultStore(path) as store:
+        store.upsert({"id": 1, "response": "a"})
+    replacement = tmp_path / "new.jsonl"
+    replacement.write_text(json.dumps({"id": 7, "response": "x"}) + "\n")
+    replacement.replace(path)
+
+    assert list(ResultStore(path)) == [7]
+
+
+def test_torn_last_line_is_terminated(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text(json.dumps({"id": 1}) + "\n" + '{"id": 2, "resp')
+
+    store = ResultStore(path)
+    assert list(store) == [1]
+    store.upsert({"id": 3})
+
+    assert sorted(ResultStore(path)) == [1, 3]
+
+
+def test_compact_keeps_latest_entries(tmp_path):
+    path = tmp_path / "results.jsonl"
+    store = ResultStore(path)
+    store.append({"system prompt": "s"})
+    for i in range(3):
+        store.upsert({"id": 1, "version": i})
+    store.compact()
+
+    assert len(path.read_text().splitlines()) == 2
+    assert store[1]["version"] == 2
+    assert ResultStore(path)[1]["version"] == 2
+
+
+def test_pickled_store_reads_in_copy(tmp_path):
+    store = ResultStore(tmp_path / "results.jsonl")
+    store.upsert({"id": 1})
+    store[1]
+
+    copy = pickle.loads(pickle.dumps(store))
+
+    assert copy[1] == {"id": 1}
+
+
+def test_save_index_without_file(tmp_path):
+    store = ResultStore(tmp_path / "results.jsonl")
+    store.save_index()
+
+    assert not (tmp_path / "results.jsonl.idx").exists()
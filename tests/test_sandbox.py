@@ -0,0 +1,50 @@
+import pytest
+
+from sandbox import SandboxLimits, run_code_sandboxed, run_sandboxed
+
+
+def test_relative_script_and_cwd(tmp_path, monkeypatch):
+    dp_folder = tmp_path / "dp"
+    dp_folder.mkdir()
+    (dp_folder / "data.csv").write_text("a\n1\n")
+    (dp_folder / "script.py").write_text("print(open('data.csv').read().split()[1])")
+    monkeypatch.chdir(tmp_path)
+
+    result = run_sandboxed("dp/script.py", cwd="dp")
+
+    assert result.status == "ok", result.stderr
+    assert result.stdout == "1\n"
+
+
+def test_code_in_relative_folder(tmp_path, monkeypatch):
+    (tmp_path / "dp").mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    result = run_code_sandboxed("import os\nprint(os.path.basename(os.getcwd()))", "dp")
+
+    assert result.status == "ok", result.stderr
+    assert result.stdout == "dp\n"
+    assert list((tmp_path / "dp").iterdir()) == []
+
+
+@pytest.mark.parametrize(
+    "code, status",
+    [
+        ("raise ValueError('bad')", "exception"),
+        ("import time\ntime.sleep(10)", "timeout"),
+        ("x = bytearray(2 ** 31)", "oom"),
+    ],
+)
+def test_failure_status(tmp_path, code, status):
+    limits = SandboxLimits(memory_mb=512, wall_timeout=1)
+    result = run_code_sandboxed(code, tmp_path, limits)
+
+    assert result.status == status
+
+
+def test_network_is_denied(tmp_path):
+    code = "import socket\nsocket.create_connection(('127.0.0.1', 9))"
+    result = run_code_sandboxed(code, tmp_path)
+
+    assert result.status == "exception"
+    assert "Network access is disabled" in result.stderr
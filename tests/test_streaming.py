@@ -0,0 +1,93 @@
+from openai_backbone import OpenAIBackbone
+from response_cache import ResponseCache
+from streaming import (
+    StreamAccumulator,
+    code_blocks_validator,
+    parse_sse_line,
+    task_prefix_validator,
+)
+from transport import HTTPTransport
+
+
+def content_event(text: str, finish_reason=None) -> dict:
+    delta = {"content": text} if text else {}
+    return {"model": "m", "choices": [{"delta": delta, "finish_reason": finish_reason}]}
+
+
+def test_parse_sse_line():
+    assert parse_sse_line('data: {"a": 1}') == {"a": 1}
+    assert parse_sse_line("data: [DONE]") == {}
+    assert parse_sse_line(": keep-alive") is None
+
+
+def test_validators():
+    assert task_prefix_validator("TA", False) is None
+    assert task_prefix_validator("TASK: draw", False) is None
+    assert task_prefix_validator("Sure, here", False) is not None
+
+    validate = code_blocks_validator(min_blocks=2, max_chars_before_fence=10)
+    assert validate("x" * 11, False) is not None
+    assert validate("```a```", True) is not None
+    assert validate("```a``` ```b```", True) is None
+
+
+def test_accumulator_collects_text_and_usage():
+    accumulator = StreamAccumulator()
+    for part in ["TASK:", " draw", " a plot"]:
+        accumulator.feed(content_event(part))
+    accumulator.feed(content_event("", "stop"))
+    accumulator.feed({"choices": [], "usage": {"completion_tokens": 3}})
+    accumulator.finish()
+
+    response = accumulator.response()
+    assert response["choices"][0]["message"]["content"] == "TASK: draw a plot"
+    assert response["choices"][0]["finish_reason"] == "stop"
+    assert response["stream_metrics"]["completion_tokens"] == 3
+
+
+def test_accumulator_aborts_on_format_failure():
+    accumulator = StreamAccumulator(task_prefix_validator)
+    assert accumulator.feed(content_event("Sure! ")) is not None
+    accumulator.finish(aborted=True)
+
+    response = accumulator.response()
+    assert response["error"]["type"] == "stream_format"
+    assert response["partial"] == "Sure! "
+
+
+def test_accumulator_validates_only_grown_text():
+    calls = []
+
+    def validator(text, done):
+        calls.append(text)
+
+    accumulator = StreamAccumulator(validator)
+    accumulator.feed(content_event("a"))
+    accumulator.feed({"choices": [], "usage": {"completion_tokens": 1}})
+    accumulator.feed(content_event("b"))
+
+    assert calls == ["a", "ab"]
+
+
+def test_gpt4v_ask_stream(chat_stub, make_gpt4v):
+    response = make_gpt4v().make_request_stream("request", validator=task_prefix_validator)
+
+    assert response["response"].strip() == chat_stub.text
+    assert chat_stub.requests[0]["stream"] is True
+
+
+def test_openai_cache_keeps_stream_and_plain_entries_apart(tmp_path, chat_stub, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", chat_stub.url)
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    chat = OpenAIBackbone("gpt-4", api_key="test", cache=cache, transport=HTTPTransport())
+    messages = [{"role": "user", "content": "split the code"}]
+
+    plain = chat.generate_msg(messages)
+    streamed = chat.generate_msg_stream(messages)
+    # both are answered from the cache now
+    assert chat.generate_msg(messages)["prediction"] == plain["prediction"]
+    assert chat.generate_msg_stream(messages)["prediction"] == streamed["prediction"]
+
+    assert plain["prediction"] == chat_stub.text
+    assert streamed["prediction"].strip() == chat_stub.text
+    assert len(chat_stub.requests) == 2
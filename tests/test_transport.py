@@ -0,0 +1,64 @@
+import asyncio
+
+from transport import HTTPTransport, RequestTiming
+
+
+def test_records_timings_from_trace_events(chat_stub):
+    transport = HTTPTransport()
+    response = transport.client.post(f"{chat_stub.url}/chat/completions", json={"model": "m"})
+
+    assert response.status_code == 200
+    timing = transport.timings[-1]
+    assert timing.status_code == 200
+    assert timing.connect is not None
+    assert 0 < timing.ttfb <= timing.total
+
+
+def test_timing_summary_p95():
+    transport = HTTPTransport()
+    for i in range(1, 21):
+        transport.timings.append(RequestTiming("POST", "url", 200, None, None, None, float(i)))
+
+    summary = transport.timing_summary()["total"]
+    assert summary["p95"] == 19.0
+    assert summary["median"] == 10.5
+
+
+def test_async_session_keeps_client_until_last_user():
+    transport = HTTPTransport()
+
+    async def run():
+        async with transport.async_session() as first:
+            async with transport.async_session() as second:
+                assert first is second
+            assert not first.is_closed
+        assert first.is_closed
+        assert transport._async_clients == {}
+
+    asyncio.run(run())
+
+
+def test_concurrent_make_requests_many_share_transport(chat_stub, make_gpt4v):
+    transport = HTTPTransport()
+    fast = make_gpt4v(transport=transport)
+    slow = make_gpt4v(transport=transport)
+
+    async def run():
+        async def collect(gpt4v, items):
+            return [response async for response in gpt4v.make_requests_many(items)]
+
+        slow_task = asyncio.create_task(
+            collect(slow, [{"id": i, "request": f"slow {i}"} for i in range(20)])
+        )
+        await asyncio.sleep(0)
+        fast_responses = await collect(fast, [{"id": 0, "request": "fast"}])
+        return fast_responses, await slow_task
+
+    chat_stub.delay = 0.02
+    fast_responses, slow_responses = asyncio.run(run())
+
+    assert "error" not in fast_responses[0]
+    assert all("error" not in response for response in slow_responses)
+    assert len(slow_responses) == 20
+    # no request had to be retried
+    assert len(chat_stub.requests) == 21
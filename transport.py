@@ -0,0 +1,243 @@
+import asyncio
+import contextlib
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict
+
+import httpx
+
+
+@dataclass
+class RequestTiming:
+    method: str
+    url: str
+    status_code: int | None
+    # connect (DNS lookup and TCP handshake) is None when the request reused a keep-alive connection
+    connect: float | None
+    tls: float | None
+    ttfb: float | None
+    total: float
+
+
+def _phase(events: dict, name: str) -> float | None:
+    started = events.get(f"{name}.started")
+    complete = events.get(f"{name}.complete")
+    if started is None or complete is None:
+        return None
+    return complete - started
+
+
+class HTTPTransport:
+    """
+    Shared HTTP transport for LLM backends.
+    Keeps a keep-alive connection pool (sync and async), applies connect/read timeouts,
+    optionally speaks HTTP/2 and records per-request timings (connect/TLS/TTFB/total) from httpcore trace events.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+        max_connections: int = 64,
+        max_keepalive_connections: int = 32,
+        keepalive_expiry: float = 60.0,
+        http2: bool = False,
+        keep_timings: int = 10000,
+    ) -> None:
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.timings: deque[RequestTiming] = deque(maxlen=keep_timings)
+
+        self._client: httpx.Client | None = None
+        # async clients are bound to an event loop: one client and its number of sessions per loop
+        self._async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self._async_sessions: Dict[asyncio.AbstractEventLoop, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    transport=httpx.HTTPTransport(http2=self.http2, limits=self.limits),
+                    timeout=self.timeout,
+                    event_hooks={"request": [self._on_request]},
+                )
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """
+        Async client of the running event loop, use it inside async_session()
+        """
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_clients:
+                self._async_clients[loop] = httpx.AsyncClient(
+                    transport=httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits),
+                    timeout=self.timeout,
+                    event_hooks={"request": [self._on_request_async]},
+                )
+            return self._async_clients[loop]
+
+    @contextlib.asynccontextmanager
+    async def async_session(self) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        Use of the async client by one caller. Concurrent sessions in a loop share the client,
+        it is closed when the last of them ends, so no caller closes it under another one
+        """
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._async_sessions[loop] = self._async_sessions.get(loop, 0) + 1
+        try:
+            yield self.async_client
+        finally:
+            with self._lock:
+                self._async_sessions[loop] -= 1
+                last = self._async_sessions[loop] == 0
+                if last:
+                    del self._async_sessions[loop]
+                    client = self._async_clients.pop(loop, None)
+            if last and client is not None:
+                await client.aclose()
+
+    def _start_timing(self, request: httpx.Request) -> dict:
+        timing = {
+            "method": request.method,
+            "url": str(request.url),
+            "start": time.perf_counter(),
+            "events": {},
+        }
+        return timing
+
+    def _on_request(self, request: httpx.Request) -> None:
+        timing = self._start_timing(request)
+
+        def trace(event_name: str, info: dict) -> None:
+            self._trace_event(timing, event_name, info)
+
+        request.extensions["trace"] = trace
+
+    async def _on_request_async(self, request: httpx.Request) -> None:
+        timing = self._start_timing(request)
+
+        async def trace(event_name: str, info: dict) -> None:
+            self._trace_event(timing, event_name, info)
+
+        request.extensions["trace"] = trace
+
+    def _trace_event(self, timing: dict, event_name: str, info: dict) -> None:
+        now = time.perf_counter()
+        # "connection.connect_tcp.started" -> "connect_tcp.started"
+        short_name = event_name.split(".", 1)[1]
+        timing["events"][short_name] = now
+
+        if short_name == "receive_response_headers.complete":
+            return_value = info.get("return_value")
+            if return_value is not None:
+                # HTTP/1.1 returns (version, status, ...), HTTP/2 returns (status, headers)
+                status_index = 0 if isinstance(return_value[0], int) else 1
+                timing["status_code"] = return_value[status_index]
+
+        if short_name == "response_closed.complete":
+            self.timings.append(self._finalize(timing, now))
+
+    @staticmethod
+    def _finalize(timing: dict, now: float) -> RequestTiming:
+        events = timing["events"]
+        start = timing["start"]
+        connect = _phase(events, "connect_tcp")
+        headers_received = events.get("receive_response_headers.complete")
+        body_received = events.get("receive_response_body.complete", now)
+
+        return RequestTiming(
+            method=timing["method"],
+            url=timing["url"],
+            status_code=timing.get("status_code"),
+            connect=connect,
+            tls=_phase(events, "start_tls"),
+            ttfb=None if headers_received is None else headers_received - start,
+            total=body_received - start,
+        )
+
+    def timing_summary(self) -> dict:
+        """
+        Median and 95th percentile of every timing phase over the recorded requests
+        """
+
+        summary = {"requests": len(self.timings)}
+        if not self.timings:
+            return summary
+
+        summary["new_connections"] = sum(t.connect is not None for t in self.timings)
+        for phase in ["connect", "tls", "ttfb", "total"]:
+            values = sorted(
+                getattr(t, phase) for t in self.timings if getattr(t, phase) is not None
+            )
+            if values:
+                summary[phase] = {
+                    "median": statistics.median(values),
+                    "p95": values[math.ceil(0.95 * len(values)) - 1],
+                }
+
+        return summary
+
+    def dump_timings(self) -> list[dict]:
+        return [asdict(timing) for timing in self.timings]
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """
+        Close the async client of the running loop regardless of open sessions
+        """
+
+        with self._lock:
+            self._async_sessions.pop(asyncio.get_running_loop(), None)
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_shared_transport: HTTPTransport | None = None
+
+
+def get_transport() -> HTTPTransport:
+    global _shared_transport
+    if _shared_transport is None:
+        _shared_transport = HTTPTransport()
+    return _shared_transport
+
+
+def configure_transport(config) -> HTTPTransport:
+    """
+    Replace the shared transport by the one built from config options
+    """
+
+    global _shared_transport
+    if _shared_transport is not None:
+        _shared_transport.close()
+
+    _shared_transport = HTTPTransport(
+        connect_timeout=config.get("http_connect_timeout", 10.0),
+        read_timeout=config.get("http_read_timeout", 120.0),
+        max_connections=config.get("http_max_connections", 64),
+        max_keepalive_connections=config.get("http_max_keepalive_connections", 32),
+        http2=config.get("http2", False),
+    )
+
+    return _shared_transport
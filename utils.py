@@ -1,8 +1,8 @@
 import json
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, Mapping
 
-import nbformat as nbf
+from result_store import ResultStore
 
 
 def save_jsonl(data, file_path: str | Path) -> None:
@@ -21,6 +21,8 @@ def read_jsonl(file_path: str | Path) -> List[Dict]:
 
 
 def read_nb_data_cell(nb_path: str | Path):
+    import nbformat as nbf
+
     with open(nb_path) as f:
         nb = nbf.read(f, as_version=4)
 
@@ -28,13 +30,24 @@ def read_nb_data_cell(nb_path: str | Path):
     return data_code
 
 
-def read_responses(file_path: str | Path, responses: List[Dict] | None = None) -> dict:
-    responses = read_jsonl(file_path)
+def read_responses(file_path: str | Path) -> Mapping:
+    """
+    Responses by id, entries are read from the file on access
+    """
+
+    if not Path(file_path).exists():
+        raise FileNotFoundError(file_path)
+
+    return ResultStore(file_path)
+
 
-    responses_dict = dict()
+def filter_dp_folders(dp_folders: List[Path], ids: Iterable[int] | None = None) -> List[Path]:
+    """
+    Keep only datapoint folders with given ids. None means all datapoints
+    """
 
-    for entry in responses:
-        if "id" in entry:
-            responses_dict[entry["id"]] = entry
+    if ids is None:
+        return dp_folders
 
-    return responses_dict
+    ids = set(ids)
+    return [dp_folder for dp_folder in dp_folders if int(dp_folder.name) in ids]
@@ -1,18 +1,15 @@
 import base64
-import glob
 import json
 import os
 import sys
 from pathlib import Path
 
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.shared import Inches
-from omegaconf import OmegaConf
+from omegaconf import DictConfig, OmegaConf
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(parent_dir)
-print(parent_dir)
+from blob_store import blob_store_from_config, is_blob_ref
+from plot_dataset import PlotDataset
 from utils import read_responses
 
 
@@ -27,86 +24,100 @@ def decode_image(encoded_image, output_image_file):
 """
 Just a script to generate a docx file to dump generated tasks and plots to verify them.
 """
-do_random = False
-# suffix = "_probs"
-suffix = ""
-if do_random and len(suffix) == 0:
-    suffix = "_random"
-
-# config_path = "../configs/config.yaml"
-config_path = "configs/config.yaml"
-config = OmegaConf.load(config_path)
-
-dataset_folder = Path(config.dataset_final)
-results_folder = Path(config.out_folder)
-temp_folder = results_folder / "temp"
-os.makedirs(temp_folder, exist_ok=True)
-bench_file = results_folder / f"benchmark_results.jsonl"
-response_file = results_folder / "gpt_plots_dev.jsonl"
-
-bench_scores = read_responses(bench_file)
-plot_responses = read_responses(response_file)
-
-temp_image_file = temp_folder / "plot.png"
-
-# list of strings
-ids = list(bench_scores.keys())
-
-doc = Document()
-section = doc.sections[0]
-new_width, new_height = section.page_height, section.page_width
-section.page_width = new_width
-section.page_height = new_height
-
-for idx in ids:
-    response = plot_responses[idx]
-    result = bench_scores[idx]
-
-    paragraph = doc.add_paragraph()
-    paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-    paragraph.add_run(f"ID = {idx}\n")
-    paragraph.add_run(f'Score = {result["score"]:.0f}\n')
-    if len(result["error"]) > 0 and not do_random:
-        paragraph.add_run(f'Error = {result["error"]}\n')
-
-    if not do_random:
-        dp_folder = dataset_folder / str(idx)
-    else:
-        if "id_rnd" in result:
-            rnd_idx = result["id_rnd"]
-        else:
-            rnd_idx = idx
-
-        dp_folder = dataset_folder / str(rnd_idx)
-        paragraph.add_run(f"RANDOM PAIR\n")
-
-    plot_files = glob.glob(os.path.join(str(dp_folder), "*.png"))
-    plot_file = plot_files[0]
-
-    if len(plot_files) > 1 and not do_random:
-        paragraph.add_run(
-            f"There should be {len(plot_files)} images in GT, used only one\n"
-        )
 
-    table = doc.add_table(rows=1, cols=2)
-    table.style = "Table Grid"
-
-    cell = table.cell(0, 0)
-    cell.text = "Generated"
-
-    if len(response["plot results"]["images"]) > 0:
-        decode_image(response["plot results"]["images"][0], temp_image_file)
 
+def bench_results_to_docx(config: DictConfig, do_random: bool = False) -> None:
+    from docx import Document
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+    from docx.shared import Inches
+
+    # suffix = "_probs"
+    suffix = ""
+    if do_random and len(suffix) == 0:
+        suffix = "_random"
+
+    dataset_folder = Path(config.dataset_final)
+    results_folder = Path(config.out_folder)
+    temp_folder = results_folder / "temp"
+    os.makedirs(temp_folder, exist_ok=True)
+    bench_file = results_folder / f"benchmark_results.jsonl"
+    response_file = results_folder / "gpt_plots_dev.jsonl"
+
+    blob_store = blob_store_from_config(config)
+    # a report does not build the manifest, datapoints missing in it are looked up in their folders
+    dataset = PlotDataset(dataset_folder, build=False)
+    bench_scores = read_responses(bench_file)
+    plot_responses = read_responses(response_file)
+
+    temp_image_file = temp_folder / "plot.png"
+
+    # list of strings
+    ids = list(bench_scores.keys())
+
+    doc = Document()
+    section = doc.sections[0]
+    new_width, new_height = section.page_height, section.page_width
+    section.page_width = new_width
+    section.page_height = new_height
+
+    for idx in ids:
+        response = plot_responses[idx]
+        result = bench_scores[idx]
+
+        paragraph = doc.add_paragraph()
+        paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+        paragraph.add_run(f"ID = {idx}\n")
+        paragraph.add_run(f'Score = {result["score"]:.0f}\n')
+        if len(result["error"]) > 0 and not do_random:
+            paragraph.add_run(f'Error = {result["error"]}\n')
+
+        if not do_random:
+            dp_folder = dataset_folder / str(idx)
+        else:
+            if "id_rnd" in result:
+                rnd_idx = result["id_rnd"]
+            else:
+                rnd_idx = idx
+
+            dp_folder = dataset_folder / str(rnd_idx)
+            paragraph.add_run(f"RANDOM PAIR\n")
+
+        plot_files = dataset.image_paths(int(dp_folder.name))
+        plot_file = str(plot_files[0])
+
+        if len(plot_files) > 1 and not do_random:
+            paragraph.add_run(
+                f"There should be {len(plot_files)} images in GT, used only one\n"
+            )
+
+        table = doc.add_table(rows=1, cols=2)
+        table.style = "Table Grid"
+
+        cell = table.cell(0, 0)
+        cell.text = "Generated"
+
+        if len(response["plot results"]["images"]) > 0:
+            image = response["plot results"]["images"][0]
+            if is_blob_ref(image):
+                image_file = blob_store.path(image)
+            else:
+                decode_image(image, temp_image_file)
+                image_file = temp_image_file
+
+            paragraph = cell.paragraphs[0]
+            run = paragraph.add_run()
+            run.add_picture(str(image_file), width=Inches(4))
+
+        cell = table.cell(0, 1)
+        cell.text = "Ground truth"
         paragraph = cell.paragraphs[0]
         run = paragraph.add_run()
-        run.add_picture(str(temp_image_file), width=Inches(4))
+        run.add_picture(plot_file, width=Inches(4))
+
+        doc.add_page_break()
 
-    cell = table.cell(0, 1)
-    cell.text = "Ground truth"
-    paragraph = cell.paragraphs[0]
-    run = paragraph.add_run()
-    run.add_picture(plot_file, width=Inches(4))
+    doc.save("out/bench_results.docx")
 
-    doc.add_page_break()
 
-doc.save("out/bench_results.docx")
+if __name__ == "__main__":
+    bench_results_to_docx(OmegaConf.load("configs/config.yaml"))